@@ -1,28 +1,16 @@
-import streamlit as st
 import os
-import tempfile
+import uuid
+import streamlit as st
 import logging
-import sys
-import pandas as pd
-from src.ocr import extract_text
-from src.nlp import structure_data
-from src.categorize import categorize_results
-from src.table_formatter import format_results_for_table
-from src.explain import explain_results_batch
-from src.summary import generate_summary_bullet_points
-from src.pdf_generator import generate_pdf_summary
-from src.chatbot import MedicalChatbot
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from src.cache import pipeline_cache, hash_bytes
+from src.config import llm_scheduler, LATENCY_PANEL, WARMUP_COMPONENTS, ANALYSIS_CONCURRENCY
+from src.tracing import registry, start_metrics_server
+from src.lazy import components
+
 logger = logging.getLogger(__name__)
 
+start_metrics_server()
+
 st.set_page_config(
     page_title="Medical Report Analyzer",
     page_icon="[Stethoscope]",
@@ -245,7 +233,8 @@ st.sidebar.markdown("<hr style='border-color:#00e5ff'>", unsafe_allow_html=True)
 st.sidebar.subheader("📤 Upload Medical Report 🌡️🩺")
 uploaded_files = st.sidebar.file_uploader("Choose a file 📂", type=["pdf", "png", "jpg", "jpeg"], accept_multiple_files=True, key="global_uploader")
 
-tab1, tab2, tab3 = st.tabs(["🏠 Home 🏡", "🩺 Analyze 🔍", "💬 Chatbot 🤖"])
+# Only the open tab runs, so the analysis pipeline and chatbot are imported on first visit.
+tab1, tab2, tab3 = st.tabs(["🏠 Home 🏡", "🩺 Analyze 🔍", "💬 Chatbot 🤖"], key="main_tabs", on_change="rerun")
 
 with tab1:
     st.title("[Medical Insights] Health Report Analyzer 🌟🩺")
@@ -295,136 +284,304 @@ with tab1:
     """, unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
 
+def render_card_warning(container, message):
+    with container.container():
+        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
+        st.markdown(f'<p class="warning">{message}</p>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def render_metadata(container, metadata):
+    with container.container():
+        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
+        st.markdown("<h3 style='color:#b266ff'>🧬 [Patient Profile] Data Overview 📊✨💉</h3>", unsafe_allow_html=True)
+        with st.expander("👁️‍🗨️ View Details 🔍"):
+            for item in metadata:
+                fields = "<br>".join(f"<b style='color:#00e6ff'>{k}</b>: <span style='color:#e0ccff'>{v}</span>" for k, v in item.items() if v)
+                st.markdown(fields, unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def color_status(val):
+    if val == "Critical":
+        return 'color: #ff5252; font-weight: bold'
+    elif val == "Borderline":
+        return 'color: #ffca28; font-weight: bold'
+    elif val == "Normal":
+        return 'color: #00ff99; font-weight: bold'
+    return 'color: #e0ccff'
+
+def render_table(container, table_data, title="🧪 Test Results 📊🔬"):
+    with container.container():
+        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
+        st.markdown(f"<h3 style='color:#b266ff'>{title}</h3>", unsafe_allow_html=True)
+        df = components.get("pandas").DataFrame(table_data)
+        styled_df = df.style.map(color_status, subset=['status']) if 'status' in df.columns else df
+        st.dataframe(styled_df, use_container_width=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def render_explanation(container, explanation):
+    with container.container():
+        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
+        st.markdown("<h3>📘 Explanations 💡✨🔍</h3>", unsafe_allow_html=True)
+        if explanation and explanation != components.get("pipeline").EXPLANATION_ERROR:
+            formatted_explanation = explanation.replace("**", "<b>").replace("**", "</b>")
+            formatted_explanation = formatted_explanation.replace("Critical", "<span class='critical'>Critical 🩺🚨</span>").replace("Borderline", "<span class='borderline'>Borderline 🩺⚠️</span>").replace("Normal", "<span class='normal'>Normal 🩺✅</span>")
+            st.markdown(f"<p>{formatted_explanation} 🌟</p>", unsafe_allow_html=True)
+        else:
+            st.markdown('<p class="warning">⚠️❌ No explanations generated. 😕</p>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def render_summary(container, summary_bullets):
+    with container.container():
+        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
+        st.markdown("<h3>📝 Summary & Recommendations 🌿📋✨</h3>", unsafe_allow_html=True)
+        if summary_bullets is None:
+            st.markdown('<p class="warning">⚠️❌ No explanations available for summary. 😕</p>', unsafe_allow_html=True)
+        elif summary_bullets and summary_bullets != components.get("pipeline").SUMMARY_ERROR:
+            formatted_summary = summary_bullets.replace("**Summary:**", "<b>✨ Summary: 🌟</b>")
+            formatted_summary = formatted_summary.replace("**Risks/Conditions:**", "<b>🚨 Risks/Conditions: ⚠️</b>")
+            formatted_summary = formatted_summary.replace("**Actions/Recommendations:**", "<b>✅ Actions/Recommendations: 💡</b>")
+            formatted_summary = formatted_summary.replace("* ", "<span class='emoji-glow'>🌟✨</span> ").replace("\n", "<br>")
+            st.markdown(f"<div class='bullet-point'>{formatted_summary} 🎉</div>", unsafe_allow_html=True)
+        else:
+            st.markdown('<p class="warning">⚠️❌ No summary generated. 😕</p>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def render_pdf_download(container, categorized_data, explanation, summary_bullets, key=None,
+                        file_name="medical_summary.pdf"):
+    # The PDF renders in the background from now on; the download is served from its bytes.
+    pdf_future = components.get("pdf_generator").prerender_pdf_summary(categorized_data, explanation, summary_bullets)
+    with container.container():
+        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
+        st.markdown("<h3>📄 Download Summary 📥💾✨</h3>", unsafe_allow_html=True)
+        st.download_button(
+            label="💾 Save PDF Report 🎯📩",
+            data=pdf_future.result,
+            file_name=file_name,
+            mime="application/pdf",
+            on_click="ignore",
+            key=key
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+
+STAGE_FAILURE_MESSAGES = {
+    "text": "⚠️📄 No text extracted from the file.",
+    "structured": "⚠️🧠 No structured data extracted.",
+    "categorized": "⚠️📊 No categorized data generated.",
+}
+
+def save_results(file_hash, categorized_data, table_data, source):
+    # Kept for trends across reports, once per analyzed file; a failure here must not affect the analysis shown.
+    stored = st.session_state.setdefault("stored_reports", set())
+    if file_hash in stored:
+        return
+    try:
+        # An empty table (e.g. a failed formatting call) falls back to the categorized test rows.
+        if components.get("results_store").results_store.save_report(file_hash, categorized_data, table_data or None, source=source):
+            stored.add(file_hash)
+    except Exception as e:
+        logger.error(f"Error storing results for {source}: {str(e)}")
+
+def render_history():
+    store = components.get("results_store").results_store
+    try:
+        patients = store.patients()
+    except Exception as e:
+        logger.error(f"Error reading results history: {str(e)}")
+        return
+    if not patients:
+        return
+    with st.expander("📈 Result History 🗓️✨"):
+        # Patients are keyed "id:<patient ID>", "name:<name>|<date of birth>" or, when unidentified, "report:<file hash>".
+        labels = {}
+        for p in patients:
+            kind, _, identifier = p["patient"].partition(":")
+            detail = f"ID {identifier}" if kind == "id" else (p["source"] or "unidentified") if kind == "report" else "name + DOB"
+            labels[p["patient"]] = f"{p['patient_name'] or 'Unnamed'} ({detail}) · {p['reports']} report(s)"
+        patient = st.selectbox("Patient", list(labels), format_func=labels.get, key="history_patient")
+        latest = store.latest_values(patient)
+        if not latest:
+            st.markdown('<p class="warning">⚠️❌ No stored results for this patient. 😕</p>', unsafe_allow_html=True)
+            return
+        latest_df = components.get("pandas").DataFrame(latest)[["test_name", "value_text", "unit", "normal_range", "status", "report_date", "source"]]
+        st.markdown("<h3 style='color:#b266ff'>🧾 Latest Values</h3>", unsafe_allow_html=True)
+        st.dataframe(latest_df.style.map(color_status, subset=["status"]), use_container_width=True)
+        analytes = {row["test_name"]: row["analyte"] for row in latest}
+        analyte = st.selectbox("Trend for", list(analytes), key="history_analyte")
+        points = store.trend(patient, analytes[analyte])
+        trend_df = components.get("pandas").DataFrame(points)
+        dated = trend_df.dropna(subset=["report_date", "value"])
+        if len(dated) > 1:
+            st.line_chart(dated.set_index("report_date")["value"])
+        st.dataframe(trend_df[["report_date", "value_text", "unit", "status", "source"]], use_container_width=True)
+
+def prepare_file_analysis(pipeline, uploaded_file, file_hash, show_title, on_table, on_running):
+    """
+    Build the analysis graph for one uploaded file and lay out its result slots.
+    Returns the graph and the callbacks that render into those slots as stages finish.
+    """
+    # Revisions of a report are only matched within the session that analyzed it.
+    session_id = st.session_state.setdefault("analysis_session_id", uuid.uuid4().hex)
+    dag = pipeline.build_analysis_pipeline(uploaded_file.name, uploaded_file.getbuffer(), file_hash=file_hash,
+                                           session_id=session_id)
+    if show_title:
+        st.markdown(f"<h2 style='color:#00e5ff'>📄 {uploaded_file.name}</h2>", unsafe_allow_html=True)
+    failure_slot = st.empty()
+    metadata_slot = st.empty()
+    table_slot = st.empty()
+    explanation_slot = st.empty()
+    summary_slot = st.empty()
+    pdf_slot = st.empty()
+
+    def on_stage_complete(name, value, error):
+        results = dag.results
+        if name in STAGE_FAILURE_MESSAGES and error is not None and not isinstance(error, pipeline.StageSkipped):
+            with failure_slot.container():
+                st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
+                st.warning(STAGE_FAILURE_MESSAGES[name])
+                st.markdown('</div>', unsafe_allow_html=True)
+        elif name == "categorized" and error is None:
+            test_results, metadata = pipeline.split_results(value)
+            if metadata:
+                render_metadata(metadata_slot, metadata)
+            if not test_results:
+                render_card_warning(table_slot, "⚠️❌ No test results found. 😕")
+        elif name == "table" and error is None and pipeline.split_results(results["categorized"])[0]:
+            rows = [dict(row, source=uploaded_file.name) for row in value or []]
+            # The chatbot answers factual questions about this report from these rows.
+            st.session_state.setdefault("analysis_rows", {})[file_hash] = rows
+            save_results(file_hash, results["categorized"], value, uploaded_file.name)
+            on_table(file_hash, rows)
+            if value:
+                render_table(table_slot, value)
+            else:
+                render_card_warning(table_slot, "⚠️❌ No test data found to display. 😕")
+        elif name == "explanation" and error is None and value is not None:
+            render_explanation(explanation_slot, value)
+        elif name == "summary" and error is None and results.get("explanation") is not None:
+            render_summary(summary_slot, value)
+            explanation = results.get("explanation")
+            if explanation and explanation != pipeline.EXPLANATION_ERROR:
+                render_pdf_download(pdf_slot, results["categorized"], explanation, value, key=f"pdf_{file_hash}",
+                                    file_name=f"{os.path.splitext(uploaded_file.name)[0]}_summary.pdf")
+
+    def on_stage_progress(name, text):
+        # Partial LLM output, throttled by the pipeline; the final text is rendered in on_stage_complete.
+        if name == "explanation":
+            render_explanation(explanation_slot, text + " ▌")
+        elif name == "summary":
+            render_summary(summary_slot, text + " ▌")
+
+    def on_tick(running):
+        on_running(uploaded_file.name, running)
+
+    return dag, {"on_complete": on_stage_complete, "on_tick": on_tick, "on_progress": on_stage_progress}
+
 with tab2:
-    st.title("🏥 [Medical Insights] AI-Driven Health Report Analyzer 💥🔬🌟")
-    st.markdown("<p style='color:#00ff99; font-size: 18px;'>Upload your medical report for cutting-edge AI insights! <span class='emoji-glow'>💡🎯⚡🚀</span></p>", unsafe_allow_html=True)
-    st.sidebar.subheader("⏳ Processing Status 🔄")
-    status_placeholder = st.sidebar.empty()
-
-    if uploaded_files:
-        with st.spinner("🔄 Analyzing your report... 🕒⏰"):
-            try:
-                if len(uploaded_files) > 1:
-                    st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                    st.warning("⚠️❌ Using only the first uploaded file for analysis.")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                uploaded_file = uploaded_files[0]
-                with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-                    tmp_file.write(uploaded_file.read())
-                    tmp_file_path = tmp_file.name
+    if tab2.open:
+        pipeline = components.get("pipeline")
+        st.title("🏥 [Medical Insights] AI-Driven Health Report Analyzer 💥🔬🌟")
+        st.markdown("<p style='color:#00ff99; font-size: 18px;'>Upload your medical report for cutting-edge AI insights! <span class='emoji-glow'>💡🎯⚡🚀</span></p>", unsafe_allow_html=True)
+        st.sidebar.subheader("⏳ Processing Status 🔄")
+        status_placeholder = st.sidebar.empty()
 
-                raw_text = extract_text(tmp_file_path)
-                if not raw_text:
-                    st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                    st.warning("⚠️📄 No text extracted from the file.")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    raise ValueError("Text extraction failed")
-                
-                structured_data = structure_data(raw_text)
-                if not structured_data:
-                    st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                    st.warning("⚠️🧠 No structured data extracted.")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    raise ValueError("Data structuring failed")
+        if uploaded_files:
+            with st.spinner("🔄 Analyzing your reports... 🕒⏰" if len(uploaded_files) > 1 else "🔄 Analyzing your report... 🕒⏰"):
+                try:
+                    for previous_dag in st.session_state.pop("analysis_dags", []):
+                        previous_dag.cancel()
 
-                categorized_data = categorize_results(structured_data)
-                if not categorized_data:
-                    st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                    st.warning("⚠️📊 No categorized data generated.")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    raise ValueError("Categorization failed")
+                    files = {}
+                    for uploaded_file in uploaded_files:
+                        files.setdefault(hash_bytes(uploaded_file.getbuffer()), uploaded_file)
+                    multiple = len(files) > 1
 
-                test_results = [r for r in categorized_data if "test_name" in r or "Test" in r]
-                metadata = [r for r in categorized_data if "test_name" not in r and "Test" not in r]
+                    # With several reports, a merged table across all of them sits above the per-file sections.
+                    merged_slot = st.empty() if multiple else None
+                    merged_tables = {}
 
-                if metadata:
-                    st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                    st.markdown("<h3 style='color:#b266ff'>🧬 [Patient Profile] Data Overview 📊✨💉</h3>", unsafe_allow_html=True)
-                    with st.expander("👁️‍🗨️ View Details 🔍"):
-                        for item in metadata:
-                            fields = "<br>".join(f"<b style='color:#00e6ff'>{k}</b>: <span style='color:#e0ccff'>{v}</span>" for k, v in item.items() if v)
-                            st.markdown(fields, unsafe_allow_html=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                    def on_table(file_hash, rows):
+                        merged_tables[file_hash] = rows
+                        if merged_slot is not None:
+                            merged_rows = [row for h in files if h in merged_tables for row in merged_tables[h]]
+                            if merged_rows:
+                                render_table(merged_slot, merged_rows, title="🧪 All Test Results 📊🔬")
+
+                    running_stages = {}
+
+                    def on_running(file_name, running):
+                        running_stages[file_name] = running
+                        labels = [f"{name}: {', '.join(stages)}" if multiple else ", ".join(stages)
+                                  for name, stages in running_stages.items() if stages]
+                        if labels:
+                            status_placeholder.markdown(f"<p style='color:#00e5ff'>⏳ Running: {' · '.join(labels)}</p>", unsafe_allow_html=True)
 
-                if test_results:
-                    table_data = format_results_for_table(test_results)
-                    if table_data:
-                        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                        st.markdown("<h3 style='color:#b266ff'>🧪 Test Results 📊🔬</h3>", unsafe_allow_html=True)
-                        df = pd.DataFrame(table_data)
-                        def color_status(val):
-                            if val == "Critical":
-                                return 'color: #ff5252; font-weight: bold'
-                            elif val == "Borderline":
-                                return 'color: #ffca28; font-weight: bold'
-                            elif val == "Normal":
-                                return 'color: #00ff99; font-weight: bold'
-                            return 'color: #e0ccff'
-                        styled_df = df.style.map(color_status, subset=['status'])
-                        st.dataframe(styled_df, use_container_width=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                        st.markdown("<h3>📘 Explanations 💡✨🔍</h3>", unsafe_allow_html=True)
-                        explanation = explain_results_batch(test_results)
-                        if explanation and explanation != "Unable to generate explanations due to an error.":
-                            formatted_explanation = explanation.replace("**", "<b>").replace("**", "</b>")
-                            formatted_explanation = formatted_explanation.replace("Critical", "<span class='critical'>Critical 🩺🚨</span>").replace("Borderline", "<span class='borderline'>Borderline 🩺⚠️</span>").replace("Normal", "<span class='normal'>Normal 🩺✅</span>")
-                            st.markdown(f"<p>{formatted_explanation} 🌟</p>", unsafe_allow_html=True)
-                        else:
-                            st.markdown('<p class="warning">⚠️❌ No explanations generated. 😕</p>', unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-
-                        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                        st.markdown("<h3>📝 Summary & Recommendations 🌿📋✨</h3>", unsafe_allow_html=True)
-                        if explanation and test_results:
-                            summary_bullets = generate_summary_bullet_points(explanation)
-                            if summary_bullets and summary_bullets != "Unable to generate summary due to an error.":
-                                formatted_summary = summary_bullets.replace("**Summary:**", "<b>✨ Summary: 🌟</b>")
-                                formatted_summary = formatted_summary.replace("**Risks/Conditions:**", "<b>🚨 Risks/Conditions: ⚠️</b>")
-                                formatted_summary = formatted_summary.replace("**Actions/Recommendations:**", "<b>✅ Actions/Recommendations: 💡</b>")
-                                formatted_summary = formatted_summary.replace("* ", "<span class='emoji-glow'>🌟✨</span> ").replace("\n", "<br>")
-                                st.markdown(f"<div class='bullet-point'>{formatted_summary} 🎉</div>", unsafe_allow_html=True)
-                            else:
-                                st.markdown('<p class="warning">⚠️❌ No summary generated. 😕</p>', unsafe_allow_html=True)
-                        else:
-                            st.markdown('<p class="warning">⚠️❌ No explanations available for summary. 😕</p>', unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-
-                        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                        st.markdown("<h3>📄 Download Summary 📥💾✨</h3>", unsafe_allow_html=True)
-                        if test_results and explanation:
-                            if st.button("📄 Generate PDF Summary 🌟🚀"):
-                                pdf_bytes = generate_pdf_summary(categorized_data, explanation, summary_bullets)
-                                st.download_button(
-                                    label="💾 Save PDF Report 🎯📩",
-                                    data=pdf_bytes,
-                                    file_name="medical_summary.pdf",
-                                    mime="application/pdf"
-                                )
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    else:
-                        st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                        st.markdown('<p class="warning">⚠️❌ No test data found to display. 😕</p>', unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-                else:
+                    runs = [prepare_file_analysis(pipeline, uploaded_file, file_hash, multiple, on_table, on_running)
+                            for file_hash, uploaded_file in files.items()]
+                    st.session_state["analysis_dags"] = [dag for dag, _ in runs]
+                    # Files run side by side (bounded per session), so wall time follows the slowest report.
+                    pipeline.run_pipelines_sync(runs, max_concurrency=ANALYSIS_CONCURRENCY)
+                    st.session_state.pop("analysis_dags", None)
+
+                    failed = []
+                    for (dag, _), uploaded_file in zip(runs, files.values()):
+                        stages = [name for name, error in dag.errors.items() if not isinstance(error, pipeline.StageSkipped)]
+                        if stages:
+                            failed.append(f"{uploaded_file.name} ({', '.join(stages)})" if multiple else ", ".join(stages))
+                    if failed:
+                        raise ValueError(f"Stage(s) failed: {'; '.join(failed)}")
+                    status_placeholder.markdown("<p style='color:#00ff99'>✅🎉 Report processed successfully! 🚀</p>" if not multiple else
+                                                f"<p style='color:#00ff99'>✅🎉 {len(files)} reports processed successfully! 🚀</p>", unsafe_allow_html=True)
+                except Exception as e:
                     st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                    st.markdown('<p class="warning">⚠️❌ No test results found. 😕</p>', unsafe_allow_html=True)
+                    st.markdown(f'<p class="warning">❌🚨 Error: {str(e)} 😕</p>', unsafe_allow_html=True)
                     st.markdown('</div>', unsafe_allow_html=True)
+                    logger.error(f"Error processing file: {str(e)}")
+                    status_placeholder.markdown("<p style='color:#ff5252'>❌🚨 Processing failed! 😕</p>", unsafe_allow_html=True)
+        else:
+            st.info("📢📄 Please upload a medical report using the sidebar to start analyzing! 🚀🌟")
 
-                os.unlink(tmp_file_path)
-                logger.info(f"Temporary file deleted: {tmp_file_path}")
-                status_placeholder.markdown("<p style='color:#00ff99'>✅🎉 Report processed successfully! 🚀</p>", unsafe_allow_html=True)
-            except Exception as e:
-                st.markdown('<div class="shiny-card">', unsafe_allow_html=True)
-                st.markdown(f'<p class="warning">❌🚨 Error: {str(e)} 😕</p>', unsafe_allow_html=True)
-                st.markdown('</div>', unsafe_allow_html=True)
-                logger.error(f"Error processing file: {str(e)}")
-                status_placeholder.markdown("<p style='color:#ff5252'>❌🚨 Processing failed! 😕</p>", unsafe_allow_html=True)
-    else:
-        st.info("📢📄 Please upload a medical report using the sidebar to start analyzing! 🚀🌟")
+        render_history()
+
+    with st.sidebar.expander("🗄️ Analysis Cache"):
+        cache_stats = pipeline_cache.stats()
+        st.markdown(
+            f"<p style='color:#00e5ff'>Hits: <b>{cache_stats['hits']}</b> · Misses: <b>{cache_stats['misses']}</b> · "
+            f"Hit rate: <b>{cache_stats['hit_rate']:.0%}</b><br>"
+            f"Size: <b>{cache_stats['bytes'] / 1_048_576:.1f} MB</b> / {cache_stats['max_bytes'] / 1_048_576:.0f} MB</p>",
+            unsafe_allow_html=True
+        )
+        if st.button("🧹 Clear Cache"):
+            pipeline_cache.invalidate()
+            st.success("✅ Analysis cache cleared.")
+
+    with st.sidebar.expander("🚦 LLM Scheduler"):
+        scheduler_stats = llm_scheduler.metrics()
+        queued = " · ".join(f"{name}: <b>{count}</b>" for name, count in scheduler_stats["queued"].items())
+        st.markdown(
+            f"<p style='color:#00e5ff'>In flight: <b>{scheduler_stats['active']}</b> · Queued: {queued}<br>"
+            f"Completed: <b>{scheduler_stats['completed']}</b> · Retries: <b>{scheduler_stats['retries']}</b> · "
+            f"Rate-limited: <b>{scheduler_stats['rate_limited']}</b> · Errors: <b>{scheduler_stats['errors']}</b><br>"
+            f"Avg queue wait: <b>{scheduler_stats['avg_wait_ms']:.0f} ms</b> · "
+            f"Tokens available: <b>{scheduler_stats['tokens_available']}</b></p>",
+            unsafe_allow_html=True
+        )
 
 with tab3:
-    st.session_state["current_page"] = "chatbot"
-    chatbot_obj = MedicalChatbot(uploaded_files)
-    chatbot_obj.main()
\ No newline at end of file
+    if tab3.open:
+        st.session_state["current_page"] = "chatbot"
+        chatbot_obj = components.get("chatbot").MedicalChatbot(uploaded_files)
+        chatbot_obj.main()
+
+if LATENCY_PANEL:
+    with st.sidebar.expander("⏱️ Latency"):
+        latency_rows = registry.latency_summary()
+        if latency_rows:
+            latency_df = components.get("pandas").DataFrame(latency_rows)
+            for column in ["mean_s", "p50_s", "p95_s", "max_s"]:
+                latency_df[column.replace("_s", "_ms")] = (latency_df.pop(column) * 1000).round(1)
+            st.dataframe(latency_df, hide_index=True)
+        else:
+            st.markdown("<p style='color:#00e5ff'>No traced operations yet.</p>", unsafe_allow_html=True)
+
+# Preload heavy components after the page has been sent, so switching tabs is instant.
+components.warm_up(WARMUP_COMPONENTS)
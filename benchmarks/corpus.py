@@ -0,0 +1,77 @@
+"""
+Deterministic synthetic lab reports for benchmarking.
+
+``write_sample_corpus`` renders a short panel, a mid-sized multi-panel report
+and a long multi-page report as PDFs, so every machine benchmarks the same text
+(and therefore replays the same recorded prompts).
+"""
+import os
+import random
+from typing import List, Tuple
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+# (test, unit, low, high)
+PANELS = {
+    "Complete Blood Count": [
+        ("Hemoglobin", "g/dL", 13.0, 17.0), ("Hematocrit", "%", 40.0, 50.0),
+        ("WBC Count", "x10^3/uL", 4.0, 11.0), ("Platelet Count", "x10^3/uL", 150.0, 450.0),
+        ("RBC Count", "x10^6/uL", 4.5, 5.9), ("MCV", "fL", 80.0, 100.0),
+    ],
+    "Lipid Profile": [
+        ("Total Cholesterol", "mg/dL", 125.0, 200.0), ("HDL Cholesterol", "mg/dL", 40.0, 60.0),
+        ("LDL Cholesterol", "mg/dL", 0.0, 100.0), ("Triglycerides", "mg/dL", 0.0, 150.0),
+    ],
+    "Metabolic Panel": [
+        ("Fasting Glucose", "mg/dL", 70.0, 100.0), ("Creatinine", "mg/dL", 0.7, 1.3),
+        ("Sodium", "mmol/L", 135.0, 145.0), ("Potassium", "mmol/L", 3.5, 5.1),
+        ("ALT", "U/L", 7.0, 56.0), ("TSH", "mIU/L", 0.4, 4.0),
+    ],
+}
+
+SAMPLE_REPORTS: List[Tuple[str, List[str], int]] = [
+    ("short_cbc.pdf", ["Complete Blood Count"], 1),
+    ("multi_panel.pdf", list(PANELS), 1),
+    ("long_followup.pdf", list(PANELS), 12),
+]
+
+
+def _value(rng: random.Random, low: float, high: float) -> str:
+    span = high - low or high
+    return f"{rng.uniform(low - 0.25 * span, high + 0.25 * span):.1f}"
+
+
+def write_report(path: str, panels: List[str], visits: int, seed: int) -> None:
+    """Render one report with ``visits`` dated result pages for ``panels``."""
+    rng = random.Random(seed)
+    pdf = canvas.Canvas(path, pagesize=letter)
+    for visit in range(visits):
+        y = 740
+        for line in ["City Diagnostic Laboratory", f"Patient Name: Sample Patient {seed}",
+                     f"Age: {30 + seed}   Gender: {'Female' if seed % 2 else 'Male'}",
+                     f"Sample Date: 2024-{visit % 12 + 1:02d}-15   Referred By: Dr. Example", ""]:
+            pdf.drawString(60, y, line)
+            y -= 16
+        for panel in panels:
+            pdf.drawString(60, y, panel)
+            y -= 16
+            for name, unit, low, high in PANELS[panel]:
+                pdf.drawString(80, y, f"{name}   {_value(rng, low, high)} {unit}   Ref: {low:g}-{high:g} {unit}")
+                y -= 14
+            y -= 8
+        pdf.drawString(60, 40, f"Page {visit + 1} of {visits}")
+        pdf.showPage()
+    pdf.save()
+
+
+def write_sample_corpus(directory: str) -> List[str]:
+    """Write the sample reports into ``directory`` (if missing) and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for seed, (name, panels, visits) in enumerate(SAMPLE_REPORTS, start=1):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            write_report(path, panels, visits, seed)
+        paths.append(path)
+    return paths
@@ -0,0 +1,119 @@
+"""
+Prompt size report for the row-based LLM stages.
+
+Usage:
+    python -m benchmarks.prompt_tokens [--analytes 60] [--rows structured.json] [--out tokens.json]
+
+Builds the categorize, table and explain prompts for a synthetic panel (or for
+the structured rows in ``--rows``, a JSON array as produced by
+``structure_data``) and compares the token count of the compact columnar
+payload with the pretty-printed JSON the prompts embedded before. Response
+sizes are compared for the two stages whose output format changed. Tokens are
+counted with tiktoken when it is installed, otherwise estimated like the LLM
+scheduler does (4 characters per token).
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Callable, Dict, List
+
+from src.prompt_format import encode_rows, legacy_encode_rows, row_id
+
+ANALYTES = [
+    ("Hemoglobin", "g/dL", 12.0, 16.0), ("Hematocrit", "%", 36.0, 46.0), ("WBC", "10^3/uL", 4.0, 11.0),
+    ("Platelets", "10^3/uL", 150.0, 450.0), ("Glucose", "mg/dL", 70.0, 110.0), ("HbA1c", "%", 4.0, 5.7),
+    ("Creatinine", "mg/dL", 0.6, 1.2), ("Urea", "mg/dL", 15.0, 40.0), ("Sodium", "mmol/L", 135.0, 145.0),
+    ("Potassium", "mmol/L", 3.5, 5.1), ("ALT", "U/L", 7.0, 56.0), ("AST", "U/L", 10.0, 40.0),
+    ("Total Cholesterol", "mg/dL", 125.0, 200.0), ("LDL", "mg/dL", 0.0, 100.0), ("HDL", "mg/dL", 40.0, 60.0),
+    ("Triglycerides", "mg/dL", 0.0, 150.0), ("TSH", "mIU/L", 0.4, 4.0), ("Vitamin D", "ng/mL", 30.0, 100.0),
+    ("Ferritin", "ng/mL", 20.0, 250.0), ("CRP", "mg/L", 0.0, 5.0),
+]
+
+
+def synthetic_panel(analytes: int) -> List[Dict]:
+    """Patient metadata plus ``analytes`` test rows cycling through common tests."""
+    rows: List[Dict] = [{"patient_name": "Jane Doe"}, {"age": "52"}, {"date": "2025-01-14"}]
+    for i in range(analytes):
+        name, unit, low, high = ANALYTES[i % len(ANALYTES)]
+        suffix = f" ({i // len(ANALYTES) + 1})" if i >= len(ANALYTES) else ""
+        value = round(low + (high - low) * ((i * 37) % 130) / 100, 1)
+        rows.append({"test_name": name + suffix, "value": str(value), "unit": unit, "normal_range": f"{low}-{high}"})
+    return rows
+
+
+def _counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    except ImportError:
+        return lambda text: len(text) // 4
+
+
+def _prompt(messages: list) -> str:
+    return "".join(str(message.content) for message in messages)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare prompt token counts of compact and legacy row encodings.")
+    parser.add_argument("--analytes", type=int, default=60, help="Test rows in the synthetic panel")
+    parser.add_argument("--rows", default=None, help="JSON file with structured rows to use instead")
+    parser.add_argument("--out", default=None, help="Optional JSON results file")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("GROQ_API_KEY", "prompt-tokens")
+    from src.categorize import _build_categorization_messages
+    from src.table_formatter import _build_table_messages, TABLE_COLUMNS
+    from src.explain import _build_explanation_messages
+
+    if args.rows:
+        with open(args.rows, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        rows = synthetic_panel(args.analytes)
+    tests = [row for row in rows if "test_name" in row]
+    categorized = [dict(row, status="Normal") if "test_name" in row else row for row in rows]
+    count = _counter()
+
+    # Each entry: (current prompt, the payload it embeds, the same rows as pretty-printed JSON).
+    prompts = {
+        "categorize": (_prompt(_build_categorization_messages(tests)), encode_rows(tests), legacy_encode_rows(tests)),
+        "table": (_prompt(_build_table_messages(categorized)), encode_rows(categorized), legacy_encode_rows(categorized)),
+        "explain": (_prompt(_build_explanation_messages(categorized)), encode_rows(categorized, with_ids=False),
+                    legacy_encode_rows(categorized)),
+    }
+    table_rows = [{column: row.get(column, "") for column in TABLE_COLUMNS} for row in categorized if "test_name" in row]
+    responses = {
+        "categorize": (json.dumps([[row_id(i), "Normal"] for i in range(len(tests))], separators=(",", ":")),
+                       json.dumps([dict(row, status="Normal") for row in tests])),
+        "table": (json.dumps([[row_id(i)] + [row[column] for column in TABLE_COLUMNS] for i, row in enumerate(table_rows)],
+                             separators=(",", ":")),
+                  json.dumps(table_rows)),
+    }
+
+    report: Dict[str, Dict[str, int]] = {}
+    for stage, (prompt, payload, legacy_payload) in prompts.items():
+        assert payload in prompt, f"{stage} prompt does not embed the compact payload"
+        report[stage] = {"input_before": count(prompt.replace(payload, legacy_payload)), "input_after": count(prompt)}
+        if stage in responses:
+            compact, legacy = responses[stage]
+            report[stage].update({"output_before": count(legacy), "output_after": count(compact)})
+
+    print(f"{len(tests)} tests, {len(rows) - len(tests)} metadata rows\n")
+    print(f"{'stage':<12}{'input before':>14}{'after':>8}{'saved':>8}{'output before':>16}{'after':>8}{'saved':>8}")
+    for stage, row in report.items():
+        line = f"{stage:<12}{row['input_before']:>14}{row['input_after']:>8}{1 - row['input_after'] / row['input_before']:>8.0%}"
+        if "output_before" in row:
+            line += f"{row['output_before']:>16}{row['output_after']:>8}{1 - row['output_after'] / row['output_before']:>8.0%}"
+        print(line)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"tests": len(tests), "rows": len(rows), "stages": report}, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
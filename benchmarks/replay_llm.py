@@ -0,0 +1,147 @@
+"""
+Record/replay stand-in for the Groq chat model.
+
+``RecordingChatModel`` wraps the real model and writes every response to
+``<store_dir>/<key>.json``; ``ReplayChatModel`` serves those files back with a
+synthetic first-token latency and generation speed, so benchmarks run offline
+and without network noise. Both expose the invoke/ainvoke/stream/astream
+surface the project uses and can be installed behind ``src.config.llm``.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+def _message_payload(messages: Any) -> List[Dict[str, str]]:
+    if isinstance(messages, str):
+        return [{"type": "human", "content": messages}]
+    if hasattr(messages, "to_messages"):
+        messages = messages.to_messages()
+    return [{"type": getattr(m, "type", "human"), "content": str(getattr(m, "content", m))} for m in messages]
+
+
+def recording_key(messages: Any) -> str:
+    """Stable key for a prompt: sha256 over the message types and contents."""
+    payload = json.dumps(_message_payload(messages), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, dict):
+        return next(iter(content.values()), "")
+    return content if isinstance(content, str) else str(content)
+
+
+class RecordingChatModel:
+    """Pass calls through to ``model`` and save each prompt/response pair to ``store_dir``."""
+
+    def __init__(self, model, store_dir: str):
+        self.model = model
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _save(self, messages: Any, content: str, usage: Dict) -> None:
+        path = os.path.join(self.store_dir, f"{recording_key(messages)}.json")
+        record = {"messages": _message_payload(messages), "content": content, "usage": usage or {}}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def invoke(self, messages, **kwargs):
+        response = self.model.invoke(messages, **kwargs)
+        self._save(messages, _content_text(response.content), getattr(response, "usage_metadata", None))
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        response = await self.model.ainvoke(messages, **kwargs)
+        self._save(messages, _content_text(response.content), getattr(response, "usage_metadata", None))
+        return response
+
+    def stream(self, messages, **kwargs):
+        parts = []
+        for chunk in self.model.stream(messages, **kwargs):
+            parts.append(_content_text(chunk.content))
+            yield chunk
+        self._save(messages, "".join(parts), {})
+
+    async def astream(self, messages, **kwargs):
+        parts = []
+        async for chunk in self.model.astream(messages, **kwargs):
+            parts.append(_content_text(chunk.content))
+            yield chunk
+        self._save(messages, "".join(parts), {})
+
+
+class ReplayChatModel:
+    """
+    Serve recorded responses with synthetic timing.
+
+    Each call waits ``latency_ms`` before the first token and then generates at
+    ``tokens_per_second`` (a token being ~4 characters). A prompt that was never
+    recorded raises ``KeyError`` naming the missing key.
+    """
+
+    def __init__(self, store_dir: str, latency_ms: float = 300.0, tokens_per_second: float = 400.0,
+                 chars_per_token: int = 4):
+        self.store_dir = store_dir
+        self.latency = latency_ms / 1000.0
+        self.tokens_per_second = tokens_per_second
+        self.chars_per_token = chars_per_token
+        self.calls = 0
+        self.misses: List[str] = []
+
+    def _load(self, messages: Any) -> Dict:
+        key = recording_key(messages)
+        path = os.path.join(self.store_dir, f"{key}.json")
+        self.calls += 1
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            self.misses.append(key)
+            raise KeyError(f"No recording for prompt {key[:12]}; rerun the benchmark with --record") from None
+
+    def _tokens(self, content: str) -> List[str]:
+        step = self.chars_per_token
+        return [content[i:i + step] for i in range(0, len(content), step)]
+
+    def _generation_seconds(self, content: str) -> float:
+        return self.latency + len(self._tokens(content)) / self.tokens_per_second
+
+    @staticmethod
+    def _message(record: Dict) -> AIMessage:
+        usage = record.get("usage") or {}
+        message = AIMessage(content=record["content"])
+        if usage.get("total_tokens") is not None:
+            message.usage_metadata = usage
+        return message
+
+    def invoke(self, messages, **kwargs):
+        record = self._load(messages)
+        time.sleep(self._generation_seconds(record["content"]))
+        return self._message(record)
+
+    async def ainvoke(self, messages, **kwargs):
+        record = self._load(messages)
+        await asyncio.sleep(self._generation_seconds(record["content"]))
+        return self._message(record)
+
+    def stream(self, messages, **kwargs):
+        record = self._load(messages)
+        time.sleep(self.latency)
+        for token in self._tokens(record["content"]):
+            time.sleep(1 / self.tokens_per_second)
+            yield AIMessageChunk(content=token)
+
+    async def astream(self, messages, **kwargs):
+        record = self._load(messages)
+        await asyncio.sleep(self.latency)
+        for token in self._tokens(record["content"]):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield AIMessageChunk(content=token)
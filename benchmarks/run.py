@@ -0,0 +1,261 @@
+"""
+Offline performance benchmark for the analysis pipeline and chatbot.
+
+Usage:
+    # once, with a real GROQ_API_KEY: record every LLM response for the corpus
+    python -m benchmarks.run --record
+
+    # afterwards, offline: replay the recordings with synthetic LLM timing
+    python -m benchmarks.run --out bench.json [--baseline baseline.json] [--repeat 3]
+        [--latency-ms 300] [--tokens-per-second 400] [--fake-embeddings]
+
+Each report in the corpus (``benchmarks/corpus`` by default, generated on first
+use) is timed stage by stage, from ``extract_text`` through
+``generate_pdf_summary``, then as one cold run of the async analysis graph,
+then through ``setup_retrieval_system`` and one chat turn. Caches are pointed
+at a scratch directory and cleared before every run, so each stage is timed
+cold. Results are written as JSON. With ``--baseline``, each stage's median is
+compared to the baseline's, and ``--fail-on-regression`` exits with status 1
+when any stage is slower than ``--threshold``.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from benchmarks.corpus import write_sample_corpus
+from benchmarks.replay_llm import RecordingChatModel, ReplayChatModel
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUESTION = "Which of my results are outside the normal range?"
+
+
+def _discover(corpus: str) -> List[str]:
+    if not os.path.isdir(corpus) or not os.listdir(corpus):
+        return write_sample_corpus(corpus)
+    return sorted(os.path.join(corpus, name) for name in os.listdir(corpus)
+                  if name.lower().endswith((".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff")))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BENCH_DIR, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _stats(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "mean": round(statistics.mean(ordered), 4),
+        "median": round(statistics.median(ordered), 4),
+        "p95": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 4),
+        "min": round(ordered[0], 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def bench_report(path: str, chat_llm, question: str, errors: List[str]) -> Dict[str, float]:
+    """Time every stage for one report; failures are appended to ``errors`` and end that section."""
+    from src.ocr import extract_text
+    from src.nlp import structure_data
+    from src.categorize import categorize_results
+    from src.table_formatter import format_results_for_table
+    from src.explain import explain_results_batch
+    from src.summary import generate_summary_bullet_points
+    from src.pdf_generator import generate_pdf_summary
+    from src.cache import pipeline_cache, hash_bytes
+    from src.pipeline import build_analysis_pipeline, run_pipeline_sync, split_results
+    from src.chatbot import setup_retrieval_system, stream_answer, configure_embedding_model
+    from src.vector_store import get_index_store
+    from src.tracing import span
+    import streamlit as st
+
+    timings: Dict[str, float] = {}
+
+    def timed(stage, func, *args):
+        started = time.perf_counter()
+        with span(stage, kind="stage"):
+            value = func(*args)
+        timings[stage] = time.perf_counter() - started
+        return value
+
+    name = os.path.basename(path)
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+
+    try:
+        raw_text = timed("extract_text", extract_text, path)
+        structured = timed("structure_data", structure_data, raw_text)
+        categorized = timed("categorize_results", categorize_results, structured)
+        test_results, _ = split_results(categorized)
+        timed("format_results_for_table", format_results_for_table, test_results)
+        explanation = timed("explain_results_batch", explain_results_batch, test_results)
+        summary = timed("generate_summary_bullet_points", generate_summary_bullet_points, explanation)
+        timed("generate_pdf_summary", generate_pdf_summary, categorized, explanation, summary)
+
+        pipeline_cache.invalidate()
+        dag = build_analysis_pipeline(name, file_bytes)
+        first_progress: Dict[str, float] = {}
+        pipeline_started = time.perf_counter()
+
+        def on_progress(stage, _partial):
+            first_progress.setdefault(stage, time.perf_counter() - pipeline_started)
+
+        timed("analysis_pipeline", lambda: run_pipeline_sync(dag, on_progress=on_progress))
+        # Time until the Analyze tab starts showing the explanation, i.e. the perceived latency.
+        timings["analysis_first_explanation"] = first_progress.get("explanation", timings["analysis_pipeline"])
+        if dag.errors:
+            errors.append(f"{name}: analysis_pipeline: {dag.errors}")
+    except Exception as e:
+        errors.append(f"{name}: analysis: {type(e).__name__}: {e}")
+
+    try:
+        get_index_store(configure_embedding_model).invalidate(hash_bytes(file_bytes))
+        st.session_state.pop("vector_index", None)
+        upload = io.BytesIO(file_bytes)
+        upload.name = name
+        retriever = timed("setup_retrieval_system", setup_retrieval_system, [upload])
+
+        started = time.perf_counter()
+        first_token = None
+        for _ in stream_answer(chat_llm, retriever, question):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+        timings["chat_turn"] = time.perf_counter() - started
+        timings["chat_first_token"] = first_token if first_token is not None else timings["chat_turn"]
+    except Exception as e:
+        errors.append(f"{name}: chat: {type(e).__name__}: {e}")
+    return timings
+
+
+def compare(current: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float,
+            min_delta: float = 0.005) -> Dict[str, Dict]:
+    """
+    Compare stage medians; ``change`` is relative to the baseline (+0.10 = 10% slower).
+    Differences under ``min_delta`` seconds are reported as unchanged timer noise.
+    """
+    comparison = {}
+    for stage, stats in current.items():
+        if stage not in baseline or not baseline[stage]["median"]:
+            continue
+        change = (stats["median"] - baseline[stage]["median"]) / baseline[stage]["median"]
+        if abs(stats["median"] - baseline[stage]["median"]) < min_delta:
+            verdict = "unchanged"
+        else:
+            verdict = "regression" if change > threshold else "improvement" if change < -threshold else "unchanged"
+        comparison[stage] = {"baseline": baseline[stage]["median"], "current": stats["median"],
+                             "change": round(change, 4), "verdict": verdict}
+    return comparison
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline with recorded LLM responses.")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "corpus"), help="Directory of sample reports")
+    parser.add_argument("--recordings", default=os.path.join(BENCH_DIR, "recordings"), help="Recorded LLM responses")
+    parser.add_argument("--record", action="store_true", help="Call the real model and save its responses")
+    parser.add_argument("--out", default="bench.json", help="JSON results file")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change treated as significant")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any stage regressed")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per report")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per report before timing")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Replay: delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Replay: generation speed")
+    parser.add_argument("--question", default=DEFAULT_QUESTION, help="Chat turn question")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="Use deterministic hash embeddings instead of the sentence-transformers model")
+    args = parser.parse_args(argv)
+
+    # Settings are read at import time, so they must be in place before src is imported.
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    os.environ["CACHE_DIR"] = os.path.join(scratch, "pipeline")
+    os.environ["INDEX_DIR"] = os.path.join(scratch, "indexes")
+    if not args.record:
+        os.environ.setdefault("GROQ_API_KEY", "replay")
+        os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "1000000")
+        os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "1000000000")
+
+    from src.config import llm
+    from src.chatbot import configure_llm
+    from src.embeddings import get_embedding_service
+
+    chat_llm = configure_llm()
+    if args.record:
+        llm.model = RecordingChatModel(llm.model, args.recordings)
+        chat_llm.model = RecordingChatModel(chat_llm.model, args.recordings)
+        args.repeat, args.warmup = 1, 0
+    else:
+        replay = ReplayChatModel(args.recordings, args.latency_ms, args.tokens_per_second)
+        llm.model = replay
+        chat_llm.model = replay
+    if args.fake_embeddings:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        get_embedding_service()._model = DeterministicFakeEmbedding(size=384)
+
+    paths = _discover(args.corpus)
+    samples: Dict[str, List[float]] = {}
+    per_report: Dict[str, Dict[str, float]] = {}
+    errors: List[str] = []
+    for path in paths:
+        name = os.path.basename(path)
+        for _ in range(args.warmup):
+            bench_report(path, chat_llm, args.question, [])
+        report_samples: Dict[str, List[float]] = {}
+        for _ in range(args.repeat):
+            for stage, seconds in bench_report(path, chat_llm, args.question, errors).items():
+                samples.setdefault(stage, []).append(seconds)
+                report_samples.setdefault(stage, []).append(seconds)
+        per_report[name] = {stage: round(statistics.median(values), 4) for stage, values in report_samples.items()}
+        print(f"{name}: " + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in per_report[name].items()))
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": "record" if args.record else "replay",
+            "latency_ms": args.latency_ms,
+            "tokens_per_second": args.tokens_per_second,
+            "repeat": args.repeat,
+            "reports": [os.path.basename(p) for p in paths],
+            "fake_embeddings": args.fake_embeddings,
+        },
+        "stages": {stage: _stats(values) for stage, values in samples.items()},
+        "reports": per_report,
+        "errors": sorted(set(errors)),
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        results["comparison"] = compare(results["stages"], baseline.get("stages", {}), args.threshold)
+        print(f"\n{'stage':<32}{'baseline':>10}{'current':>10}{'change':>9}")
+        for stage, row in results["comparison"].items():
+            print(f"{stage:<32}{row['baseline']:>9.3f}s{row['current']:>9.3f}s{row['change']:>+8.1%}  {row['verdict']}")
+        regressions = [stage for stage, row in results["comparison"].items() if row["verdict"] == "regression"]
+
+    shutil.rmtree(scratch, ignore_errors=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nWrote {args.out}" + (f" ({len(errors)} errors)" if errors else ""))
+    for error in results["errors"]:
+        print(f"  error: {error}")
+    return 1 if args.fail_on_regression and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
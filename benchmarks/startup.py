@@ -0,0 +1,124 @@
+"""
+Cold-start benchmark for the Streamlit app.
+
+Usage:
+    python -m benchmarks.startup --out startup.json [--baseline old.json] [--repeat 3]
+
+Each scenario runs ``app.py`` once through Streamlit's AppTest in a fresh
+Python process, with one tab selected: ``home`` (the landing page), ``analyze``
+and ``chatbot``. For every run the child reports the time from interpreter
+start to the end of the first script run, the time of the script run alone,
+peak RSS, and which heavy components were loaded. Timings are summarised with
+the same statistics and baseline comparison as ``benchmarks.run``.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = {"home": "🏠 Home 🏡", "analyze": "🩺 Analyze 🔍", "chatbot": "💬 Chatbot 🤖"}
+HEAVY_MODULES = ["pandas", "cv2", "pytesseract", "langchain_groq", "reportlab", "faiss",
+                 "sentence_transformers", "src.pipeline", "src.chatbot"]
+
+
+def _child(scenario: str) -> None:
+    """Run one scenario in this process and print its measurements as JSON."""
+    import resource
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT_DIR, "app.py"), default_timeout=120)
+    at.session_state["main_tabs"] = SCENARIOS[scenario]
+    started = time.perf_counter()
+    at.run()
+    render_seconds = time.perf_counter() - started
+
+    from src.lazy import components
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "startup_seconds": time.time() - float(os.environ["BENCH_STARTED"]),
+        "render_seconds": render_seconds,
+        "rss_mb": rss_kb / 1024 if sys.platform != "darwin" else rss_kb / 1_048_576,
+        "modules": [name for name in HEAVY_MODULES if name in sys.modules],
+        "components": {name: round(info["seconds"], 4) for name, info in components.stats().items() if info["loaded"]},
+        "exceptions": [str(e.value) for e in at.exception],
+    }))
+
+
+def _run_scenario(scenario: str) -> Dict:
+    env = dict(os.environ, BENCH_STARTED=repr(time.time()), WARMUP_COMPONENTS="", METRICS_PORT="0")
+    env.setdefault("GROQ_API_KEY", "startup-bench")
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", scenario],
+                               cwd=ROOT_DIR, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{scenario} failed: {completed.stderr.strip()[-500:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold-start time and memory of the Streamlit app.")
+    parser.add_argument("--child", choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--out", default="startup.json", help="JSON results file")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change treated as significant")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any stage regressed")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per scenario")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args.child)
+        return 0
+
+    # Imported here so the measured child processes do not load reportlab via the corpus helpers.
+    from benchmarks.run import _git_commit, _stats, compare
+
+    samples: Dict[str, List[float]] = {}
+    scenarios: Dict[str, Dict] = {}
+    for scenario in args.scenario or list(SCENARIOS):
+        runs = [_run_scenario(scenario) for _ in range(args.repeat)]
+        samples[f"startup.{scenario}"] = [run["startup_seconds"] for run in runs]
+        samples[f"render.{scenario}"] = [run["render_seconds"] for run in runs]
+        last = runs[-1]
+        scenarios[scenario] = {"rss_mb": round(max(run["rss_mb"] for run in runs), 1), "modules": last["modules"],
+                               "components": last["components"], "exceptions": last["exceptions"]}
+        print(f"{scenario}: startup {min(samples[f'startup.{scenario}']):.2f}s, "
+              f"render {min(samples[f'render.{scenario}']):.2f}s, rss {scenarios[scenario]['rss_mb']:.0f} MB, "
+              f"loaded: {', '.join(last['modules']) or '-'}")
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "stages": {stage: _stats(values) for stage, values in samples.items()},
+        "scenarios": scenarios,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        results["comparison"] = compare(results["stages"], baseline.get("stages", {}), args.threshold)
+        print(f"\n{'stage':<32}{'baseline':>10}{'current':>10}{'change':>9}")
+        for stage, row in results["comparison"].items():
+            print(f"{stage:<32}{row['baseline']:>9.3f}s{row['current']:>9.3f}s{row['change']:>+8.1%}  {row['verdict']}")
+        regressions = [stage for stage, row in results["comparison"].items() if row["verdict"] == "regression"]
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nWrote {args.out}")
+    return 1 if args.fail_on_regression and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+import numpy as np
+from src.config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS
+from src.hybrid_retrieval import tokenize
+from src.tracing import registry, current_span
+
+logger = logging.getLogger(__name__)
+
+# Wording that does not change what a question asks; every other token (analytes, numbers, directions such as
+# "high"/"low", negations) must match for a cached answer to be reused.
+_GENERIC_TERMS = {
+    "about", "any", "am", "can", "could", "explain", "have", "has", "level", "levels", "mean", "means", "please",
+    "reading", "readings", "report", "result", "results", "should", "tell", "test", "tests", "value", "values",
+    "would", "whats", "s",
+}
+
+
+def question_terms(question: str) -> FrozenSet[str]:
+    """Content tokens of ``question`` that must be identical for two questions to share an answer."""
+    return frozenset(token for token in tokenize(question) if token not in _GENERIC_TERMS)
+
+
+class _Entry:
+    __slots__ = ("docs", "question", "terms", "vector", "answer", "created")
+
+    def __init__(self, docs: str, question: str, vector: np.ndarray, answer: str):
+        self.docs = docs
+        self.question = question
+        self.terms = question_terms(question)
+        self.vector = vector
+        self.answer = answer
+        self.created = time.time()
+
+
+class SemanticAnswerCache:
+    """
+    In-memory chatbot answers keyed by (document hashes, question embedding).
+
+    A lookup returns the stored answer of the most similar earlier question
+    about the same documents when the cosine similarity reaches ``threshold``
+    and both questions have the same ``question_terms``, so near misses such
+    as "is my HDL high?" and "is my LDL low?" never share an answer.
+    Entries expire after ``ttl_seconds`` and the least recently used entry is
+    evicted beyond ``max_entries``. Shared by every session in the process.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def docs_key(doc_hashes: Iterable[str]) -> str:
+        return ",".join(sorted(set(doc_hashes)))
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        return array / norm if norm else array
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created > self.ttl_seconds
+
+    def lookup(self, doc_hashes: Iterable[str], question: str, vector: List[float]) -> Optional[str]:
+        """Return the cached answer for a similar question about the same documents, or None."""
+        docs = self.docs_key(doc_hashes)
+        terms = question_terms(question)
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[entry_id]
+                    self.evictions += 1
+                    continue
+                if entry.docs == docs and entry.terms == terms and entry.vector.shape == query.shape:
+                    score = float(np.dot(entry.vector, query))
+                    if score >= best_score:
+                        best_id, best_score = entry_id, score
+            if best_id is not None:
+                self._entries.move_to_end(best_id)
+                self.hits += 1
+                answer = self._entries[best_id].answer
+            else:
+                self.misses += 1
+                answer = None
+        registry.inc("answer_cache_requests_total", result="hit" if answer is not None else "miss")
+        active = current_span()
+        if active is not None:
+            active.set(answer_cache="hit" if answer is not None else "miss")
+            if answer is not None:
+                active.set(similarity=round(best_score, 4))
+        return answer
+
+    def store(self, doc_hashes: Iterable[str], question: str, vector: List[float], answer: str) -> None:
+        if not answer:
+            return
+        entry = _Entry(self.docs_key(doc_hashes), question, self._normalize(vector), answer)
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, doc_hash: Optional[str] = None) -> None:
+        """Drop answers involving ``doc_hash``, or every answer when omitted."""
+        with self._lock:
+            if doc_hash is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [entry_id for entry_id, entry in self._entries.items() if doc_hash in entry.docs.split(",")]
+                for entry_id in stale:
+                    del self._entries[entry_id]
+                removed = len(stale)
+        logger.info(f"Answer cache invalidated {removed} entries for {doc_hash[:12] if doc_hash else 'all documents'}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+            }
+
+
+answer_cache = SemanticAnswerCache()
+registry.gauge("answer_cache_entries", "Answers held by the semantic answer cache.",
+               lambda: [({}, answer_cache.stats()["entries"])])
@@ -0,0 +1,219 @@
+"""
+Headless batch analysis of archived reports.
+
+Usage:
+    python -m src.batch INPUT --out results.jsonl [--workers 4] [--pdf-dir pdfs/]
+
+INPUT is a directory (searched recursively for PDFs and images) or a manifest
+file listing one report path per line. Each finished report is appended to the
+JSONL output immediately; rerunning with the same ``--out`` skips reports that
+already have a successful record, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Set
+
+from src.cache import hash_bytes
+from src.ocr import extract_text, IMAGE_EXTENSIONS
+from src.nlp import structure_data
+from src.categorize import categorize_results
+from src.table_formatter import format_results_for_table
+from src.explain import explain_results_batch, EXPLANATION_ERROR
+from src.summary import generate_summary_bullet_points, SUMMARY_ERROR
+from src.pdf_generator import generate_pdf_summary
+from src.pipeline import split_results
+from src.llm_scheduler import llm_priority
+from src.config import llm_scheduler
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+REPORT_EXTENSIONS = (".pdf",) + IMAGE_EXTENSIONS
+
+
+def discover_reports(source: str) -> List[str]:
+    """List report files from a directory tree or a manifest with one path per line."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(REPORT_EXTENSIONS))
+        return sorted(paths)
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return [line if os.path.isabs(line) else os.path.join(base, line) for line in lines]
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    """Return the paths that already have a successful record in ``output_path``."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a torn line; repair_checkpoint drops it before appending
+            if record.get("status") == "ok":
+                done.add(record["file"])
+    return done
+
+
+def repair_checkpoint(output_path: str) -> None:
+    """
+    Make ``output_path`` end with a complete line before records are appended:
+    a last record missing only its newline is terminated, a torn one from an
+    interrupted run is truncated away.
+    """
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position == end:
+            return
+        f.seek(position)
+        tail = f.read()
+        try:
+            json.loads(tail)
+            f.write(b"\n")
+        except ValueError:
+            logger.warning(f"Dropping {end - position} bytes of an incomplete record at the end of {output_path}")
+            f.truncate(position)
+
+
+def analyze_report(path: str, pdf_dir: str = None) -> Dict:
+    """Run the full analysis pipeline on one file and return its JSONL record."""
+    timings: Dict[str, float] = {}
+    record: Dict = {"file": path, "status": "error"}
+    started = time.perf_counter()
+
+    def timed(stage, func, *args):
+        stage_started = time.perf_counter()
+        try:
+            with span(stage, kind="stage"):
+                return func(*args)
+        finally:
+            timings[stage] = round(time.perf_counter() - stage_started, 3)
+
+    try:
+        with open(path, "rb") as f:
+            record["sha256"] = hash_bytes(f.read())
+
+        raw_text = timed("extract", extract_text, path)
+        if not raw_text:
+            raise ValueError("Text extraction failed")
+        structured = timed("structure", structure_data, raw_text)
+        if not structured:
+            raise ValueError("Data structuring failed")
+        categorized = timed("categorize", categorize_results, structured)
+        test_results, metadata = split_results(categorized)
+        record["metadata"] = metadata
+        record["tests"] = timed("table", format_results_for_table, test_results) if test_results else []
+
+        explanation = timed("explain", explain_results_batch, test_results) if test_results else ""
+        if explanation == EXPLANATION_ERROR:
+            raise ValueError("Explanation failed")
+        summary = timed("summary", generate_summary_bullet_points, explanation) if explanation else ""
+        if summary == SUMMARY_ERROR:
+            raise ValueError("Summary failed")
+        record["explanation"] = explanation
+        record["summary"] = summary
+
+        if pdf_dir:
+            pdf_bytes = timed("pdf", generate_pdf_summary, categorized, explanation, summary)
+            pdf_path = os.path.join(pdf_dir, f"{record['sha256'][:16]}_{os.path.splitext(os.path.basename(path))[0]}.pdf")
+            with open(pdf_path, "wb") as f:
+                f.write(pdf_bytes)
+            record["pdf"] = pdf_path
+        record["status"] = "ok"
+    except Exception as e:
+        logger.error(f"Batch analysis failed for {path}: {str(e)}")
+        record["error"] = str(e)
+
+    record["timings"] = timings
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def _analyze_at_batch_priority(path: str, pdf_dir: str = None) -> Dict:
+    """Analyze one report with its LLM calls queued behind interactive chat."""
+    with llm_priority("batch"):
+        return analyze_report(path, pdf_dir)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def print_summary(records: List[Dict], skipped: int, wall_seconds: float) -> None:
+    ok = [r for r in records if r["status"] == "ok"]
+    latencies = [r["seconds"] for r in records]
+    print(f"\nProcessed {len(records)} reports in {wall_seconds:.1f}s "
+          f"({len(ok)} ok, {len(records) - len(ok)} failed, {skipped} skipped from checkpoint)")
+    if not latencies:
+        return
+    print(f"Throughput: {len(records) / wall_seconds * 60:.1f} reports/min")
+    print(f"Latency: p50 {statistics.median(latencies):.2f}s, p95 {_percentile(latencies, 0.95):.2f}s, "
+          f"max {max(latencies):.2f}s")
+    stages: Dict[str, List[float]] = {}
+    for record in records:
+        for stage, seconds in record["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+    for stage, values in stages.items():
+        print(f"  {stage:<10} mean {statistics.mean(values):.2f}s  max {max(values):.2f}s")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Analyze a directory or manifest of medical reports.")
+    parser.add_argument("input", help="Directory of reports or manifest file with one path per line")
+    parser.add_argument("--out", default="batch_results.jsonl", help="JSONL output (also the resume checkpoint)")
+    parser.add_argument("--workers", type=int, default=4, help="Reports analyzed concurrently")
+    parser.add_argument("--pdf-dir", default=None, help="Write a PDF summary per report to this directory")
+    args = parser.parse_args(argv)
+
+    paths = discover_reports(args.input)
+    repair_checkpoint(args.out)
+    done = load_checkpoint(args.out)
+    pending = [p for p in paths if p not in done]
+    logger.info(f"Batch: {len(paths)} reports found, {len(done)} already done, {len(pending)} to process")
+    if args.pdf_dir:
+        os.makedirs(args.pdf_dir, exist_ok=True)
+
+    records = []
+    started = time.perf_counter()
+    with open(args.out, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(_analyze_at_batch_priority, path, args.pdf_dir) for path in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            records.append(record)
+            print(f"[{len(records)}/{len(pending)}] {record['status']:<5} {record['seconds']:>7.2f}s  {record['file']}")
+
+    print_summary(records, len(paths) - len(pending), time.perf_counter() - started)
+    scheduler = llm_scheduler.metrics()
+    print(f"LLM calls: {scheduler['completed']} ok, {scheduler['retries']} retried, "
+          f"{scheduler['rate_limited']} rate-limited, avg queue wait {scheduler['avg_wait_ms']:.0f}ms")
+    return 0 if all(r["status"] == "ok" for r in records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
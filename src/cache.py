@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src.config import CACHE_DIR, CACHE_TTL_SECONDS, CACHE_MAX_BYTES, MODEL_NAME
+from src.tracing import registry, current_span
+
+logger = logging.getLogger(__name__)
+
+
+def hash_bytes(data: bytes) -> str:
+    """Return the SHA-256 hex digest used to address an uploaded file."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class PipelineCache:
+    """
+    On-disk, content-addressed cache for analysis pipeline stages.
+
+    Entries live under ``<cache_dir>/<file_hash>/<stage>-<digest>.json`` so a
+    whole report can be invalidated by removing its directory. Entries expire
+    after ``ttl_seconds`` and the least recently used ones are evicted once
+    the cache grows past ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = self._disk_usage()
+
+    def stage_key(self, file_hash: str, stage: str, prompt_version: str,
+                  model_name: str = MODEL_NAME, parent_key: str = "") -> str:
+        """
+        Build the cache key for one stage of one file.
+
+        ``parent_key`` chains the key of the stage that produced this stage's
+        input, so bumping an upstream prompt version also invalidates every
+        downstream entry.
+        """
+        material = "|".join([file_hash, stage, prompt_version, model_name, parent_key])
+        digest = hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+        return f"{file_hash}/{stage}-{digest}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, *key.split("/")) + ".json"
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        """The stored entry for ``key``, or None when missing or expired (expired entries are removed)."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get("created", 0) > self.ttl_seconds:
+            logger.info(f"Cache entry expired: {key}")
+            self._remove(path)
+            return None
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for ``key`` or ``default`` on a miss."""
+        entry = self._read(key)
+        if entry is None:
+            self._record_lookup(key, hit=False)
+            return default
+
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        self._record_lookup(key, hit=True)
+        return entry["value"]
+
+    def contains(self, key: str) -> bool:
+        """Whether ``get`` would return an entry for ``key``, without counting a lookup or refreshing its recency."""
+        return self._read(key) is not None
+
+    def _record_lookup(self, key: str, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        stage = key.split("/")[-1].rsplit("-", 1)[0]
+        registry.inc("cache_requests_total", stage=stage, result="hit" if hit else "miss")
+        active = current_span()
+        if active is not None:
+            active.set(cache="hit" if hit else "miss")
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value under ``key``."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {str(e)}")
+            return
+        with self._lock:
+            self._size += len(payload.encode("utf-8")) - previous
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any],
+                       should_cache: Callable[[Any], bool] = bool) -> Any:
+        """
+        Return the cached value for ``key``, computing and storing it on a miss.
+
+        Results rejected by ``should_cache`` (empty lists, error strings) are
+        returned but not stored, so a failed LLM call is retried next time.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            logger.info(f"Cache hit: {key}")
+            return value
+        value = compute()
+        if should_cache(value):
+            self.set(key, value)
+        return value
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                              should_cache: Callable[[Any], bool] = bool) -> Any:
+        """Async variant of get_or_compute for coroutine-producing stages."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            logger.info(f"Cache hit: {key}")
+            return value
+        value = await compute()
+        if should_cache(value):
+            self.set(key, value)
+        return value
+
+    def invalidate(self, file_hash: Optional[str] = None) -> None:
+        """Drop all entries for ``file_hash``, or the whole cache when omitted."""
+        target = os.path.join(self.cache_dir, file_hash) if file_hash else self.cache_dir
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock:
+            self._size = self._disk_usage()
+        logger.info(f"Cache invalidated: {file_hash or 'all entries'}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current disk usage."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        except OSError:
+            return
+        with self._lock:
+            self._size -= size
+
+    def _evict(self) -> None:
+        """Remove expired entries, then least recently used ones, down to 90% of the budget."""
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for path, _, mtime in entries:
+            with self._lock:
+                done = self._size <= target
+            if done and now - mtime <= self.ttl_seconds:
+                continue
+            self._remove(path)
+            removed += 1
+        logger.info(f"Cache eviction removed {removed} entries")
+
+
+pipeline_cache = PipelineCache()
+registry.gauge("cache_bytes", "Bytes stored in the pipeline cache.", lambda: [({}, pipeline_cache.stats()["bytes"])])
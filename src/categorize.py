@@ -1,73 +1,119 @@
 import logging
-import os
 from dotenv import load_dotenv
 from langchain_core.messages import SystemMessage, HumanMessage
 import json
 from src.config import llm, GROQ_API_KEY
+from src.reference_ranges import categorize_locally
+from src.prompt_format import ROW_ID, encode_rows, decode_rows, index_by_row_id
 from typing import List, Dict
 
 load_dotenv()
 
-os.makedirs(os.path.join("logs"), exist_ok=True) 
-logging.basicConfig( 
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join("logs", "app.log")),
-        logging.StreamHandler()
-    ]
-)
+logger = logging.getLogger(__name__)
     
+PROMPT_VERSION = "3"
+
+STATUS_COLUMNS = [ROW_ID, "status"]
+
+def _merge_llm_results(categorized: List[Dict], unresolved: List[int], pending: List[Dict], llm_results: List[Dict]) -> List[Dict]:
+    if llm_results is pending or len(llm_results) != len(pending):
+        logger.warning("LLM categorization did not return one row per input; keeping local results")
+        return categorized
+    for i, row in zip(unresolved, llm_results):
+        categorized[i] = row
+    return categorized
+
 def categorize_results(results: List[Dict]) -> List[Dict]:
     """
-    Use Groq LLM to categorize medical report data based on provided fields.
+    Categorize medical report data, deciding rows with a numeric value and reference
+    range locally and sending only the remaining test rows to the LLM.
     Returns the list of dictionaries with a 'status' field added where applicable.
     """
-    logging.info("Categorizing medical report data using LLM")
-    try:
-        results_text = json.dumps(results, indent=2)
-        
-        prompt = f"""
-        You are an expert medical data categorizer with deep knowledge of medical reports.
+    categorized, unresolved = categorize_locally(results)
+    if not unresolved:
+        logger.info("All rows categorized locally; skipping LLM categorization")
+        return categorized
+    pending = [results[i] for i in unresolved]
+    return _merge_llm_results(categorized, unresolved, pending, categorize_with_llm(pending))
+
+async def acategorize_results(results: List[Dict]) -> List[Dict]:
+    """Async variant of categorize_results using llm.ainvoke for unresolved rows."""
+    categorized, unresolved = categorize_locally(results)
+    if not unresolved:
+        logger.info("All rows categorized locally; skipping LLM categorization")
+        return categorized
+    pending = [results[i] for i in unresolved]
+    return _merge_llm_results(categorized, unresolved, pending, await acategorize_with_llm(pending))
+
+def _build_categorization_messages(results: List[Dict]) -> list:
+    results_text = encode_rows(results)
+
+    prompt = f"""
+    You are an expert medical data categorizer with deep knowledge of medical reports.
+
+    Given the following medical report data (e.g., test results, patient metadata, or other fields), analyze each entry and assign a 'status' field with one of the values: 'Critical', 'Borderline', 'Normal', or 'Unknown'. Categorize based solely on the provided data, using your medical expertise to interpret the values and context. The data can contain any fields (e.g., test names, values, ranges, units, patient info, or others), and you should not assume specific fields are present.
+
+    **Important Instructions:**
+    - For entries likely representing test results (e.g., containing fields like test_name, value, or similar), assign a status based on the provided data:
+      - Use 'Normal' if the data indicates a value within typical medical norms (e.g., based on a range or medical context).
+      - Use 'Borderline' if the data suggests a value slightly outside typical norms.
+      - Use 'Critical' if the data indicates a value significantly outside typical norms.
+      - Use 'Unknown' if insufficient data is provided to determine status (e.g., missing values or context).
+    - For non-test entries (e.g., patient_name, age, date), do not add a 'status' field unless the data directly informs a medical categorization (e.g., age indicating risk).
+    - Do **not** perform numerical calculations or assume specific fields (e.g., value, normal_range) are present.
+    - Do **not** guess or hallucinate information not provided in the input.
+    - The input is a JSON object: "columns" lists the field names once and each entry of "rows" holds one entry's values in that order, starting with its ID (null means the field is absent).
+    - Return one [id, status] pair per entry that gets a status, as a compact JSON array, e.g. [["r0","Normal"],["r1","Critical"]].
+    - Return **only** the JSON array — no explanations, no markdown, no code formatting, no comments.
 
-        Given the following list of dictionaries containing medical report data (e.g., test results, patient metadata, or other fields), analyze each entry and assign a 'status' field with one of the values: 'Critical', 'Borderline', 'Normal', or 'Unknown'. Categorize based solely on the provided data, using your medical expertise to interpret the values and context. The data can contain any fields (e.g., test names, values, ranges, units, patient info, or others), and you should not assume specific fields are present.
+    Input Data:
+    {results_text}
+    """
+
+    return [
+        SystemMessage(content="You are an expert medical data categorizer."),
+        HumanMessage(content=prompt)
+    ]
 
-        **Important Instructions:**
-        - For entries likely representing test results (e.g., containing fields like test_name, value, or similar), assign a status based on the provided data:
-          - Use 'Normal' if the data indicates a value within typical medical norms (e.g., based on a range or medical context).
-          - Use 'Borderline' if the data suggests a value slightly outside typical norms.
-          - Use 'Critical' if the data indicates a value significantly outside typical norms.
-          - Use 'Unknown' if insufficient data is provided to determine status (e.g., missing values or context).
-        - For non-test entries (e.g., patient_name, age, date), do not add a 'status' field unless the data directly informs a medical categorization (e.g., age indicating risk).
-        - Do **not** perform numerical calculations or assume specific fields (e.g., value, normal_range) are present.
-        - Do **not** guess or hallucinate information not provided in the input.
-        - Return the original list of dictionaries, updated with a 'status' field where applicable, as a JSON array.
-        - Return **only** the JSON array — no explanations, no markdown, no code formatting, no comments.
+def _parse_categorization(content: str, results: List[Dict]) -> List[Dict]:
+    try:
+        returned = decode_rows(json.loads(content.strip()), STATUS_COLUMNS)
+        if returned is None:
+            logger.warning("LLM returned an unexpected response shape for categorization")
+            return results
+        if returned and not any(ROW_ID in row for row in returned) and len(returned) == len(results):
+            # Old list-of-dicts shape (the input rows with a status added): match rows by position.
+            statuses = dict(enumerate(returned))
+        else:
+            statuses = index_by_row_id(returned, len(results))
+        logger.info(f"Categorized {len(statuses)} of {len(results)} results")
+        return [dict(row, status=statuses[i]["status"]) if statuses.get(i, {}).get("status") else row
+                for i, row in enumerate(results)]
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse LLM categorization response as JSON: {str(e)}")
+        return results
 
-        Input Data:
-        {results_text}
-        """
-        
-        messages = [
-            SystemMessage(content="You are an expert medical data categorizer."),
-            HumanMessage(content=prompt)
-        ]
-        
-        response = llm.invoke(messages)
-        logging.info("✅ Response received from Groq for categorization")
-        
-        try:
-            categorized_results = json.loads(response.content.strip())
-            if not isinstance(categorized_results, list):
-                logging.warning("LLM returned non-list response for categorization")
-                return results
-            logging.info(f"Categorized {len(categorized_results)} results")
-            return categorized_results
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse LLM categorization response as JSON: {str(e)}")
-            return results  
+def categorize_with_llm(results: List[Dict]) -> List[Dict]:
+    """
+    Use Groq LLM to categorize medical report data based on provided fields.
+    Returns the list of dictionaries with a 'status' field added where applicable.
+    """
+    logger.info(f"Categorizing {len(results)} rows using LLM")
+    try:
+        response = llm.invoke(_build_categorization_messages(results))
+        logger.info("✅ Response received from Groq for categorization")
+        return _parse_categorization(response.content, results)
     except Exception as e:
-        logging.exception(f"LLM categorization failed: {str(e)}")
-        return results  
+        logger.exception(f"LLM categorization failed: {str(e)}")
+        return results
 
-    
\ No newline at end of file
+async def acategorize_with_llm(results: List[Dict]) -> List[Dict]:
+    """Async variant of categorize_with_llm."""
+    logger.info(f"Categorizing {len(results)} rows using LLM (async)")
+    try:
+        response = await llm.ainvoke(_build_categorization_messages(results))
+        logger.info("✅ Response received from Groq for categorization")
+        return _parse_categorization(response.content, results)
+    except Exception as e:
+        logger.exception(f"LLM categorization failed: {str(e)}")
+        return results
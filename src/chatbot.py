@@ -1,24 +1,23 @@
 import os
+import re
+import time
 import logging
 import streamlit as st
 from langchain_groq import ChatGroq
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.schema import Document
 from langchain_core.callbacks import BaseCallbackHandler
-from langchain.embeddings import HuggingFaceEmbeddings
-from src.ocr import extract_text
-from langchain_community.document_loaders import PyPDFLoader
-
-os.makedirs(os.path.join("logs"), exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join("logs", "app.log")),
-        logging.StreamHandler()
-    ]
-)
+from src.cache import hash_bytes
+from src.vector_store import get_index_store
+from src.embeddings import get_embedding_service
+from src.config import llm_scheduler, LOG_QA_CHARS, RETRIEVAL_MODE, RETRIEVAL_K, RETRIEVAL_FETCH_K
+from src.hybrid_retrieval import HybridRetriever
+from src.answer_cache import answer_cache
+from src.logging_setup import truncate
+from src.llm_scheduler import ScheduledChatModel
+from src.tracing import span, registry
+from src.query_router import ResultIndex, route_question
+from src.lazy import components
+
+logger = logging.getLogger(__name__)
 
 grok_api_key = os.getenv("GROQ_API_KEY")
 if not grok_api_key:
@@ -49,44 +48,126 @@ class StreamHandler(BaseCallbackHandler):
         self.container.markdown(self.text)
 
 def configure_llm():
-    llm = ChatGroq(model_name="meta-llama/llama-4-scout-17b-16e-instruct", temperature=0.3, groq_api_key=grok_api_key)
+    llm = ChatGroq(model_name="meta-llama/llama-4-scout-17b-16e-instruct", temperature=0.3, groq_api_key=grok_api_key, max_retries=0)
+    # Chat shares the analysis rate limits but is admitted ahead of queued analysis calls.
+    llm = ScheduledChatModel(llm, llm_scheduler, priority="interactive")
     st.sidebar.success("✅ Active Model: LLaMA 4")
     return llm
 
 def configure_embedding_model():
-    return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    return get_embedding_service()
 
 def process_file(file):
-    folder = "tmp"
-    os.makedirs(folder, exist_ok=True)
-    file_path = os.path.join(folder, file.name)
-    with open(file_path, "wb") as f:
-        f.write(file.getvalue())
-    try:
-        if file.name.lower().endswith(('.png', '.jpg', '.jpeg')):
-            text = extract_text(file_path)
-        else:  # PDF
-            loader = PyPDFLoader(file_path)
-            text = "\n".join([page.page_content for page in loader.load()])
-        return text
-    finally:
-        os.unlink(file_path)
+    """Text of an uploaded file, parsed from memory (shared with the analysis through its text cache)."""
+    return components.get("pipeline").extract_uploaded_text(file.name, file.getbuffer())
 
 def setup_retrieval_system(uploaded_files):
-    docs = []
+    """
+    Return a retriever over ``uploaded_files`` without re-embedding known documents.
+
+    Per-document indexes are persisted by hash and shared across sessions; the
+    combined index lives in the session and is only extended when a new file
+    appears, or re-merged from cached indexes when a file is removed.
+    """
+    store = get_index_store(configure_embedding_model)
+    doc_hashes = []
     for file in uploaded_files:
-        text = process_file(file)
-        if text:
-            docs.append(Document(page_content=text))
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    splits = text_splitter.split_documents(docs)
-    embedding_model = configure_embedding_model()
-    vector_db = FAISS.from_documents(documents=splits, embedding=embedding_model)
-    return vector_db.as_retriever(search_type="mmr", search_kwargs={"k": 2, "fetch_k": 4})
+        doc_hash = hash_bytes(file.getbuffer())
+        if doc_hash in doc_hashes:
+            continue
+        if store.get_index(doc_hash, lambda file=file: process_file(file), source=file.name) is not None:
+            doc_hashes.append(doc_hash)
+
+    session_index = st.session_state.get("vector_index")
+    if session_index and session_index["hashes"] == doc_hashes:
+        return session_index["retriever"]
+
+    if session_index and set(session_index["hashes"]).issubset(doc_hashes):
+        vector_db = session_index["db"]
+        for doc_hash in doc_hashes:
+            if doc_hash not in session_index["hashes"]:
+                logger.info(f"Adding document {doc_hash[:12]} to session index")
+                store.extend(vector_db, doc_hash)
+    else:
+        vector_db = store.combine(doc_hashes)
+    if vector_db is None:
+        return None
+
+    if RETRIEVAL_MODE == "vector":
+        retriever = vector_db.as_retriever(search_type="mmr", search_kwargs={"k": RETRIEVAL_K, "fetch_k": RETRIEVAL_FETCH_K})
+    else:
+        retriever = HybridRetriever(vector_store=vector_db, lexical_index=store.combine_lexical(doc_hashes))
+    st.session_state["vector_index"] = {"hashes": doc_hashes, "db": vector_db, "retriever": retriever}
+    return retriever
+
+def stream_answer(llm, retriever, user_query):
+    """Yield the answer to ``user_query`` token by token, grounded in the retrieved report chunks."""
+    registry.inc("chat_route_total", route="rag")
+    with span("chat_turn", kind="stage", route="rag"):
+        with span("search", kind="retrieval") as search_span:
+            retrieved_docs = retriever.invoke(user_query) if retriever else []
+            elapsed = time.perf_counter() - search_span.started
+            vector_seconds = elapsed - search_span.child_seconds.get("embed", 0.0) - search_span.child_seconds.get("bm25", 0.0)
+            search_span.set(chunks=len(retrieved_docs), faiss_seconds=vector_seconds)
+        context = "\n".join([doc.page_content for doc in retrieved_docs])
+        prompt = f"Based on this context: {context}\n\nUser question: {user_query}\nAnswer:"
+        for token in llm.stream(prompt):
+            yield next(iter(token.content.values())) if isinstance(token.content, dict) else token.content
+
+def analyzed_rows(uploaded_files):
+    """
+    Table rows the Analyze tab stored for ``uploaded_files``, or None unless
+    every file has been analyzed (a partial index would give incomplete answers).
+    """
+    stored = st.session_state.get("analysis_rows", {})
+    rows = []
+    for file in uploaded_files:
+        doc_rows = stored.get(hash_bytes(file.getbuffer()))
+        if doc_rows is None:
+            return None
+        rows.extend(doc_rows)
+    return rows
+
+def answer_from_results(uploaded_files, user_query):
+    """Answer factual questions from the analyzed rows; None means the question needs retrieval + LLM."""
+    rows = analyzed_rows(uploaded_files)
+    if not rows:
+        return None
+    with span("route_question", kind="router", rows=len(rows)) as route_span:
+        answer = route_question(user_query, ResultIndex(rows))
+        route_span.set(route="rag" if answer is None else "structured")
+    if answer is not None:
+        registry.inc("chat_route_total", route="structured")
+    return answer
+
+def replay_answer(answer, words_per_chunk=4):
+    """Yield a stored answer in small chunks so it renders like a streamed one."""
+    words = re.findall(r"\S+\s*", answer)
+    for i in range(0, len(words), words_per_chunk):
+        yield "".join(words[i:i + words_per_chunk])
+
+def chat_answer(llm, get_retriever, user_query, doc_hashes):
+    """
+    Yield the answer to ``user_query``, reusing a cached answer to a similar
+    question about the same documents. Retrieval is only set up on a miss, and
+    a fully streamed answer is stored for later questions.
+    """
+    with span("answer_cache", kind="cache"):
+        query_vector = get_embedding_service().embed_query(user_query)
+        cached = answer_cache.lookup(doc_hashes, user_query, query_vector)
+    if cached is not None:
+        registry.inc("chat_route_total", route="cache")
+        yield from replay_answer(cached)
+        return
+    response = ""
+    for token_text in stream_answer(llm, get_retriever(), user_query):
+        response += token_text
+        yield token_text
+    answer_cache.store(doc_hashes, user_query, query_vector, response)
 
 def print_qa(question, answer):
-    log_str = f"\nUsecase: MedicalChatbot\nQuestion: {question}\nAnswer: {answer}\n" + "-" * 50
-    logging.info(log_str)
+    logger.info(f"MedicalChatbot Q&A ({len(question)}/{len(answer)} chars): "
+                f"question={truncate(question, LOG_QA_CHARS)!r} answer={truncate(answer, LOG_QA_CHARS)!r}")
 
 class MedicalChatbot:
     def __init__(self, uploaded_files=None):
@@ -112,22 +193,48 @@ class MedicalChatbot:
             with st.container():
                 user_query = st.chat_input(placeholder="🔎 Ask something about your medical report!")
                 if user_query:
-                    retriever = setup_retrieval_system(self.uploaded_files)
+                    direct_answer = answer_from_results(self.uploaded_files, user_query)
                     display_msg(user_query, "user")
-                    with st.chat_message("assistant"):
-                        stream_container = st.empty()
-                        stream_handler = StreamHandler(stream_container)
-                        retrieved_docs = retriever.get_relevant_documents(user_query)
-                        context = "\n".join([doc.page_content for doc in retrieved_docs])
-                        prompt = f"Based on this context: {context}\n\nUser question: {user_query}\nAnswer:"
-                        response = ""
-                        for token in self.llm.stream(prompt):
-                            token_text = next(iter(token.content.values())) if isinstance(token.content, dict) else token.content
-                            response += token_text
-                            stream_handler.on_llm_new_token(token_text)
-                        stream_container.markdown(response)
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                        print_qa(user_query, response)
+                    if direct_answer is not None:
+                        display_msg(direct_answer, "assistant")
+                        print_qa(user_query, direct_answer)
+                    else:
+                        doc_hashes = [hash_bytes(file.getbuffer()) for file in self.uploaded_files]
+                        with st.chat_message("assistant"):
+                            stream_container = st.empty()
+                            stream_handler = StreamHandler(stream_container)
+                            response = ""
+                            for token_text in chat_answer(self.llm, lambda: setup_retrieval_system(self.uploaded_files),
+                                                          user_query, doc_hashes):
+                                response += token_text
+                                stream_handler.on_llm_new_token(token_text)
+                            stream_container.markdown(response)
+                            st.session_state.messages.append({"role": "assistant", "content": response})
+                            print_qa(user_query, response)
+
+            with st.sidebar.expander("💾 Answer Cache"):
+                answer_stats = answer_cache.stats()
+                st.markdown(
+                    f"<p style='color:#00e5ff'>Hits: <b>{answer_stats['hits']}</b> · Misses: <b>{answer_stats['misses']}</b> · "
+                    f"Hit rate: <b>{answer_stats['hit_rate']:.0%}</b><br>"
+                    f"Entries: <b>{answer_stats['entries']}</b> / {answer_stats['max_entries']} · "
+                    f"Evicted: <b>{answer_stats['evictions']}</b></p>",
+                    unsafe_allow_html=True
+                )
+                if st.button("🧹 Clear Answers"):
+                    for file in self.uploaded_files:
+                        answer_cache.invalidate(hash_bytes(file.getbuffer()))
+                    st.success("✅ Cached answers for these reports cleared.")
+
+            with st.sidebar.expander("🧮 Embedding Service"):
+                embed_stats = get_embedding_service().stats()
+                st.markdown(
+                    f"<p style='color:#00e5ff'>Throughput: <b>{embed_stats['texts_per_second']:.0f}</b> texts/s · "
+                    f"Avg batch: <b>{embed_stats['avg_batch_size']:.1f}</b><br>"
+                    f"Queue depth: <b>{embed_stats['queue_depth']}</b> (max {embed_stats['max_queue_depth']}) · "
+                    f"Avg wait: <b>{embed_stats['avg_queue_wait_ms']:.1f} ms</b></p>",
+                    unsafe_allow_html=True
+                )
 
 if __name__ == "__main__":
     obj = MedicalChatbot()
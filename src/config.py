@@ -1,29 +1,117 @@
 import logging
 import os
-from langchain_groq import ChatGroq
 from dotenv import load_dotenv
+from src.llm_scheduler import LLMScheduler, ScheduledChatModel
+from src.tracing import registry
+from src.logging_setup import configure_logging, parse_levels
+from src.lazy import components
 
 load_dotenv()
 
-os.makedirs(os.path.join("logs"), exist_ok=True) 
-logging.basicConfig(
-    level=logging.INFO, 
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join("logs", "app.log")),
-        logging.StreamHandler()
-    ]
-)
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per-logger overrides, e.g. "src.nlp=DEBUG,httpx=WARNING".
+LOG_LEVELS = parse_levels(os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+LOG_QA_CHARS = int(os.getenv("LOG_QA_CHARS", "200"))
+
+configure_logging(log_dir=LOG_DIR, level=LOG_LEVEL, module_levels=LOG_LEVELS, max_bytes=LOG_MAX_BYTES,
+                  backup_count=LOG_BACKUP_COUNT, max_field_chars=LOG_MAX_FIELD_CHARS)
+logger = logging.getLogger(__name__)
 
 try:
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-    logging.info("GROQ_API_KEY environment variable not set")
+    logger.info("GROQ_API_KEY environment variable not set")
 except Exception as e:
-    logging.exception("Failed to initialize API for categorization")
+    logger.exception("Failed to initialize API for categorization")
     raise ValueError("GROQ_API_KEY environment variable not set")
 
-try:
-    llm = ChatGroq(api_key=GROQ_API_KEY, model="meta-llama/llama-4-scout-17b-16e-instruct")
-except Exception as e:
-    logging.exception("Failed to initialize Groq client for categorization")
-    raise
\ No newline at end of file
+MODEL_NAME = os.getenv("GROQ_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join("cache", "pipeline"))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+INDEX_DIR = os.getenv("INDEX_DIR", os.path.join("cache", "indexes"))
+# Opt-in: re-analyze a revised report (e.g. a lab reissue with one corrected value) from its text diff against its
+# earlier revision, reusing the rows and explanations the change does not touch. Only an upload with the same file
+# name and patient/report IDs in the same session counts as a revision; reports from one template score ~0.75.
+INCREMENTAL_ANALYSIS = os.getenv("INCREMENTAL_ANALYSIS", "false").lower() in ("1", "true", "yes")
+INCREMENTAL_MIN_SIMILARITY = float(os.getenv("INCREMENTAL_MIN_SIMILARITY", "0.9"))
+INCREMENTAL_CONTEXT_LINES = int(os.getenv("INCREMENTAL_CONTEXT_LINES", "1"))
+INCREMENTAL_HISTORY = int(os.getenv("INCREMENTAL_HISTORY", "50"))
+# Analyzed rows of every report, kept for trend queries across reports.
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", os.path.join("cache", "results.sqlite3"))
+
+# Chatbot retrieval: "hybrid" fuses BM25 and vector rankings with reciprocal-rank fusion, "vector" is vector-only.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "2"))
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "8"))
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+RETRIEVAL_VECTOR_WEIGHT = float(os.getenv("RETRIEVAL_VECTOR_WEIGHT", "1.0"))
+RETRIEVAL_LEXICAL_WEIGHT = float(os.getenv("RETRIEVAL_LEXICAL_WEIGHT", "1.0"))
+
+# Chatbot answers reused for questions at least this similar (cosine) about the same documents and with the same
+# analyte, number and direction terms (see src.answer_cache.question_terms).
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "10"))
+
+BORDERLINE_MARGIN = float(os.getenv("BORDERLINE_MARGIN", "0.0"))
+CRITICAL_MARGIN = float(os.getenv("CRITICAL_MARGIN", "0.2"))
+
+FUSED_PIPELINE = os.getenv("FUSED_PIPELINE", "false").lower() in ("1", "true", "yes")
+STAGE_TIMEOUT_SECONDS = float(os.getenv("STAGE_TIMEOUT_SECONDS", "120"))
+
+CHUNK_THRESHOLD_CHARS = int(os.getenv("CHUNK_THRESHOLD_CHARS", "16000"))
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "12000"))
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "4"))
+# Uploaded files analyzed at the same time within one session.
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "3"))
+
+# Shared by every LLM call in the process; defaults match Groq's free tier.
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "1024"))
+
+llm_scheduler = LLMScheduler(
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_retries=LLM_MAX_RETRIES,
+    backoff_base=LLM_BACKOFF_BASE_SECONDS,
+    backoff_max=LLM_BACKOFF_MAX_SECONDS,
+    expected_output_tokens=LLM_EXPECTED_OUTPUT_TOKENS,
+)
+registry.gauge("llm_queue_depth", "LLM calls waiting in the scheduler, by priority.",
+               lambda: [({"priority": p}, n) for p, n in llm_scheduler.metrics()["queued"].items()])
+registry.gauge("llm_in_flight", "LLM calls currently admitted by the scheduler.",
+               lambda: [({}, llm_scheduler.metrics()["active"])])
+
+# Show per-stage latency percentiles in the sidebar (METRICS_FILE / METRICS_PORT are read by src.tracing).
+LATENCY_PANEL = os.getenv("LATENCY_PANEL", "false").lower() in ("1", "true", "yes")
+
+# Components loaded in the background after the first page render, e.g. "pipeline,chat_model".
+WARMUP_COMPONENTS = [name.strip() for name in os.getenv("WARMUP_COMPONENTS", "").split(",") if name.strip()]
+
+def _build_chat_model():
+    """Create the Groq client; importing langchain_groq is deferred until the first LLM call."""
+    from langchain_groq import ChatGroq
+    try:
+        # Retries are handled by the scheduler so backoff is coordinated across callers.
+        return ChatGroq(api_key=GROQ_API_KEY, model=MODEL_NAME, max_retries=0)
+    except Exception as e:
+        logger.exception("Failed to initialize Groq client for categorization")
+        raise
+
+components.register("chat_model", _build_chat_model)
+llm = ScheduledChatModel(lambda: components.get("chat_model"), llm_scheduler)
\ No newline at end of file
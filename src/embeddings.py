@@ -0,0 +1,154 @@
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from src.config import EMBEDDING_MODEL, EMBED_MAX_BATCH_SIZE, EMBED_MAX_WAIT_MS
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class _EmbedRequest:
+    __slots__ = ("texts", "future", "enqueued")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class EmbeddingService(Embeddings):
+    """
+    Process-wide embedding model that encodes concurrent requests in micro-batches.
+
+    Callers on any thread submit texts and block on a future. A single worker
+    thread drains the queue, waiting at most ``max_wait_ms`` for more requests
+    once one arrives, and encodes up to ``max_batch_size`` texts per model call.
+    Recent query embeddings are memoized, so the answer cache and the
+    retriever embed a chat question only once.
+    """
+
+    QUERY_CACHE_SIZE = 256
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, max_batch_size: int = EMBED_MAX_BATCH_SIZE,
+                 max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._model = None
+        self._queue: "queue.Queue[_EmbedRequest]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "batches": 0, "encode_seconds": 0.0,
+                       "queue_wait_seconds": 0.0, "max_queue_depth": 0}
+
+    def _load_model(self):
+        if self._model is None:
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            logger.info(f"Loading embedding model {self.model_name}")
+            self._model = HuggingFaceEmbeddings(
+                model_name=self.model_name,
+                encode_kwargs={"batch_size": self.max_batch_size}
+            )
+        return self._model
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self) -> List[_EmbedRequest]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for request in batch for text in request.texts]
+            started = time.perf_counter()
+            try:
+                vectors = self._load_model().embed_documents(texts)
+            except Exception as e:
+                logger.exception(f"Embedding batch of {len(texts)} texts failed: {str(e)}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["encode_seconds"] += elapsed
+                self._stats["queue_wait_seconds"] += sum(started - r.enqueued for r in batch)
+            logger.debug(f"Embedded {len(texts)} texts from {len(batch)} requests in {elapsed:.3f}s")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed ``texts``, sharing a model call with any concurrent requests."""
+        if not texts:
+            return []
+        request = _EmbedRequest(list(texts))
+        with span("embed", kind="retrieval", texts=len(request.texts)):
+            self._ensure_worker()
+            self._queue.put(request)
+            with self._lock:
+                self._stats["requests"] += 1
+                self._stats["texts"] += len(request.texts)
+                self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue.qsize())
+            return request.future.result()
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            if text in self._query_cache:
+                self._query_cache.move_to_end(text)
+                return self._query_cache[text]
+        vector = self.embed_documents([text])[0]
+        with self._lock:
+            self._query_cache[text] = vector
+            if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        """Return throughput, batching and queue-depth counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch_size"] = stats["texts"] / stats["batches"] if stats["batches"] else 0.0
+        stats["texts_per_second"] = stats["texts"] / stats["encode_seconds"] if stats["encode_seconds"] else 0.0
+        stats["avg_queue_wait_ms"] = 1000 * stats["queue_wait_seconds"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+
+_service: Optional[EmbeddingService] = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Return the embedding service shared by every session and thread in this process."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService()
+        return _service
@@ -1,69 +1,96 @@
 import logging
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_groq import ChatGroq
-from typing import Dict, List
+from typing import AsyncIterator, Dict, Iterator, List
 from src.config import llm, GROQ_API_KEY
-import os, json
+from src.prompt_format import encode_rows
 from dotenv import load_dotenv
 
 load_dotenv()
 
-os.makedirs(os.path.join("logs"), exist_ok=True)  
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",  
-    handlers=[  
-        logging.FileHandler(os.path.join("logs", "app.log")),
-        logging.StreamHandler() 
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSION = "2"
+
+EXPLANATION_ERROR = "Unable to generate explanations due to an error."
+
+def _build_explanation_messages(results: List[Dict]) -> list:
+    input_data = encode_rows(results, with_ids=False)
+
+    prompt = f"""
+    You are a professional medical explanation assistant.
+
+    You will receive medical test results as a JSON object: "columns" lists the field names once and each entry of "rows" holds one result's values in that order (null means the field is absent). The fields may include:
+    - test_name
+    - value
+    - unit
+    - normal_range
+    - status
+    - additional metadata
+
+    Your job is to clearly and patiently explain **each test result** to a non-technical patient. For **each test**, give a separate explanation that includes:
+    - What the test measures.
+    - The patient's value and what it means.
+    - The given status (Normal, Borderline, Critical, Unknown) and why it was assigned.
+    - If needed, what the patient should do next.
+
+    Use simple language.
+    Only use provided data. Do not assume, infer, or invent missing details.
+
+    Return a clearly separated explanation **for each test** — label them clearly with the test name.
+
+    Input:
+    {input_data}
+    """
+
+    return [
+        SystemMessage(content="You are a professional medical explanation assistant."),
+        HumanMessage(content=prompt)
     ]
-)
 
 def explain_results_batch(results: List[Dict]) -> str:
     """
     Send all categorized results to the LLM and request detailed explanations
     for each one in a single response.
     """
-    logging.info("Generating batch explanations for all categorized test results.")
+    logger.info("Generating batch explanations for all categorized test results.")
 
     try:
-        input_data = json.dumps(results, indent=2)
-
-        prompt = f"""
-        You are a professional medical explanation assistant.
-
-        You will receive a list of medical test results in dictionary format. Each dictionary may include:
-        - test_name
-        - value
-        - unit
-        - normal_range
-        - status
-        - additional metadata
-
-        Your job is to clearly and patiently explain **each test result** to a non-technical patient. For **each test**, give a separate explanation that includes:
-        - What the test measures.
-        - The patient's value and what it means.
-        - The given status (Normal, Borderline, Critical, Unknown) and why it was assigned.
-        - If needed, what the patient should do next.
-
-        Use simple language.
-        Only use provided data. Do not assume, infer, or invent missing details.
-
-        Return a clearly separated explanation **for each test** — label them clearly with the test name.
+        response = llm.invoke(_build_explanation_messages(results))
+        explanation = response.content.strip()
+        logger.info("✅ Batch explanations received.")
+        return explanation
 
-        Input:
-        {input_data}
-        """
+    except Exception as e:
+        logger.error(f"❌ Error generating batch explanation: {str(e)}")
+        return EXPLANATION_ERROR
 
-        messages = [
-            SystemMessage(content="You are a professional medical explanation assistant."),
-            HumanMessage(content=prompt)
-        ]
+async def aexplain_results_batch(results: List[Dict]) -> str:
+    """Async variant of explain_results_batch using llm.ainvoke."""
+    logger.info("Generating batch explanations for all categorized test results (async).")
 
-        response = llm.invoke(messages)
+    try:
+        response = await llm.ainvoke(_build_explanation_messages(results))
         explanation = response.content.strip()
-        logging.info("✅ Batch explanations received.")
+        logger.info("✅ Batch explanations received.")
         return explanation
 
     except Exception as e:
-        logging.error(f"❌ Error generating batch explanation: {str(e)}")
-        return "Unable to generate explanations due to an error."
\ No newline at end of file
+        logger.error(f"❌ Error generating batch explanation: {str(e)}")
+        return EXPLANATION_ERROR
+
+def stream_explanations(results: List[Dict]) -> Iterator[str]:
+    """
+    Streaming variant of explain_results_batch: yields the explanation text as
+    the model generates it. LLM errors propagate to the caller.
+    """
+    logger.info("Streaming batch explanations for all categorized test results.")
+    for chunk in llm.stream(_build_explanation_messages(results)):
+        if chunk.content:
+            yield chunk.content
+
+async def astream_explanations(results: List[Dict]) -> AsyncIterator[str]:
+    """Async variant of stream_explanations using llm.astream."""
+    logger.info("Streaming batch explanations for all categorized test results (async).")
+    async for chunk in llm.astream(_build_explanation_messages(results)):
+        if chunk.content:
+            yield chunk.content
@@ -0,0 +1,114 @@
+import logging
+import json
+from dotenv import load_dotenv
+from langchain_core.messages import SystemMessage, HumanMessage
+from src.config import llm
+from src.reference_ranges import categorize_locally
+from typing import Dict, List, Optional
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSION = "1"
+
+TABLE_COLUMNS = ["test_name", "value", "unit", "normal_range", "status"]
+STATUSES = {"Critical", "Borderline", "Normal", "Unknown"}
+
+def validate_fused_output(parsed) -> Optional[Dict[str, List[Dict]]]:
+    """
+    Check the fused response shape: a 'metadata' list of dicts and a 'tests' list
+    of dicts carrying every table column with a known status.
+    Returns the normalized payload, or None if it does not validate.
+    """
+    if not isinstance(parsed, dict):
+        return None
+    metadata = parsed.get("metadata", [])
+    tests = parsed.get("tests")
+    if not isinstance(metadata, list) or not isinstance(tests, list) or not tests:
+        return None
+    if not all(isinstance(item, dict) for item in metadata):
+        return None
+
+    rows = []
+    for test in tests:
+        if not isinstance(test, dict) or not test.get("test_name"):
+            return None
+        row = {column: test.get(column, "Unknown") for column in TABLE_COLUMNS}
+        if row["status"] not in STATUSES:
+            return None
+        rows.append(row)
+    return {"metadata": metadata, "tests": rows}
+
+def _build_fused_messages(text: str) -> list:
+    prompt = f"""
+    You are a medical data extraction and categorization expert.
+
+    Given the following medical report, return a single JSON object with two keys:
+
+    - "metadata": a JSON array of dictionaries with patient and report information explicitly stated in the text (e.g., patient name, age, gender, date, lab name).
+    - "tests": a JSON array with one dictionary per test result, each with exactly these keys:
+      - test_name
+      - value
+      - unit
+      - normal_range
+      - status: one of 'Critical', 'Borderline', 'Normal', 'Unknown'
+
+    **Important Instructions:**
+    - Include **only** information explicitly mentioned in the report. Do **not** guess or hallucinate.
+    - Use 'Unknown' for missing test fields and '' (empty string) for inapplicable ones.
+    - Use 'Normal' if the value is within the stated range, 'Borderline' if slightly outside, 'Critical' if significantly outside, and 'Unknown' if there is not enough data.
+    - Return **only** the JSON object — no explanations, no markdown, no code formatting, no comments.
+
+    Medical Report:
+    {text}
+    """
+
+    return [
+        SystemMessage(content="You are a medical data extraction and categorization expert."),
+        HumanMessage(content=prompt)
+    ]
+
+def _parse_fused(content: str) -> Optional[Dict[str, List[Dict]]]:
+    try:
+        parsed = json.loads(content.strip())
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse fused LLM response as JSON: {str(e)}")
+        return None
+
+    payload = validate_fused_output(parsed)
+    if payload is None:
+        logger.warning("Fused LLM response failed validation")
+        return None
+
+    payload["tests"], _ = categorize_locally(payload["tests"])
+    logger.info(f"Fused stage returned {len(payload['metadata'])} metadata entries and {len(payload['tests'])} tests")
+    return payload
+
+def extract_categorize_format(text: str) -> Optional[Dict[str, List[Dict]]]:
+    """
+    Extract metadata and table-ready, status-labelled test rows from report text
+    in a single LLM call. Statuses for rows with a parseable reference range are
+    re-derived locally so they match categorize_results.
+    Returns None when the response fails validation, so callers can fall back to
+    structure_data -> categorize_results -> format_results_for_table.
+    """
+    logger.info("Running fused extraction, categorization and table formatting")
+    try:
+        response = llm.invoke(_build_fused_messages(text))
+        logger.info("✅ Fused response received from Groq.")
+        return _parse_fused(response.content)
+    except Exception as e:
+        logger.exception(f"Fused extraction failed: {str(e)}")
+        return None
+
+async def aextract_categorize_format(text: str) -> Optional[Dict[str, List[Dict]]]:
+    """Async variant of extract_categorize_format using llm.ainvoke."""
+    logger.info("Running fused extraction, categorization and table formatting (async)")
+    try:
+        response = await llm.ainvoke(_build_fused_messages(text))
+        logger.info("✅ Fused response received from Groq.")
+        return _parse_fused(response.content)
+    except Exception as e:
+        logger.exception(f"Fused extraction failed: {str(e)}")
+        return None
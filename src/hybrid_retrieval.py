@@ -0,0 +1,147 @@
+import json
+import math
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from src.config import (
+    RETRIEVAL_K, RETRIEVAL_FETCH_K, RETRIEVAL_RRF_K, RETRIEVAL_VECTOR_WEIGHT, RETRIEVAL_LEXICAL_WEIGHT
+)
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Decimal numbers stay whole ("5.4"), and "HbA1c" stays one token.
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?|[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "how", "i", "in", "is",
+    "it", "me", "my", "of", "on", "or", "the", "this", "to", "was", "were", "what", "which", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word and number tokens without common question words."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def chunk_key(document: Document) -> Tuple[str, str]:
+    """Identity of a chunk across the vector and lexical indexes."""
+    return document.metadata.get("doc_hash", ""), document.page_content
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of chunks, with an inverted index built once.
+
+    Per-document indexes are persisted as JSON next to the FAISS files and
+    combined with ``merge``, which recomputes document frequencies over all
+    chunks so scores stay comparable.
+    """
+
+    FILE_NAME = "bm25.json"
+
+    def __init__(self, documents: List[Document], term_counts: Optional[List[Dict[str, int]]] = None,
+                 k1: float = 1.5, b: float = 0.75):
+        self.documents = documents
+        self.term_counts = term_counts if term_counts is not None else [
+            dict(Counter(tokenize(document.page_content))) for document in documents
+        ]
+        self.k1 = k1
+        self.b = b
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for position, counts in enumerate(self.term_counts):
+            for term, count in counts.items():
+                self.postings.setdefault(term, []).append((position, count))
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.documents) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        """Top ``k`` chunks for ``query`` with their BM25 scores; chunks sharing no term are left out."""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf(term)
+            for position, count in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / (self.avg_length or 1.0))
+                scores[position] = scores.get(position, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[position], score) for position, score in ranked]
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        payload = {
+            "documents": [{"page_content": d.page_content, "metadata": d.metadata} for d in self.documents],
+            "term_counts": self.term_counts,
+        }
+        with open(os.path.join(directory, self.FILE_NAME), "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        """Read a persisted index, or return None when there is none."""
+        path = os.path.join(directory, cls.FILE_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload["documents"]]
+        return cls(documents, payload["term_counts"])
+
+    @classmethod
+    def merge(cls, indexes: List["BM25Index"]) -> "BM25Index":
+        documents, term_counts = [], []
+        for index in indexes:
+            documents.extend(index.documents)
+            term_counts.extend(index.term_counts)
+        return cls(documents, term_counts)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], weights: List[float], k: int,
+                           rrf_k: int = RETRIEVAL_RRF_K) -> List[Document]:
+    """
+    Fuse ranked lists: each chunk scores ``sum(weight / (rrf_k + rank))`` over
+    the lists it appears in (ranks start at 1). Returns the top ``k`` chunks.
+    """
+    scores: Dict[Tuple[str, str], float] = {}
+    documents: Dict[Tuple[str, str], Document] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, document in enumerate(ranking, start=1):
+            key = chunk_key(document)
+            documents.setdefault(key, document)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)[:k]
+    return [documents[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever combining BM25 and FAISS similarity rankings with reciprocal-rank
+    fusion. Exact tokens such as analyte abbreviations and numbers are found
+    by BM25 even when the embedding misses them.
+    """
+
+    vector_store: object
+    lexical_index: Optional[BM25Index] = None
+    k: int = RETRIEVAL_K
+    fetch_k: int = RETRIEVAL_FETCH_K
+    vector_weight: float = RETRIEVAL_VECTOR_WEIGHT
+    lexical_weight: float = RETRIEVAL_LEXICAL_WEIGHT
+    rrf_k: int = RETRIEVAL_RRF_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_ranking = self.vector_store.similarity_search(query, k=self.fetch_k)
+        if self.lexical_index is None:
+            return vector_ranking[:self.k]
+        with span("bm25", kind="retrieval") as bm25_span:
+            lexical_ranking = [document for document, _ in self.lexical_index.search(query, self.fetch_k)]
+            bm25_span.set(matches=len(lexical_ranking))
+        return reciprocal_rank_fusion([vector_ranking, lexical_ranking], [self.vector_weight, self.lexical_weight],
+                                      self.k, self.rrf_k)
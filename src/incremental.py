@@ -0,0 +1,356 @@
+import re
+import logging
+import threading
+import time
+from difflib import SequenceMatcher
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from src.cache import pipeline_cache
+from src.config import INCREMENTAL_MIN_SIMILARITY, INCREMENTAL_CONTEXT_LINES, INCREMENTAL_HISTORY
+from src.nlp import astructure_data
+from src.categorize import acategorize_results
+from src.table_formatter import aformat_results_for_table
+from src.explain import astream_explanations
+from src.query_router import normalize_name
+
+logger = logging.getLogger(__name__)
+
+INCREMENTAL_VERSION = "2"
+REVISION_INDEX_KEY = "revisions/index"
+
+# Metadata identifying the report or its patient; a revision must carry the same values.
+_ID_FIELDS = {"patientid", "mrn", "mrno", "mrnumber", "medicalrecordnumber", "medicalrecordno", "uhid", "uhidno",
+              "patientno", "patientnumber", "regno", "registrationno", "registrationnumber", "hospitalno",
+              "hospitalnumber", "crno", "reportid", "reportno", "reportnumber", "labno", "labid", "accessionno",
+              "accessionnumber", "sampleid", "sampleno", "specimenid", "barcode"}
+_NAME_FIELDS = {"patientname", "patient", "name", "patientsname"}
+
+
+def _test_name(row: Dict) -> Optional[str]:
+    name = row.get("test_name") or row.get("Test")
+    return str(name) if name not in (None, "") else None
+
+
+def row_key(row: Dict) -> str:
+    """Identity of a row across revisions: test name and value, or all metadata values."""
+    name = _test_name(row)
+    if name is not None:
+        return f"{normalize_name(name)}|{normalize_name(row.get('value', ''))}"
+    return "|".join(sorted(f"{key}={normalize_name(value)}" for key, value in row.items() if value not in (None, "")))
+
+
+def content_key(row: Dict) -> str:
+    """Every field of a structured row, normalized; rows are only reused across revisions when this matches."""
+    return "|".join(sorted(f"{re.sub(r'[^a-z]', '', str(key).lower())}={normalize_name(value)}"
+                           for key, value in row.items() if value not in (None, "")))
+
+
+def _identity(rows: List[Dict]) -> Tuple[List[str], List[str]]:
+    """Normalized patient/report ID values and patient names in the metadata of ``rows``."""
+    ids, names = [], []
+    for row in rows:
+        if not isinstance(row, dict) or _test_name(row):
+            continue
+        for key, value in row.items():
+            field = re.sub(r"[^a-z]", "", str(key).lower())
+            if value not in (None, "") and normalize_name(value):
+                if field in _ID_FIELDS:
+                    ids.append(normalize_name(value))
+                elif field in _NAME_FIELDS:
+                    names.append(normalize_name(value))
+    return ids, names
+
+
+def _normalize_line(line: str) -> str:
+    return " ".join(line.split()).lower()
+
+
+def _row_line(row: Dict, lines: List[str]) -> Optional[int]:
+    """Index of the first of ``lines`` ``row`` was read from (its name and value, or a metadata value, appear there)."""
+    name = _test_name(row)
+    if name is not None:
+        needles = [normalize_name(name), normalize_name(row.get("value", ""))]
+    else:
+        needles = [normalize_name(value) for value in row.values() if value not in (None, "")][:1]
+    for i, line in enumerate(lines):
+        if needles and all(not needle or f" {needle} " in f" {line} " for needle in needles):
+            return i
+    return None
+
+
+class ReportDiff:
+    """
+    Line-level diff of two extractions of the same report.
+
+    ``sections`` are the changed hunks of the new text with
+    ``context`` unchanged lines around them, ready for re-extraction;
+    ``changed_lines`` are the normalized old lines that were replaced or
+    removed, used to find the previous rows the change invalidates, and
+    ``unchanged_lines`` the normalized new lines the diff left as they were.
+    """
+
+    def __init__(self, old_text: str, new_text: str, context: int = INCREMENTAL_CONTEXT_LINES):
+        old_lines = old_text.splitlines()
+        new_lines = new_text.splitlines()
+        old_normalized = [_normalize_line(line) for line in old_lines]
+        # Whitespace-only differences (OCR spacing) do not count as changes.
+        matcher = SequenceMatcher(None, old_normalized, [_normalize_line(line) for line in new_lines], autojunk=False)
+        self.similarity = matcher.ratio()
+        self.new_text = new_text
+        self.new_lines = [normalize_name(line) for line in new_lines]
+        self.unchanged_lines = [self.new_lines[j] for tag, _, _, j1, j2 in matcher.get_opcodes() if tag == "equal"
+                                for j in range(j1, j2)]
+        self.sections: List[str] = []
+        self.changed_lines: List[str] = []
+        for group in matcher.get_grouped_opcodes(context):
+            if all(tag == "equal" for tag, *_ in group):
+                continue
+            section = "\n".join(new_lines[group[0][3]:group[-1][4]]).strip()
+            if section:
+                self.sections.append(section)
+            for tag, i1, i2, _, _ in group:
+                if tag in ("replace", "delete"):
+                    self.changed_lines.extend(normalize_name(line) for line in old_lines[i1:i2])
+
+    @property
+    def changed_chars(self) -> int:
+        return sum(len(section) for section in self.sections)
+
+
+_HEADING_PREFIX = re.compile(r"^(\d+\s+)?(test\s+(name\s+)?)?")
+
+
+def _heading_for(line: str, keys: List[str]) -> Optional[str]:
+    stripped = line.strip()
+    if not stripped or len(stripped) > 120:
+        return None
+    if not (stripped.startswith(("#", "**", "__")) or re.match(r"^\d+[.)]", stripped) or stripped.endswith(":")):
+        return None
+    name = _HEADING_PREFIX.sub("", normalize_name(stripped))
+    for key in keys:
+        if name == key or name.startswith(key + " "):
+            return key
+    return None
+
+
+def split_explanation(text: str, test_names: List[str]) -> Optional[Tuple[str, Dict[str, str]]]:
+    """
+    Split a batch explanation into its introduction and one block per test,
+    keyed by normalized test name. Returns None when a test has no heading,
+    i.e. the text cannot be split safely.
+    """
+    keys = sorted({normalize_name(name) for name in test_names if normalize_name(name)}, key=len, reverse=True)
+    preamble: List[str] = []
+    blocks: Dict[str, List[str]] = {}
+    current = None
+    for line in text.splitlines():
+        heading = _heading_for(line, keys)
+        if heading is not None and heading not in blocks:
+            current = heading
+            blocks[current] = []
+        (blocks[current] if current else preamble).append(line)
+    if any(key not in blocks for key in keys):
+        return None
+    return "\n".join(preamble).strip(), {key: "\n".join(lines).strip() for key, lines in blocks.items()}
+
+
+class IncrementalPlan:
+    """
+    Re-analysis of a revised report from its previous revision.
+
+    Only the changed sections are re-extracted; rows identical in every field
+    (not just name and value) to the previous revision keep their status,
+    table row and explanation, and the LLM stages run for the remaining rows
+    only. Whenever a previous row cannot be shown to be unchanged, the whole
+    report is extracted again instead.
+    """
+
+    def __init__(self, previous: Dict[str, Any], diff: ReportDiff):
+        self.previous = previous
+        self.diff = diff
+        # Categorization keeps one row per structured row, so the previous structured row identifies its result.
+        structured, categorized = previous["structured"], previous["categorized"]
+        self._previous_categorized: Dict[str, Dict] = {}
+        if len(structured) == len(categorized):
+            for source, row in zip(structured, categorized):
+                if isinstance(source, dict) and isinstance(row, dict):
+                    self._previous_categorized.setdefault(content_key(source), row)
+        self._previous_results = {content_key(row) for row in categorized if isinstance(row, dict)}
+        self._previous_table = {row_key(row): row for row in previous.get("table") or []}
+
+    async def astructure(self) -> List[Dict]:
+        """
+        Previous rows read from unchanged lines, plus the rows extracted from the
+        changed sections; the full extraction of the new text when any previous
+        row is neither found on an unchanged line nor unambiguously re-extracted.
+        """
+        # One extraction call for all hunks, so the prompt overhead is paid once.
+        extracted = await astructure_data("\n\n".join(self.diff.sections)) if self.diff.sections else []
+        extracted = [row for row in extracted if isinstance(row, dict)]
+        if self.diff.sections and not extracted:
+            return await self._full_extraction("nothing extracted from the changed sections")
+        replacements: Dict[str, List[Dict]] = {}
+        for row in extracted:
+            if _test_name(row):
+                replacements.setdefault(normalize_name(_test_name(row)), []).append(row)
+        previous_names = [normalize_name(_test_name(row)) for row in self.previous["structured"] if _test_name(row)]
+        merged, seen = [], set()
+
+        def add(row: Dict) -> None:
+            if row_key(row) not in seen:
+                merged.append(row)
+                seen.add(row_key(row))
+
+        for row in self.previous["structured"]:
+            name = normalize_name(_test_name(row)) if _test_name(row) else None
+            if name is not None and name in replacements:
+                # A re-extracted test takes the place of its previous row, if there is exactly one of each.
+                if len(replacements[name]) != 1 or previous_names.count(name) != 1:
+                    return await self._full_extraction(f"ambiguous re-extraction of {name}")
+                add(replacements[name][0])
+            elif _row_line(row, self.diff.unchanged_lines) is not None:
+                add(row)
+            elif name is None and _row_line(row, self.diff.changed_lines) is not None:
+                # Metadata read from a changed line; its section was re-extracted.
+                continue
+            else:
+                return await self._full_extraction(f"previous row {row_key(row)!r} is not clearly unchanged")
+        for row in extracted:
+            add(row)
+        # Keep report order: each row sorts by its line in the new text, unplaced rows stay after their predecessor.
+        positions, last = [], -1
+        for row in merged:
+            line = _row_line(row, self.diff.new_lines)
+            last = line if line is not None else last
+            positions.append(last)
+        merged = [row for _, row in sorted(zip(positions, merged), key=lambda item: item[0])]
+        logger.info(f"Incremental extraction: {len(self.diff.sections)} changed sections, "
+                    f"{len(extracted)} rows re-extracted, {len(merged)} rows total")
+        return merged
+
+    async def _full_extraction(self, reason: str) -> List[Dict]:
+        logger.info(f"Incremental extraction abandoned ({reason}); extracting the whole report")
+        return await astructure_data(self.diff.new_text)
+
+    async def acategorize(self, structured: List[Dict]) -> List[Dict]:
+        """Reuse the status of rows identical to a previous structured row and categorize the rest."""
+        pending = [i for i, row in enumerate(structured) if content_key(row) not in self._previous_categorized]
+        categorized = [self._previous_categorized.get(content_key(row), row) for row in structured]
+        if pending:
+            fresh = await acategorize_results([structured[i] for i in pending])
+            for i, row in zip(pending, fresh):
+                categorized[i] = row
+        logger.info(f"Incremental categorization: {len(pending)} of {len(structured)} rows changed")
+        return categorized
+
+    def _is_changed(self, row: Dict) -> bool:
+        """Whether categorized ``row`` differs in any field (range, unit, status, ...) from every previous result."""
+        return content_key(row) not in self._previous_results
+
+    async def aformat_table(self, test_results: List[Dict]) -> List[Dict]:
+        """Previous table rows for unchanged tests, new ones for the changed tests, in report order."""
+        missing = [i for i, row in enumerate(test_results) if self._is_changed(row) or row_key(row) not in self._previous_table]
+        formatted = await aformat_results_for_table([test_results[i] for i in missing]) if missing else []
+        if len(formatted) != len(missing):
+            return await aformat_results_for_table(test_results)
+        fresh = dict(zip(missing, formatted))
+        return [fresh[i] if i in fresh else self._previous_table[row_key(row)] for i, row in enumerate(test_results)]
+
+    def reusable_explanation(self, test_results: List[Dict]) -> Optional[str]:
+        """The previous explanation cut down to the unchanged tests, or None when it cannot be split by test."""
+        previous = self.previous.get("explanation")
+        if not previous:
+            return None
+        names = [_test_name(row) for row in self.previous["categorized"] if _test_name(row)]
+        split = split_explanation(previous, names)
+        if split is None:
+            return None
+        preamble, blocks = split
+        kept = [blocks[normalize_name(_test_name(row))] for row in test_results if not self._is_changed(row)
+                and normalize_name(_test_name(row)) in blocks]
+        return "\n\n".join(part for part in [preamble] + kept if part)
+
+    def astream_explanation(self, test_results: List[Dict]) -> Optional[AsyncIterator[str]]:
+        """
+        Stream the previous explanations of unchanged tests followed by newly
+        generated ones for the changed tests. Returns None when the previous
+        explanation cannot be reused, so the caller regenerates it in full.
+        """
+        kept = self.reusable_explanation(test_results)
+        if kept is None:
+            return None
+        changed = [row for row in test_results if self._is_changed(row)]
+
+        async def stream():
+            yield kept
+            if changed:
+                yield "\n\n"
+                async for token in astream_explanations(changed):
+                    yield token
+
+        logger.info(f"Incremental explanation: regenerating {len(changed)} of {len(test_results)} tests")
+        return stream()
+
+
+class RevisionStore:
+    """
+    Final results of recently analyzed reports, kept in ``pipeline_cache`` so a
+    revised upload can be diffed against its earlier revision. Revisions are
+    only looked up within the session that stored them.
+    """
+
+    def __init__(self, max_revisions: int = INCREMENTAL_HISTORY, min_similarity: float = INCREMENTAL_MIN_SIMILARITY):
+        self.max_revisions = max_revisions
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(file_hash: str, session_id: str) -> str:
+        return pipeline_cache.stage_key(file_hash, "revision", INCREMENTAL_VERSION, parent_key=session_id)
+
+    def save(self, file_hash: str, file_name: str, revision: Dict[str, Any], session_id: str) -> None:
+        pipeline_cache.set(self.key(file_hash, session_id), dict(revision, file_hash=file_hash, file_name=file_name))
+        with self._lock:
+            index = [entry for entry in pipeline_cache.get(REVISION_INDEX_KEY, [])
+                     if (entry["file_hash"], entry["session_id"]) != (file_hash, session_id)]
+            index.append({"file_hash": file_hash, "file_name": file_name, "session_id": session_id, "created": time.time()})
+            pipeline_cache.set(REVISION_INDEX_KEY, index[-self.max_revisions:])
+
+    @staticmethod
+    def same_report(revision: Dict[str, Any], text: str) -> bool:
+        """
+        Whether ``text`` identifies the same report as ``revision``: every patient
+        or report ID in the revision's metadata (at least one is required) and
+        its patient name appear in ``text``.
+        """
+        ids, names = _identity(revision.get("categorized") or [])
+        normalized = f" {normalize_name(text)} "
+        return bool(ids) and all(f" {value} " in normalized for value in ids + names)
+
+    def find_previous(self, file_hash: str, file_name: str, text: str,
+                      session_id: str) -> Optional[Tuple[Dict[str, Any], ReportDiff]]:
+        """
+        The latest revision stored in ``session_id`` for a file of the same name
+        and the same patient/report IDs, with its diff to ``text``; None when
+        there is none or it is less than ``min_similarity`` similar.
+        """
+        index = [entry for entry in pipeline_cache.get(REVISION_INDEX_KEY, [])
+                 if entry["file_hash"] != file_hash and entry["file_name"] == file_name
+                 and entry.get("session_id") == session_id]
+        new_lines = [_normalize_line(line) for line in text.splitlines()]
+        for entry in sorted(index, key=lambda entry: entry["created"], reverse=True):
+            revision = pipeline_cache.get(self.key(entry["file_hash"], session_id))
+            if revision is None or not self.same_report(revision, text):
+                continue
+            matcher = SequenceMatcher(None, [_normalize_line(line) for line in revision["text"].splitlines()], new_lines,
+                                      autojunk=False)
+            score = matcher.ratio()
+            if score < self.min_similarity:
+                logger.info(f"Latest revision of {file_name} is only {score:.2f} similar; analyzing in full")
+                return None
+            logger.info(f"Revision of {file_name} ({entry['file_hash'][:12]}) found, similarity {score:.2f}")
+            return revision, ReportDiff(revision["text"], text)
+        return None
+
+
+revisions = RevisionStore()
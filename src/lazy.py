@@ -0,0 +1,88 @@
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyRegistry:
+    """
+    Named components that are built on first ``get`` and shared afterwards.
+
+    Factories run at most once even when several threads ask at the same time.
+    ``warm_up`` loads components from a daemon thread so a later ``get`` is
+    instant without delaying the caller.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._values: Dict[str, Any] = {}
+        self._seconds: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._warming: Optional[threading.Thread] = None
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def register_module(self, name: str, module_path: str) -> None:
+        """Register ``module_path`` to be imported on first use under ``name``."""
+        self.register(name, lambda: importlib.import_module(module_path))
+
+    def get(self, name: str) -> Any:
+        if name in self._values:
+            return self._values[name]
+        try:
+            lock = self._locks[name]
+        except KeyError:
+            raise KeyError(f"Unknown lazy component '{name}'") from None
+        with lock:
+            if name not in self._values:
+                started = time.perf_counter()
+                self._values[name] = self._factories[name]()
+                self._seconds[name] = time.perf_counter() - started
+                logger.info(f"Loaded {name} in {self._seconds[name]:.2f}s")
+        return self._values[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._values
+
+    def warm_up(self, names: Iterable[str]) -> Optional[threading.Thread]:
+        """Load ``names`` in a background thread; a no-op while a previous warm-up is running."""
+        pending = [name for name in names if name in self._factories and name not in self._values]
+        with self._lock:
+            if not pending or (self._warming is not None and self._warming.is_alive()):
+                return None
+
+            def run():
+                for name in pending:
+                    try:
+                        self.get(name)
+                    except Exception as e:
+                        logger.error(f"Warm-up of {name} failed: {str(e)}")
+
+            self._warming = threading.Thread(target=run, name="lazy-warm-up", daemon=True)
+            self._warming.start()
+            return self._warming
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per component: whether it is loaded and how long loading took."""
+        return {name: {"loaded": name in self._values, "seconds": self._seconds.get(name)}
+                for name in self._factories}
+
+
+components = LazyRegistry()
+
+# Heavy modules shared by the app, pipeline and chatbot. The chat model is
+# registered by src.config because it needs the API settings.
+components.register_module("cv2", "cv2")
+components.register_module("pytesseract", "pytesseract")
+components.register_module("pandas", "pandas")
+components.register_module("pipeline", "src.pipeline")
+components.register_module("pdf_generator", "src.pdf_generator")
+components.register_module("chatbot", "src.chatbot")
+components.register_module("results_store", "src.results_store")
@@ -0,0 +1,427 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from src.tracing import Span, span, current_stage
+
+logger = logging.getLogger(__name__)
+
+# Lower value is served first.
+PRIORITIES = {"interactive": 0, "analysis": 1, "batch": 2}
+
+_current_priority: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default=None)
+
+@contextmanager
+def llm_priority(priority: str):
+    """Run LLM calls made in this context (thread or task) at ``priority``."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units per minute up to one minute of burst."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Charge (or refund, if negative) the difference between estimated and actual usage."""
+        self._refill()
+        self.level = min(self.capacity, self.level - delta)
+
+
+class _Ticket:
+    __slots__ = ("priority", "tokens", "enqueued", "waited", "event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, priority: int, tokens: int):
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.waited = 0.0
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.granted = False
+        self.cancelled = False
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve_future, self.future)
+        else:
+            self.event.set()
+
+
+def _resolve_future(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _prompt_text(messages: Any) -> str:
+    if isinstance(messages, (list, tuple)):
+        return "".join(str(getattr(m, "content", m)) for m in messages)
+    return str(messages)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+_RETRYABLE_ERRORS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+                     "ConnectError", "ReadTimeout", "TimeoutError", "ConnectionError"}
+
+
+class LLMScheduler:
+    """
+    Central gate for every LLM call in the process.
+
+    Calls wait in a priority queue and are admitted only when a concurrency slot
+    is free and both the requests-per-minute and tokens-per-minute buckets have
+    room. Token usage is estimated up front and reconciled with the provider's
+    usage report afterwards. Rate-limit, timeout and 5xx errors are retried with
+    jittered exponential backoff (or the server's Retry-After).
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 expected_output_tokens: int = 1024):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.expected_output_tokens = expected_output_tokens
+        self._lock = threading.Lock()
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._timer: Optional[threading.Timer] = None
+        self._stats = {"requests": 0, "completed": 0, "retries": 0, "errors": 0,
+                       "rate_limited": 0, "wait_seconds": 0.0, "tokens_used": 0}
+
+    # -- admission -----------------------------------------------------------
+
+    def _dispatch_locked(self) -> None:
+        while self._heap and self._active < self.max_concurrency:
+            ticket = self._heap[0][2]
+            if ticket.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            wait = max(self.requests.delay(1), self.tokens.delay(ticket.tokens))
+            if wait > 0:
+                self._schedule_dispatch(wait)
+                return
+            heapq.heappop(self._heap)
+            self.requests.consume(1)
+            self.tokens.consume(ticket.tokens)
+            self._active += 1
+            ticket.waited = time.monotonic() - ticket.enqueued
+            self._stats["wait_seconds"] += ticket.waited
+            ticket.grant()
+
+    def _schedule_dispatch(self, wait: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(wait, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._dispatch_locked()
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        with self._lock:
+            self._stats["requests"] += 1
+            heapq.heappush(self._heap, (ticket.priority, next(self._seq), ticket))
+            self._dispatch_locked()
+
+    def _release(self, ticket: _Ticket, used_tokens: Optional[int] = None) -> None:
+        with self._lock:
+            self._active -= 1
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens - ticket.tokens)
+                self._stats["tokens_used"] += used_tokens
+            else:
+                self._stats["tokens_used"] += ticket.tokens
+            self._dispatch_locked()
+
+    def _new_ticket(self, priority: Optional[str], tokens: int) -> _Ticket:
+        name = priority or _current_priority.get() or "analysis"
+        return _Ticket(PRIORITIES.get(name, PRIORITIES["analysis"]), min(tokens, int(self.tokens.capacity)))
+
+    def acquire(self, priority: Optional[str], tokens: int) -> _Ticket:
+        ticket = self._new_ticket(priority, tokens)
+        ticket.event = threading.Event()
+        self._enqueue(ticket)
+        ticket.event.wait()
+        return ticket
+
+    async def aacquire(self, priority: Optional[str], tokens: int) -> _Ticket:
+        ticket = self._new_ticket(priority, tokens)
+        ticket.loop = asyncio.get_running_loop()
+        ticket.future = ticket.loop.create_future()
+        self._enqueue(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = ticket.granted
+                ticket.cancelled = True
+            if granted:
+                self._release(ticket)
+            raise
+        return ticket
+
+    # -- retries -------------------------------------------------------------
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        status = _status_code(error)
+        retryable = (status in (408, 409, 429) or (status is not None and status >= 500)
+                     or type(error).__name__ in _RETRYABLE_ERRORS)
+        if status == 429 or type(error).__name__ == "RateLimitError":
+            with self._lock:
+                self._stats["rate_limited"] += 1
+        if not retryable or attempt >= self.max_retries:
+            return None
+
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), self.backoff_max)
+        except ValueError:
+            pass
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def _on_failure(self, error: Exception, attempt: int) -> Optional[float]:
+        delay = self._retry_delay(error, attempt)
+        with self._lock:
+            if delay is None:
+                self._stats["errors"] += 1
+            else:
+                self._stats["retries"] += 1
+        if delay is not None:
+            logger.warning(f"LLM call failed ({type(error).__name__}); retry {attempt + 1} in {delay:.1f}s")
+        return delay
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self._stats["completed"] += 1
+
+    def estimate_tokens(self, messages: Any) -> int:
+        """Rough prompt size (4 characters per token) plus the expected completion length."""
+        return len(_prompt_text(messages)) // 4 + self.expected_output_tokens
+
+    @staticmethod
+    def _usage(response: Any) -> Dict[str, int]:
+        """Input/output token counts reported by the provider, if any."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        if isinstance(usage, dict) and usage.get("input_tokens") is not None:
+            return {"input_tokens": usage["input_tokens"], "output_tokens": usage.get("output_tokens", 0)}
+        token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        if token_usage.get("prompt_tokens") is not None:
+            return {"input_tokens": token_usage["prompt_tokens"], "output_tokens": token_usage.get("completion_tokens", 0)}
+        return {}
+
+    def _usage_tokens(self, response: Any) -> Optional[int]:
+        usage = self._usage(response)
+        return usage["input_tokens"] + usage["output_tokens"] if usage else None
+
+    # -- calls ---------------------------------------------------------------
+
+    def _span(self, operation: str, messages: Any, priority: Optional[str]) -> Span:
+        return span(f"llm.{operation}", kind="llm",
+                    stage=current_stage() or "unstaged",
+                    priority=priority or _current_priority.get() or "analysis",
+                    prompt_bytes=len(_prompt_text(messages).encode("utf-8")),
+                    queue_wait_seconds=0.0)
+
+    def invoke(self, model, messages, priority: Optional[str] = None, **kwargs):
+        estimate = self.estimate_tokens(messages)
+        with self._span("invoke", messages, priority) as call:
+            for attempt in itertools.count():
+                ticket = self.acquire(priority, estimate)
+                call.set(attempts=attempt + 1, queue_wait_seconds=call.attrs["queue_wait_seconds"] + ticket.waited)
+                used = None
+                try:
+                    response = model.invoke(messages, **kwargs)
+                    call.set(**self._usage(response))
+                    used = self._usage_tokens(response)
+                    self._on_success()
+                    return response
+                except Exception as e:
+                    delay = self._on_failure(e, attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    self._release(ticket, used)
+                time.sleep(delay)
+
+    async def ainvoke(self, model, messages, priority: Optional[str] = None, **kwargs):
+        estimate = self.estimate_tokens(messages)
+        with self._span("ainvoke", messages, priority) as call:
+            for attempt in itertools.count():
+                ticket = await self.aacquire(priority, estimate)
+                call.set(attempts=attempt + 1, queue_wait_seconds=call.attrs["queue_wait_seconds"] + ticket.waited)
+                used = None
+                try:
+                    response = await model.ainvoke(messages, **kwargs)
+                    call.set(**self._usage(response))
+                    used = self._usage_tokens(response)
+                    self._on_success()
+                    return response
+                except Exception as e:
+                    delay = self._on_failure(e, attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    self._release(ticket, used)
+                await asyncio.sleep(delay)
+
+    def stream(self, model, messages, priority: Optional[str] = None, **kwargs):
+        """Stream chunks; a failure is only retried if no chunk has been yielded yet."""
+        estimate = self.estimate_tokens(messages)
+        with self._span("stream", messages, priority) as call:
+            for attempt in itertools.count():
+                ticket = self.acquire(priority, estimate)
+                call.set(attempts=attempt + 1, queue_wait_seconds=call.attrs["queue_wait_seconds"] + ticket.waited)
+                output_chars = 0
+                try:
+                    for chunk in model.stream(messages, **kwargs):
+                        output_chars += len(str(chunk.content))
+                        if "first_token_seconds" not in call.attrs:
+                            call.set(first_token_seconds=time.perf_counter() - call.started)
+                        yield chunk
+                    call.set(output_chars=output_chars)
+                    self._on_success()
+                    return
+                except Exception as e:
+                    delay = None if output_chars else self._on_failure(e, attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    self._release(ticket)
+                time.sleep(delay)
+
+    async def astream(self, model, messages, priority: Optional[str] = None, **kwargs):
+        estimate = self.estimate_tokens(messages)
+        with self._span("astream", messages, priority) as call:
+            for attempt in itertools.count():
+                ticket = await self.aacquire(priority, estimate)
+                call.set(attempts=attempt + 1, queue_wait_seconds=call.attrs["queue_wait_seconds"] + ticket.waited)
+                output_chars = 0
+                try:
+                    async for chunk in model.astream(messages, **kwargs):
+                        output_chars += len(str(chunk.content))
+                        if "first_token_seconds" not in call.attrs:
+                            call.set(first_token_seconds=time.perf_counter() - call.started)
+                        yield chunk
+                    call.set(output_chars=output_chars)
+                    self._on_success()
+                    return
+                except Exception as e:
+                    delay = None if output_chars else self._on_failure(e, attempt)
+                    if delay is None:
+                        raise
+                finally:
+                    self._release(ticket)
+                await asyncio.sleep(delay)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return queue depth per priority, in-flight calls, retry/error counters and bucket levels."""
+        with self._lock:
+            names = {value: name for name, value in PRIORITIES.items()}
+            queued = {name: 0 for name in PRIORITIES}
+            for priority, _, ticket in self._heap:
+                if not ticket.cancelled:
+                    queued[names.get(priority, "analysis")] += 1
+            stats = dict(self._stats)
+            admitted = stats["requests"] - sum(queued.values())
+            stats.update({
+                "queued": queued,
+                "active": self._active,
+                "avg_wait_ms": 1000 * stats["wait_seconds"] / admitted if admitted else 0.0,
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level),
+            })
+        return stats
+
+
+class ScheduledChatModel:
+    """
+    Drop-in wrapper for a chat model that routes invoke/ainvoke/stream/astream
+    through an LLMScheduler. Other attributes are forwarded to the wrapped model.
+
+    ``model`` may be a zero-argument callable instead of a model, in which case
+    the client is only built on first use.
+    """
+
+    def __init__(self, model, scheduler: LLMScheduler, priority: Optional[str] = None):
+        self._model = None if callable(model) and not hasattr(model, "invoke") else model
+        self._loader = model if self._model is None else None
+        self.scheduler = scheduler
+        self.priority = priority
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._loader()
+        return self._model
+
+    @model.setter
+    def model(self, model) -> None:
+        self._model = model
+
+    def with_priority(self, priority: str) -> "ScheduledChatModel":
+        return ScheduledChatModel(self._model if self._model is not None else self._loader, self.scheduler, priority)
+
+    def invoke(self, messages, **kwargs):
+        return self.scheduler.invoke(self.model, messages, self.priority, **kwargs)
+
+    async def ainvoke(self, messages, **kwargs):
+        return await self.scheduler.ainvoke(self.model, messages, self.priority, **kwargs)
+
+    def stream(self, messages, **kwargs):
+        return self.scheduler.stream(self.model, messages, self.priority, **kwargs)
+
+    def astream(self, messages, **kwargs):
+        return self.scheduler.astream(self.model, messages, self.priority, **kwargs)
+
+    def __getattr__(self, name):
+        if name in ("_model", "_loader"):
+            raise AttributeError(name)
+        return getattr(self.model, name)
@@ -0,0 +1,106 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+CONSOLE_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+def truncate(text: str, limit: int) -> str:
+    """Cut ``text`` to ``limit`` characters, noting how much was dropped."""
+    text = str(text)
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [+{len(text) - limit} chars]"
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """Parse ``"src.nlp=DEBUG,httpx=WARNING"`` into ``{"src.nlp": "DEBUG", "httpx": "WARNING"}``."""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the background listener after merging their arguments and
+    truncating long messages, so the calling thread never touches the disk and
+    large payloads are not copied through the queue.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = truncate(record.getMessage(), self.max_chars)
+        record.args = None
+        if record.exc_info:
+            record.exc_text = truncate(self._exc_formatter.formatException(record.exc_info), 4 * self.max_chars)
+            record.exc_info = None
+        record.message = record.msg
+        return record
+
+
+def configure_logging(log_dir: str = "logs", log_file: str = "app.log", level: str = "INFO",
+                      module_levels: Optional[Dict[str, str]] = None, max_bytes: int = 10 * 1024 * 1024,
+                      backup_count: int = 5, max_field_chars: int = 2000) -> None:
+    """
+    Install the process-wide logging setup once: the root logger gets a queue
+    handler, and a background listener writes JSON lines to a size-rotated file
+    plus readable lines to the console. Later calls are no-ops.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            os.path.join(log_dir, log_file), maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+        log_queue: queue.Queue = queue.Queue(-1)
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                                   respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(TruncatingQueueHandler(log_queue, max_field_chars))
+        root.setLevel(level.upper())
+        for name, module_level in (module_levels or {}).items():
+            logging.getLogger(name).setLevel(module_level)
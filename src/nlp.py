@@ -1,63 +1,193 @@
 import logging
-import os
 from dotenv import load_dotenv
 from langchain_core.messages import SystemMessage, HumanMessage
-from src.config import llm, GROQ_API_KEY
+from src.config import llm, GROQ_API_KEY, CHUNK_THRESHOLD_CHARS, CHUNK_MAX_CHARS, EXTRACTION_CONCURRENCY
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
 import json
-from typing import List, Dict
+import re
+from typing import List, Dict, Optional
 
 load_dotenv()
 
-os.makedirs(os.path.join("logs"), exist_ok=True)  
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join("logs", "app.log")),
-        logging.StreamHandler()
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSION = "2"
+
+def _build_extraction_messages(text: str) -> list:
+    return [
+        SystemMessage(content="You are a medical data extraction assistant."),
+        HumanMessage(content=f"""
+            You are a medical data extraction expert.
+
+            Given the following medical report, extract all explicitly mentioned information related to test results and return it as a **valid JSON array** of dictionaries. Each dictionary should represent a test result or relevant metadata (e.g., patient information) as found in the text.
+
+            **Important Instructions:**
+            - Include **only** fields that are explicitly mentioned in the report (e.g., test name, value, unit, normal range, patient name, age, date, etc.).
+            - Do **not** guess, hallucinate, or add fields not present in the text.
+            - Do **not** perform any calculations or inferences (e.g., do not compute status or categorize values).
+            - Each dictionary should contain key-value pairs for the fields explicitly stated in the report.
+            - Your response must be a **JSON array of dictionaries**.
+            - Return **only** the JSON array — no explanations, no markdown, no code formatting, no comments.
+
+            Medical Report:
+            {text}
+            """)
     ]
-)
 
-def structure_data(text: str) -> List[Dict]:
+def _parse_extraction(content: str) -> List[Dict]:
+    try:
+        results = json.loads(content.strip())
+        if not isinstance(results, list):
+            logger.warning("LLM returned non-list response")
+            return []
+        logger.info(f"Extracted {len(results)} results from LLM response")
+        return results
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse LLM response as JSON: {str(e)}")
+        return []
+
+def _extract_chunk(text: str) -> List[Dict]:
+    logger.info("Extracting structured data using LLM.")
+    try:
+        response = llm.invoke(_build_extraction_messages(text))
+        logger.info("✅ Response received from Groq.")
+        return _parse_extraction(response.content)
+    except Exception as e:
+        logger.exception(f"LLM structuring failed: {str(e)}")
+        return []
+
+async def _aextract_chunk(text: str) -> List[Dict]:
+    logger.info("Extracting structured data using LLM (async).")
+    try:
+        response = await llm.ainvoke(_build_extraction_messages(text))
+        logger.info("✅ Response received from Groq.")
+        return _parse_extraction(response.content)
+    except Exception as e:
+        logger.exception(f"LLM structuring failed: {str(e)}")
+        return []
+
+# Page breaks first, then blank-line section breaks, then single lines.
+_SPLIT_PATTERNS = [
+    re.compile(r"\f|\n(?=[ \t]*page[ \t]+\d+(?:[ \t]+of[ \t]+\d+)?[ \t]*\n)", re.IGNORECASE),
+    re.compile(r"\n[ \t]*\n"),
+    re.compile(r"\n"),
+]
+
+def _split_to_fit(text: str, max_chars: int, level: int = 0) -> List[str]:
+    if len(text) <= max_chars:
+        return [text]
+    if level >= len(_SPLIT_PATTERNS):
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+    pieces = []
+    for part in _SPLIT_PATTERNS[level].split(text):
+        pieces.extend(_split_to_fit(part, max_chars, level + 1))
+    return pieces
+
+def split_report_text(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    """
+    Split report text into chunks of at most ``max_chars`` along page, then
+    section, then line boundaries, packing adjacent pieces together.
+    """
+    chunks, current = [], ""
+    for piece in _split_to_fit(text, max_chars):
+        if not piece.strip():
+            continue
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _normalize_field(key) -> str:
+    return re.sub(r"[^a-z]", "", str(key).lower())
+
+# Fields telling serial measurements of one test apart (collection date, time, sample).
+_WHEN_FIELD = re.compile(r"date|time|collected|sampled|sample")
+
+def _row_key(row: Dict) -> str:
+    normalized = {_normalize_field(k): re.sub(r"\s+", " ", str(v)).strip().lower()
+                  for k, v in row.items() if v not in (None, "")}
+    name = normalized.get("testname") or normalized.get("test")
+    if name is not None:
+        when = [value for field, value in sorted(normalized.items()) if _WHEN_FIELD.search(field)]
+        return json.dumps([name, normalized.get("value") or normalized.get("result"), when])
+    return json.dumps(sorted(normalized.items()))
+
+def _is_test_row(row: Dict) -> bool:
+    return any(_normalize_field(k) in ("testname", "test") and v not in (None, "") for k, v in row.items())
+
+def merge_extracted(parts: List[List[Dict]]) -> List[Dict]:
+    """
+    Merge per-chunk extraction results in order, dropping rows repeated across
+    chunks: metadata such as patient details printed on every page, and test
+    rows with the same name, value and date/time. Identical test rows within
+    one chunk are separate measurements and are all kept; across chunks the
+    n-th occurrence in one chunk merges with the n-th in another. Fields
+    missing from the first occurrence are filled in from later duplicates.
+    """
+    merged: Dict[str, Dict] = {}
+    for rows in parts:
+        occurrences: Dict[str, int] = {}
+        for row in rows:
+            if not isinstance(row, dict):
+                continue
+            key = _row_key(row)
+            if _is_test_row(row):
+                occurrences[key] = occurrences.get(key, 0) + 1
+                key = f"{key}#{occurrences[key]}"
+            if key in merged:
+                present = {_normalize_field(k) for k, v in merged[key].items() if v not in (None, "")}
+                for field, value in row.items():
+                    if _normalize_field(field) not in present and value not in (None, ""):
+                        merged[key][field] = value
+            else:
+                merged[key] = dict(row)
+    return list(merged.values())
+
+def structure_data(text: str, chunked: Optional[bool] = None) -> List[Dict]:
     """
     Use Groq LLM to extract all explicitly mentioned test result information from medical report text.
     Returns a list of dictionaries with all fields found in the report.
+
+    Reports longer than CHUNK_THRESHOLD_CHARS (or any report when ``chunked`` is
+    True) are split into page/section chunks that are extracted in parallel,
+    at most EXTRACTION_CONCURRENCY at a time, and merged.
     """
-    logging.info("Extracting structured data using LLM.")
-    try:
-        messages = [
-            SystemMessage(content="You are a medical data extraction assistant."),
-            HumanMessage(content=f"""
-                You are a medical data extraction expert.
-
-                Given the following medical report, extract all explicitly mentioned information related to test results and return it as a **valid JSON array** of dictionaries. Each dictionary should represent a test result or relevant metadata (e.g., patient information) as found in the text.
-
-                **Important Instructions:**
-                - Include **only** fields that are explicitly mentioned in the report (e.g., test name, value, unit, normal range, patient name, age, date, etc.).
-                - Do **not** guess, hallucinate, or add fields not present in the text.
-                - Do **not** perform any calculations or inferences (e.g., do not compute status or categorize values).
-                - Each dictionary should contain key-value pairs for the fields explicitly stated in the report.
-                - Your response must be a **JSON array of dictionaries**.
-                - Return **only** the JSON array — no explanations, no markdown, no code formatting, no comments.
-
-                Medical Report:
-                {text}
-                """)
-        ]
-
-        response = llm.invoke(messages)
-        logging.info("✅ Response received from Groq.")
-        
-        try:
-            results = json.loads(response.content.strip())
-            if not isinstance(results, list):
-                logging.warning("LLM returned non-list response")
-                return []
-            logging.info(f"Extracted {len(results)} results from LLM response")
-            return results
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse LLM response as JSON: {str(e)}")
-            return []
-    except Exception as e:
-        logging.exception(f"LLM structuring failed: {str(e)}")
-        return []
\ No newline at end of file
+    if chunked is None:
+        chunked = len(text) > CHUNK_THRESHOLD_CHARS
+    if not chunked:
+        return _extract_chunk(text)
+
+    chunks = split_report_text(text)
+    logger.info(f"Extracting {len(chunks)} chunks with concurrency {EXTRACTION_CONCURRENCY}")
+    with ThreadPoolExecutor(max_workers=EXTRACTION_CONCURRENCY) as pool:
+        # Copy the caller's context so chunk calls keep its LLM priority.
+        futures = [pool.submit(contextvars.copy_context().run, _extract_chunk, chunk) for chunk in chunks]
+        parts = [future.result() for future in futures]
+    results = merge_extracted(parts)
+    logger.info(f"Merged {sum(len(p) for p in parts)} chunk rows into {len(results)} results")
+    return results
+
+async def astructure_data(text: str, chunked: Optional[bool] = None) -> List[Dict]:
+    """Async variant of structure_data using llm.ainvoke."""
+    if chunked is None:
+        chunked = len(text) > CHUNK_THRESHOLD_CHARS
+    if not chunked:
+        return await _aextract_chunk(text)
+
+    chunks = split_report_text(text)
+    logger.info(f"Extracting {len(chunks)} chunks with concurrency {EXTRACTION_CONCURRENCY} (async)")
+    semaphore = asyncio.Semaphore(EXTRACTION_CONCURRENCY)
+
+    async def extract(chunk: str) -> List[Dict]:
+        async with semaphore:
+            return await _aextract_chunk(chunk)
+
+    parts = await asyncio.gather(*(extract(chunk) for chunk in chunks))
+    results = merge_extracted(parts)
+    logger.info(f"Merged {sum(len(p) for p in parts)} chunk rows into {len(results)} results")
+    return results
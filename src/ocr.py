@@ -1,28 +1,154 @@
-import pytesseract
-from src.preprocess import extract_text_from_pdf
-import logging, os
-
-os.makedirs(os.path.join("logs"), exist_ok=True)
-logging.basicConfig( 
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join("logs", "app.log")),
-        logging.StreamHandler() 
-    ]
-)
-
-def extract_text(file_path: str) -> str:
-    """Extract text from image or PDF."""
-    logging.info(f"Starting text extraction for file: {file_path}")
+import numpy as np
+from PIL import Image, ImageSequence
+from src.preprocess import Source, describe_source, extract_text_from_pdf, get_process_pool, open_source
+from src.tracing import span
+from src.lazy import components
+from typing import Dict, List, Optional, Tuple
+import logging, os, time
+
+logger = logging.getLogger(__name__)
+
+EXTRACTOR_VERSION = "1"
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+
+# Read directly from the environment for the same reason as src.preprocess:
+# OCR workers import this module and must not construct the LLM client.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2500"))
+OCR_TESSERACT_CONFIG = os.getenv("OCR_TESSERACT_CONFIG", "--oem 1 --psm 6")
+
+def _deskew(binary: np.ndarray) -> np.ndarray:
+    """Rotate a binarized page so its text lines are horizontal."""
+    cv2 = components.get("cv2")
+    coords = np.column_stack(np.where(binary < 128))
+    if len(coords) < 50:
+        return binary
+    angle = cv2.minAreaRect(coords[:, ::-1].astype(np.float32))[-1]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    if abs(angle) < 0.5:
+        return binary
+    height, width = binary.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(binary, matrix, (width, height), flags=cv2.INTER_CUBIC,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+def preprocess_image(image: np.ndarray, source_dpi: Optional[float] = None) -> np.ndarray:
+    """
+    Prepare a photo or scan for tesseract: grayscale, downscale to OCR_TARGET_DPI
+    (or to OCR_MAX_SIDE pixels when the DPI is unknown), adaptive threshold, deskew.
+    """
+    cv2 = components.get("cv2")
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+    scale = 1.0
+    if source_dpi and source_dpi > OCR_TARGET_DPI:
+        scale = OCR_TARGET_DPI / source_dpi
+    longest = max(gray.shape) * scale
+    if longest > OCR_MAX_SIDE:
+        scale *= OCR_MAX_SIDE / longest
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    gray = cv2.medianBlur(gray, 3)
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15)
+    return _deskew(binary)
+
+def load_image_frames(source: Source) -> List[Tuple[np.ndarray, Optional[float]]]:
+    """Load every frame of an image (multi-page TIFFs included), from a path or memory, with its DPI, if known."""
+    frames = []
+    with open_source(source) as image_file, Image.open(image_file) as image:
+        dpi = image.info.get("dpi", (None,))[0]
+        for frame in ImageSequence.Iterator(image):
+            frames.append((np.array(frame.convert("RGB")), float(dpi) if dpi else None))
+    return frames
+
+def _ocr_frame(source: str, index: int, image: np.ndarray, dpi: Optional[float]) -> Dict:
+    """OCR one frame and report its text, mean word confidence and timing."""
+    pytesseract = components.get("pytesseract")
+    started = time.perf_counter()
+    prepared = preprocess_image(image, dpi)
+    preprocess_seconds = time.perf_counter() - started
+
+    data = pytesseract.image_to_data(prepared, config=OCR_TESSERACT_CONFIG, output_type=pytesseract.Output.DICT)
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if not word.strip() or confidence < 0:
+            continue
+        lines.setdefault((data["block_num"][i], data["par_num"][i], data["line_num"][i]), []).append(word)
+        confidences.append(confidence)
+
+    return {
+        "source": source,
+        "frame": index,
+        "text": "\n".join(" ".join(words) for words in lines.values()),
+        "confidence": round(sum(confidences) / len(confidences), 1) if confidences else 0.0,
+        "preprocess_seconds": preprocess_seconds,
+        "seconds": time.perf_counter() - started,
+    }
+
+def ocr_images(images: List[Source], workers: Optional[int] = None) -> List[Dict]:
+    """
+    OCR every frame of every image, spreading frames across the shared process pool
+    when there is more than one. Returns one report per frame, in input order.
+    """
+    jobs = [(describe_source(image), index, frame, dpi)
+            for image in images
+            for index, (frame, dpi) in enumerate(load_image_frames(image))]
+    workers = OCR_WORKERS if workers is None else workers
+    if workers <= 1 or len(jobs) <= 1:
+        return [_ocr_frame(*job) for job in jobs]
+
+    pool = get_process_pool(min(workers, len(jobs)))
+    futures = [pool.submit(_ocr_frame, *job) for job in jobs]
+    return [future.result() for future in futures]
+
+def extract_text_from_image(source: Source, report: Optional[List[Dict]] = None) -> str:
+    """OCR an image path or in-memory image; pass a list as ``report`` to receive per-frame timing and confidence."""
+    logger.info(f"Running OCR on image: {describe_source(source)}")
+    with span("image_ocr", kind="extract") as ocr_span:
+        frames = ocr_images([source])
+        ocr_span.set(frames=len(frames), chars=sum(len(frame["text"]) for frame in frames))
+    if report is not None:
+        report.extend({k: v for k, v in frame.items() if k != "text"} for frame in frames)
+    for frame in frames:
+        logger.info(f"OCR frame {frame['frame']}: confidence {frame['confidence']}, {frame['seconds']:.2f}s")
+    return "".join(f"{frame['text']}\n" for frame in frames if frame["text"])
+
+def _is_pdf(source: Source, file_name: str) -> bool:
+    if file_name:
+        return file_name.lower().endswith(".pdf")
+    with open_source(source) as f:
+        return f.read(5) == b"%PDF-"
+
+def extract_text(source: Source, file_name: Optional[str] = None) -> str:
+    """
+    Extract text from image or PDF.
+
+    ``source`` is a path, or the file's bytes/buffer/stream read straight from
+    memory; ``file_name`` supplies the extension for in-memory sources (without
+    it, PDFs are recognized by their header and anything else is OCRed).
+    """
+    file_name = file_name or (source if isinstance(source, str) else "")
+    label = file_name or describe_source(source)
+    logger.info(f"Starting text extraction for file: {label}")
     try:
-        if file_path.lower().endswith(".pdf"):
-            text = extract_text_from_pdf(file_path)
-            logging.info("Text extracted from PDF")
+        if _is_pdf(source, file_name):
+            text = extract_text_from_pdf(source)
+            logger.info("Text extracted from PDF")
+        elif not file_name or file_name.lower().endswith(IMAGE_EXTENSIONS):
+            text = extract_text_from_image(source)
+            logger.info("Text extracted from image")
         else:
-            logging.error(f"Unsupported file format: {file_path}")
+            logger.error(f"Unsupported file format: {label}")
             raise ValueError("Unsupported file format. Use PDF, PNG, or JPEG.")
         return text
     except Exception as e:
-        logging.error(f"Error in OCR for {file_path}: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error(f"Error in OCR for {label}: {str(e)}")
+        raise
@@ -6,15 +6,37 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT
 from reportlab.lib import colors
 from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Dict
-import logging, os
+import hashlib
+import json
+import logging
+import re
+import threading
 
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.FileHandler("logs/app.log"), logging.StreamHandler()],
-)
+logger = logging.getLogger(__name__)
+
+_SUMMARY_RE = re.compile(r"\*\*Summary:\*\*(.*?)\*\*", re.DOTALL)
+_RISKS_RE = re.compile(r"\*\*Risks/Conditions:\*\*(.*?)\*\*", re.DOTALL)
+_ACTIONS_RE = re.compile(r"\*\*Actions/Recommendations:\*\*(.*)", re.DOTALL)
+
+RESULTS_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+])
+
+@lru_cache(maxsize=1)
+def _styles():
+    """The sample style sheet plus the bullet 'List' style, built once and only read afterwards."""
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='List', leftIndent=20, fontSize=10, spaceAfter=6))
+    return styles
 
 def generate_pdf_summary(
     results: List[Dict],
@@ -22,12 +44,11 @@ def generate_pdf_summary(
     summary_bullets: str,
     output_path: str = None
 ) -> bytes:
-    logging.info("Generating improved PDF summary")
+    logger.info("Generating improved PDF summary")
     buffer = BytesIO()
     try:
         doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        styles.add(ParagraphStyle(name='List', leftIndent=20, fontSize=10, spaceAfter=6))
+        styles = _styles()
         story = []
 
         story.append(Paragraph("🩺 Medical Report Summary", styles["Title"]))
@@ -54,14 +75,7 @@ def generate_pdf_summary(
                     res.get("status", "Unknown")
                 ])
             table = Table(data, hAlign='LEFT', colWidths=[130, 70, 70, 130, 80])
-            table.setStyle(TableStyle([
-                ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-            ]))
+            table.setStyle(RESULTS_TABLE_STYLE)
             story.append(table)
             story.append(Spacer(1, 12))
 
@@ -75,10 +89,9 @@ def generate_pdf_summary(
             story.append(Paragraph("📌 Summary and Recommendations", styles["Heading2"]))
 
             try:
-                import re
-                summary_match = re.search(r"\*\*Summary:\*\*(.*?)\*\*", summary_bullets, re.DOTALL)
-                risks_match = re.search(r"\*\*Risks/Conditions:\*\*(.*?)\*\*", summary_bullets, re.DOTALL)
-                actions_match = re.search(r"\*\*Actions/Recommendations:\*\*(.*)", summary_bullets, re.DOTALL)
+                summary_match = _SUMMARY_RE.search(summary_bullets)
+                risks_match = _RISKS_RE.search(summary_bullets)
+                actions_match = _ACTIONS_RE.search(summary_bullets)
 
                 if summary_match:
                     story.append(Paragraph("📋 <b>Summary:</b>", styles["Normal"]))
@@ -101,15 +114,40 @@ def generate_pdf_summary(
                     story.append(ListFlowable(action_items, bulletType='bullet'))
 
             except Exception as e:
-                logging.warning("Failed to parse summary bullet points. Falling back to plain text.")
+                logger.warning("Failed to parse summary bullet points. Falling back to plain text.")
                 story.append(Paragraph(summary_bullets.replace("\n", " "), styles["Normal"]))
 
         doc.build(story)
         pdf_bytes = buffer.getvalue()
         buffer.close()
-        logging.info("Improved PDF summary generated successfully")
+        logger.info("Improved PDF summary generated successfully")
         return pdf_bytes
 
     except Exception as e:
-        logging.error(f"Error generating PDF: {str(e)}")
+        logger.error(f"Error generating PDF: {str(e)}")
         raise
+
+
+_render_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-render")
+_rendered: "OrderedDict[str, Future]" = OrderedDict()
+_rendered_lock = threading.Lock()
+MAX_RENDERED = 32
+
+def prerender_pdf_summary(results: List[Dict], explanations: str, summary_bullets: str) -> Future:
+    """
+    Start rendering the PDF summary on a background thread and return a future
+    for its bytes. Identical inputs share one render, so reruns reuse it.
+    """
+    key = hashlib.sha256(
+        json.dumps([results, explanations, summary_bullets], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    with _rendered_lock:
+        future = _rendered.get(key)
+        if future is not None and not (future.done() and future.exception() is not None):
+            _rendered.move_to_end(key)
+            return future
+        future = _render_pool.submit(generate_pdf_summary, results, explanations, summary_bullets)
+        _rendered[key] = future
+        while len(_rendered) > MAX_RENDERED:
+            _rendered.popitem(last=False)
+    return future
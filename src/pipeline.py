@@ -0,0 +1,369 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from src.config import FUSED_PIPELINE, STAGE_TIMEOUT_SECONDS, ANALYSIS_CONCURRENCY, INCREMENTAL_ANALYSIS
+from src.cache import pipeline_cache, hash_bytes
+from src.ocr import extract_text, EXTRACTOR_VERSION
+from src.preprocess import Source
+from src.nlp import astructure_data, PROMPT_VERSION as STRUCTURE_PROMPT_VERSION
+from src.categorize import acategorize_results, PROMPT_VERSION as CATEGORIZE_PROMPT_VERSION
+from src.table_formatter import aformat_results_for_table, PROMPT_VERSION as TABLE_PROMPT_VERSION
+from src.explain import astream_explanations, EXPLANATION_ERROR, PROMPT_VERSION as EXPLAIN_PROMPT_VERSION
+from src.summary import astream_summary_bullet_points, SUMMARY_ERROR, PROMPT_VERSION as SUMMARY_PROMPT_VERSION
+from src.fused import aextract_categorize_format, PROMPT_VERSION as FUSED_PROMPT_VERSION
+from src.incremental import IncrementalPlan, revisions
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class StageSkipped(Exception):
+    """Raised for a stage whose dependencies failed, so it never ran."""
+
+
+class Stage:
+    """A named pipeline node whose coroutine receives the results of completed stages."""
+
+    def __init__(self, name: str, func: StageFunc, deps: Sequence[str] = (),
+                 timeout: Optional[float] = STAGE_TIMEOUT_SECONDS):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+
+
+class PipelineDAG:
+    """
+    Runs stages as soon as their dependencies finish, so independent stages overlap.
+
+    Each stage is bounded by its timeout. A failed or timed-out stage is recorded
+    in ``errors`` and every stage depending on it is skipped. ``cancel()`` may be
+    called from any thread; exceptions raised by the ``on_complete``/``on_tick``/
+    ``on_progress`` callbacks (for example Streamlit's rerun signal) cancel all
+    running stages and propagate to the caller.
+
+    Stages that produce output gradually call ``progress`` with their partial
+    value; it reaches ``on_progress`` at most once per ``progress_interval``.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            missing = [dep for dep in stage.deps if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+        self._check_acyclic()
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._on_progress: Optional[Callable[[str, Any], None]] = None
+        self._progress_interval = 0.0
+        self._last_progress: Dict[str, float] = {}
+
+    def _check_acyclic(self) -> None:
+        visiting, done = set(), set()
+
+        def visit(name: str):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a dependency cycle through '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def cancel(self) -> None:
+        """Cancel every running stage; safe to call from another thread."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(lambda: [task.cancel() for task in self._tasks])
+
+    def progress(self, name: str, value: Any) -> None:
+        """Report a partial result for stage ``name``; updates closer together than the interval are dropped."""
+        if self._on_progress is None:
+            return
+        now = time.monotonic()
+        if now - self._last_progress.get(name, float("-inf")) < self._progress_interval:
+            return
+        self._last_progress[name] = now
+        self._on_progress(name, value)
+
+    async def run(self, on_complete: Optional[Callable[[str, Any, Optional[BaseException]], None]] = None,
+                  on_tick: Optional[Callable[[List[str]], None]] = None,
+                  tick_interval: float = 0.5,
+                  on_progress: Optional[Callable[[str, Any], None]] = None,
+                  progress_interval: float = 0.15) -> Dict[str, Any]:
+        """Execute the graph and return the results of the stages that succeeded."""
+        self._loop = asyncio.get_running_loop()
+        self._on_progress = on_progress
+        self._progress_interval = progress_interval
+        self._last_progress.clear()
+        tasks: Dict[str, asyncio.Task] = {}
+        running: set = set()
+
+        async def run_stage(stage: Stage):
+            if stage.deps:
+                await asyncio.wait([tasks[dep] for dep in stage.deps])
+            failed = [dep for dep in stage.deps if dep in self.errors]
+            if failed:
+                error: Optional[BaseException] = StageSkipped(f"skipped because {', '.join(failed)} failed")
+                value = None
+            else:
+                running.add(stage.name)
+                try:
+                    with span(stage.name, kind="stage"):
+                        value = await asyncio.wait_for(stage.func(self.results), stage.timeout)
+                    self.results[stage.name] = value
+                    error = None
+                except asyncio.TimeoutError:
+                    value, error = None, TimeoutError(f"Stage '{stage.name}' timed out after {stage.timeout}s")
+                except Exception as e:
+                    value, error = None, e
+                finally:
+                    running.discard(stage.name)
+            if error is not None:
+                self.errors[stage.name] = error
+                if not isinstance(error, StageSkipped):
+                    logger.error(f"Pipeline stage '{stage.name}' failed: {str(error)}")
+            if on_complete:
+                on_complete(stage.name, value, error)
+
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.create_task(run_stage(stage), name=name)
+        self._tasks = list(tasks.values())
+
+        async def tick():
+            while True:
+                await asyncio.sleep(tick_interval)
+                on_tick(sorted(running))
+
+        ticker = asyncio.create_task(tick()) if on_tick else None
+        pending = set(self._tasks) | ({ticker} if ticker else set())
+        try:
+            while any(not task.done() for task in self._tasks):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+            if any(task.cancelled() for task in self._tasks):
+                raise asyncio.CancelledError()
+        finally:
+            for task in [*self._tasks, *([ticker] if ticker else [])]:
+                task.cancel()
+            self._loop = None
+            self._on_progress = None
+        return self.results
+
+
+def split_results(categorized: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Split categorized rows into (test_results, metadata)."""
+    test_results = [r for r in categorized if "test_name" in r or "Test" in r]
+    metadata = [r for r in categorized if "test_name" not in r and "Test" not in r]
+    return test_results, metadata
+
+
+async def collect_stream(dag: PipelineDAG, name: str, stream: AsyncIterator[str], error_value: str) -> str:
+    """
+    Accumulate a token stream into the stage's final text, reporting the text so
+    far through ``dag.progress``. Returns ``error_value`` if the stream fails.
+    """
+    text = ""
+    try:
+        async for token in stream:
+            text += token
+            dag.progress(name, text)
+    except Exception as e:
+        logger.error(f"Streaming stage '{name}' failed: {str(e)}")
+        return error_value
+    return text.strip() or error_value
+
+
+def text_cache_key(file_hash: str) -> str:
+    return pipeline_cache.stage_key(file_hash, "extract", EXTRACTOR_VERSION, model_name="")
+
+
+def extract_uploaded_text(file_name: str, file_bytes: Source, file_hash: Optional[str] = None) -> str:
+    """
+    Extract an upload's text straight from memory, without writing it to disk.
+    Served from ``pipeline_cache``, so the analysis and the chatbot read each file once.
+    """
+    file_hash = file_hash or hash_bytes(file_bytes)
+    return pipeline_cache.get_or_compute(text_cache_key(file_hash), lambda: extract_text(file_bytes, file_name))
+
+
+def build_analysis_pipeline(file_name: str, file_bytes: Source, fused: bool = FUSED_PIPELINE,
+                            incremental: bool = INCREMENTAL_ANALYSIS, file_hash: Optional[str] = None,
+                            session_id: Optional[str] = None) -> PipelineDAG:
+    """
+    Build the analysis graph for one uploaded report:
+
+        text -> previous -> fused -> structured -> categorized -> table -------------> revision
+                                                              -> explanation -> summary ->
+
+    ``table`` and ``explanation`` only depend on ``categorized`` and run
+    concurrently. Every stage is served from ``pipeline_cache`` when possible.
+    ``explanation`` and ``summary`` stream from the LLM and report their partial
+    text through ``on_progress`` while they run.
+
+    With ``incremental`` and a ``session_id``, ``previous`` looks for an earlier
+    revision of the report analyzed in the same session; when one is found the
+    later stages redo only what its text diff changed (see ``src.incremental``),
+    and ``revision`` stores the final results for the next revision.
+
+    ``file_bytes`` may be any in-memory source (e.g. an upload's ``getbuffer()``);
+    pass ``file_hash`` when it is already known to skip hashing it again.
+    """
+    file_hash = file_hash or hash_bytes(file_bytes)
+    text_key = text_cache_key(file_hash)
+    fused_key = pipeline_cache.stage_key(file_hash, "fused", FUSED_PROMPT_VERSION, parent_key=text_key)
+    structure_key = pipeline_cache.stage_key(file_hash, "structure", STRUCTURE_PROMPT_VERSION, parent_key=text_key)
+    categorize_key = pipeline_cache.stage_key(file_hash, "categorize", CATEGORIZE_PROMPT_VERSION, parent_key=structure_key)
+
+    def categorized_key(results):
+        return fused_key if results.get("fused") else categorize_key
+
+    async def text_stage(results):
+        raw_text = await asyncio.to_thread(extract_uploaded_text, file_name, file_bytes, file_hash)
+        if not raw_text:
+            raise ValueError("Text extraction failed")
+        return raw_text
+
+    async def previous_stage(results):
+        if not incremental or not session_id or pipeline_cache.contains(categorize_key) or pipeline_cache.contains(fused_key):
+            return None
+        found = await asyncio.to_thread(revisions.find_previous, file_hash, file_name, results["text"], session_id)
+        if found is None:
+            return None
+        previous, diff = found
+        with span("incremental_plan", kind="stage") as plan_span:
+            plan_span.set(similarity=round(diff.similarity, 3), sections=len(diff.sections),
+                          changed_chars=diff.changed_chars, text_chars=len(results["text"]))
+        return IncrementalPlan(previous, diff)
+
+    async def fused_stage(results):
+        if not fused or results.get("previous"):
+            return None
+        payload = await pipeline_cache.aget_or_compute(fused_key, lambda: aextract_categorize_format(results["text"]))
+        if not payload:
+            logger.warning("Fused stage failed validation; falling back to separate stages")
+        return payload
+
+    async def structured_stage(results):
+        if results.get("fused"):
+            return results["fused"]["metadata"] + results["fused"]["tests"]
+        plan = results.get("previous")
+        structured = await pipeline_cache.aget_or_compute(
+            structure_key, lambda: plan.astructure() if plan else astructure_data(results["text"])
+        )
+        if not structured:
+            raise ValueError("Data structuring failed")
+        return structured
+
+    async def categorized_stage(results):
+        if results.get("fused"):
+            return results["structured"]
+        structured = results["structured"]
+        plan = results.get("previous")
+        categorized = await pipeline_cache.aget_or_compute(
+            categorize_key,
+            lambda: plan.acategorize(structured) if plan else acategorize_results(structured),
+            should_cache=lambda v: bool(v) and v != structured
+        )
+        if not categorized:
+            raise ValueError("Categorization failed")
+        return categorized
+
+    async def table_stage(results):
+        if results.get("fused"):
+            return results["fused"]["tests"]
+        test_results, _ = split_results(results["categorized"])
+        if not test_results:
+            return []
+        table_key = pipeline_cache.stage_key(file_hash, "table", TABLE_PROMPT_VERSION, parent_key=categorized_key(results))
+        plan = results.get("previous")
+        return await pipeline_cache.aget_or_compute(
+            table_key, lambda: plan.aformat_table(test_results) if plan else aformat_results_for_table(test_results)
+        )
+
+    async def explanation_stage(results):
+        test_results, _ = split_results(results["categorized"])
+        if not test_results:
+            return None
+        explain_key = pipeline_cache.stage_key(file_hash, "explain", EXPLAIN_PROMPT_VERSION, parent_key=categorized_key(results))
+        plan = results.get("previous")
+        stream = plan.astream_explanation(test_results) if plan else None
+        return await pipeline_cache.aget_or_compute(
+            explain_key,
+            lambda: collect_stream(dag, "explanation", stream or astream_explanations(test_results), EXPLANATION_ERROR),
+            should_cache=lambda v: bool(v) and v != EXPLANATION_ERROR
+        )
+
+    async def summary_stage(results):
+        explanation = results["explanation"]
+        if not explanation or explanation == EXPLANATION_ERROR:
+            return None
+        explain_key = pipeline_cache.stage_key(file_hash, "explain", EXPLAIN_PROMPT_VERSION, parent_key=categorized_key(results))
+        summary_key = pipeline_cache.stage_key(file_hash, "summary", SUMMARY_PROMPT_VERSION, parent_key=explain_key)
+        plan = results.get("previous")
+        if plan and plan.previous.get("explanation") == explanation and plan.previous.get("summary"):
+            return plan.previous["summary"]
+        return await pipeline_cache.aget_or_compute(
+            summary_key,
+            lambda: collect_stream(dag, "summary", astream_summary_bullet_points(explanation), SUMMARY_ERROR),
+            should_cache=lambda v: bool(v) and v != SUMMARY_ERROR
+        )
+
+    async def revision_stage(results):
+        if not incremental or not session_id:
+            return None
+        revision = {name: results.get(name) for name in ("text", "structured", "categorized", "table", "explanation", "summary")}
+        await asyncio.to_thread(revisions.save, file_hash, file_name, revision, session_id)
+        return None
+
+    dag = PipelineDAG([
+        Stage("text", text_stage),
+        Stage("previous", previous_stage, deps=["text"]),
+        Stage("fused", fused_stage, deps=["text", "previous"]),
+        Stage("structured", structured_stage, deps=["text", "fused"]),
+        Stage("categorized", categorized_stage, deps=["structured"]),
+        Stage("table", table_stage, deps=["categorized"]),
+        Stage("explanation", explanation_stage, deps=["categorized"]),
+        Stage("summary", summary_stage, deps=["explanation"]),
+        Stage("revision", revision_stage, deps=["table", "summary"]),
+    ])
+    return dag
+
+
+def run_pipeline_sync(dag: PipelineDAG, **kwargs) -> Dict[str, Any]:
+    """Run ``dag`` to completion from synchronous code (Streamlit script, CLI)."""
+    return asyncio.run(dag.run(**kwargs))
+
+
+async def run_pipelines(runs: Sequence[Tuple[PipelineDAG, Dict[str, Any]]],
+                        max_concurrency: int = ANALYSIS_CONCURRENCY) -> List[Dict[str, Any]]:
+    """
+    Run several graphs concurrently, each with its own ``run`` keyword arguments,
+    with at most ``max_concurrency`` of them executing at once. Results are
+    returned in the order of ``runs``.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run_one(dag: PipelineDAG, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await dag.run(**kwargs)
+
+    return list(await asyncio.gather(*(run_one(dag, kwargs) for dag, kwargs in runs)))
+
+
+def run_pipelines_sync(runs: Sequence[Tuple[PipelineDAG, Dict[str, Any]]], **kwargs) -> List[Dict[str, Any]]:
+    """Run several graphs to completion from synchronous code."""
+    return asyncio.run(run_pipelines(runs, **kwargs))
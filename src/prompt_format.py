@@ -0,0 +1,84 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+ROW_ID = "id"
+
+
+def row_id(index: int) -> str:
+    """Short, stable ID for the row at ``index`` of a prompt payload."""
+    return f"r{index}"
+
+
+def _columns(rows: List[Dict]) -> List[str]:
+    columns: List[str] = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+
+def encode_rows(rows: List[Dict], columns: Optional[Sequence[str]] = None, with_ids: bool = True) -> str:
+    """
+    Serialize ``rows`` as compact columnar JSON: the keys are written once in
+    ``columns`` and each row becomes an array of values (null where a row has
+    no such key), prefixed with its ID when ``with_ids`` is set.
+
+    ``[{"test_name": "Glucose", "value": "121"}]`` becomes
+    ``{"columns":["id","test_name","value"],"rows":[["r0","Glucose","121"]]}``.
+    """
+    columns = list(columns) if columns is not None else _columns(rows)
+    header = [ROW_ID] + columns if with_ids else columns
+    encoded = []
+    for index, row in enumerate(rows):
+        values = [row.get(column) for column in columns]
+        encoded.append([row_id(index)] + values if with_ids else values)
+    return json.dumps({"columns": header, "rows": encoded}, ensure_ascii=False, separators=(",", ":"))
+
+
+def legacy_encode_rows(rows: List[Dict]) -> str:
+    """The pretty-printed encoding the prompts used before; kept for the token report."""
+    return json.dumps(rows, indent=2)
+
+
+def decode_rows(parsed: Any, columns: Sequence[str]) -> Optional[List[Dict]]:
+    """
+    Turn a model response back into dictionaries. Accepts the columnar object
+    produced by ``encode_rows``, a bare list of arrays in ``columns`` order, or
+    a list of dictionaries. Returns None for any other shape.
+    """
+    if isinstance(parsed, dict) and isinstance(parsed.get("rows"), list):
+        columns = parsed.get("columns") or columns
+        parsed = parsed["rows"]
+    if not isinstance(parsed, list):
+        return None
+    rows = []
+    for item in parsed:
+        if isinstance(item, dict):
+            rows.append(item)
+        elif isinstance(item, list) and len(item) == len(columns):
+            rows.append(dict(zip(columns, item)))
+        else:
+            return None
+    return rows
+
+
+def index_by_row_id(rows: List[Dict], count: int) -> Dict[int, Dict]:
+    """
+    Map each returned row to the position of the input row it answers, using
+    its ID. Unknown, out-of-range and repeated IDs are dropped.
+    """
+    indexed: Dict[int, Dict] = {}
+    for row in rows:
+        value = str(row.get(ROW_ID, ""))
+        if not value.startswith("r") or not value[1:].isdigit():
+            continue
+        index = int(value[1:])
+        if index < count and index not in indexed:
+            indexed[index] = {key: item for key, item in row.items() if key != ROW_ID}
+    if len(indexed) != len(rows):
+        logger.warning(f"Dropped {len(rows) - len(indexed)} returned rows with unknown or repeated IDs")
+    return indexed
@@ -0,0 +1,192 @@
+import re
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from src.reference_ranges import parse_value, parse_range
+
+# Canonical analyte -> other names patients and labs use for it.
+ANALYTE_SYNONYMS: Dict[str, List[str]] = {
+    "hemoglobin": ["haemoglobin", "hb", "hgb"],
+    "hematocrit": ["haematocrit", "hct", "pcv", "packed cell volume"],
+    "white blood cells": ["white blood cell", "white blood cell count", "wbc", "wbc count", "leukocytes",
+                          "leucocytes", "tlc", "total leukocyte count"],
+    "red blood cells": ["red blood cell", "red blood cell count", "rbc", "rbc count", "erythrocytes"],
+    "platelets": ["platelet", "platelet count", "plt", "thrombocytes"],
+    "glucose": ["blood sugar", "sugar", "blood glucose", "fasting blood sugar", "fasting glucose", "fbs"],
+    "hba1c": ["a1c", "glycated hemoglobin", "glycosylated hemoglobin", "hemoglobin a1c"],
+    "cholesterol": ["total cholesterol", "serum cholesterol"],
+    "ldl": ["ldl cholesterol", "bad cholesterol"],
+    "hdl": ["hdl cholesterol", "good cholesterol"],
+    "triglycerides": ["triglyceride", "tg"],
+    "creatinine": ["serum creatinine"],
+    "urea": ["bun", "blood urea nitrogen", "blood urea"],
+    "alt": ["sgpt", "alanine aminotransferase"],
+    "ast": ["sgot", "aspartate aminotransferase"],
+    "tsh": ["thyroid stimulating hormone"],
+    "vitamin d": ["vit d", "25 oh vitamin d", "25 hydroxy vitamin d"],
+    "vitamin b12": ["b12", "vit b12", "cobalamin"],
+    "sodium": ["serum sodium"],
+    "potassium": ["serum potassium"],
+    "crp": ["c reactive protein"],
+    "esr": ["erythrocyte sedimentation rate", "sed rate"],
+}
+
+# Questions asking for advice or interpretation go to the LLM.
+_OPEN_ENDED = re.compile(
+    r"\b(why|should|explain|mean|means|meaning|cause|causes|caused|treat|treatment|improve|reduce|lower|"
+    r"increase|raise|diet|eat|food|exercise|recommend|recommendation|advice|worry|worried|dangerous|"
+    r"risk|risks|symptom|symptoms|disease|condition|diagnosis|compare|trend|doctor|medicine|medication)\b"
+    r"|\bhow (can|do|should|to)\b|\bwhat (does|is a)\b"
+)
+_LIST_CUE = re.compile(r"\b(which|what|any|anything|list|show|all|every|results?|tests?|values?|levels?|markers?)\b")
+_ALL_RESULTS = re.compile(r"\b(all|every|list|show)\b.*\b(results?|tests?|values?)\b")
+_STATUS_TERMS = [
+    (re.compile(r"\b(abnormal|(not|aren t|isn t|weren t|wasn t) normal|out of range|outside (the )?range|flagged|concerning)\b"),
+     {"Critical", "Borderline"}),
+    (re.compile(r"\bcritical\b"), {"Critical"}),
+    (re.compile(r"\bborderline\b"), {"Borderline"}),
+    (re.compile(r"\bnormal\b"), {"Normal"}),
+]
+_DIRECTION_TERMS = [
+    (re.compile(r"\b(high|higher|elevated|raised|above)\b"), "high"),
+    (re.compile(r"\b(low|decreased|deficient|below)\b"), "low"),
+]
+# Applied to normalized text, where "aren't" reads "aren t".
+_NEGATION = re.compile(r"\b(not|no|none|never|without|non|\w+n t)\b")
+
+
+def normalize_name(text: str) -> str:
+    """Lowercase ``text`` and reduce it to space-separated alphanumeric words."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(text).lower()).split())
+
+
+def _contains(text: str, phrase: str) -> bool:
+    return f" {phrase} " in f" {text} "
+
+
+_GROUP_PHRASES = {canonical: [canonical] + aliases for canonical, aliases in ANALYTE_SYNONYMS.items()}
+
+
+def canonical_analyte(test_name: str) -> Optional[str]:
+    """
+    Canonical ``ANALYTE_SYNONYMS`` key for a test name, or None when no synonym
+    matches. The longest synonym found in the name decides, so "Hemoglobin A1c"
+    is HbA1c, not hemoglobin.
+    """
+    name = normalize_name(test_name)
+    best, best_length = None, 0
+    for canonical, phrases in _GROUP_PHRASES.items():
+        for phrase in phrases:
+            if len(phrase) > best_length and (name == phrase or _contains(name, phrase)):
+                best, best_length = canonical, len(phrase)
+    return best
+
+
+class ResultIndex:
+    """
+    Analyzed test rows indexed by name and synonyms, for answering factual
+    questions without retrieval or an LLM call.
+
+    Rows are table rows (``test_name``, ``value``, ``unit``, ``normal_range``,
+    ``status``), optionally with a ``source`` file name.
+    """
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = [row for row in rows if row.get("test_name")]
+        self._phrases: Dict[str, Set[int]] = {}
+        for i, row in enumerate(self.rows):
+            self._phrases.setdefault(normalize_name(row["test_name"]), set()).add(i)
+            for phrase in _GROUP_PHRASES.get(canonical_analyte(row["test_name"]), []):
+                self._phrases.setdefault(phrase, set()).add(i)
+        self._ordered_phrases = sorted(self._phrases, key=len, reverse=True)
+
+    def lookup(self, question: str) -> List[Dict]:
+        """Rows whose name or synonym appears in ``question``, longest names matched first."""
+        text = f" {normalize_name(question)} "
+        found: List[int] = []
+        for phrase in self._ordered_phrases:
+            needle = f" {phrase} "
+            if needle in text:
+                text = text.replace(needle, " | ")
+                found.extend(i for i in sorted(self._phrases[phrase]) if i not in found)
+        return [self.rows[i] for i in found]
+
+    def by_status(self, statuses: Set[str]) -> List[Dict]:
+        return [row for row in self.rows if row.get("status") in statuses]
+
+    def by_direction(self, direction: str) -> List[Dict]:
+        """Rows whose numeric value lies above (``"high"``) or below (``"low"``) their reference range."""
+        matches = []
+        for row in self.rows:
+            value, _ = parse_value(row.get("value"))
+            low, high, _, _, _ = parse_range(row.get("normal_range"))
+            if np.isnan(value):
+                continue
+            if (direction == "high" and value > high) or (direction == "low" and value < low):
+                matches.append(row)
+        return matches
+
+
+def format_row(row: Dict, with_source: bool = False) -> str:
+    value = " ".join(str(part) for part in (row.get("value"), row.get("unit")) if part not in (None, "", "Unknown"))
+    line = f"- **{row['test_name']}**: {value or 'no value reported'}"
+    if row.get("normal_range") not in (None, "", "Unknown"):
+        line += f" (normal range {row['normal_range']})"
+    if row.get("status") not in (None, ""):
+        line += f" — **{row['status']}**"
+    if with_source and row.get("source"):
+        line += f" _({row['source']})_"
+    return line
+
+
+def _format_rows(header: str, rows: List[Dict], with_source: bool) -> str:
+    return "\n".join([header] + [format_row(row, with_source) for row in rows])
+
+
+def _negated_filter(text: str) -> bool:
+    """Whether a negation precedes a status or direction term ("which results are not critical?")."""
+    # "not normal" is a status term of its own (abnormal), not a negated one.
+    text = _STATUS_TERMS[0][0].sub(" abnormal ", text)
+    negation = _NEGATION.search(text)
+    if negation is None:
+        return False
+    return any(match.start() > negation.start() for pattern, _ in _STATUS_TERMS + _DIRECTION_TERMS
+               for match in pattern.finditer(text))
+
+
+def route_question(question: str, index: ResultIndex) -> Optional[str]:
+    """
+    Answer a factual question about the analyzed results directly from ``index``.
+
+    Handles lookups of named tests ("what was my hemoglobin?"), status filters
+    ("which results are critical?"), high/low filters and "show all results".
+    Returns None for anything open-ended, which should go to retrieval + LLM,
+    and for negated filters ("which results are not critical?").
+    """
+    text = normalize_name(question)
+    if not index.rows or not text or _OPEN_ENDED.search(text):
+        return None
+    with_source = len({row.get("source") for row in index.rows}) > 1
+
+    matched = index.lookup(question)
+    if matched:
+        return _format_rows("Here is what your analyzed report shows:", matched, with_source)
+
+    if not _LIST_CUE.search(text) or _negated_filter(text):
+        return None
+    for pattern, statuses in _STATUS_TERMS:
+        if pattern.search(text):
+            label = " or ".join(sorted(statuses))
+            rows = index.by_status(statuses)
+            if not rows:
+                return f"None of your analyzed results are marked {label}."
+            return _format_rows(f"These results are marked {label}:", rows, with_source)
+    for pattern, direction in _DIRECTION_TERMS:
+        if pattern.search(text):
+            rows = index.by_direction(direction)
+            if not rows:
+                return f"None of your results with a numeric reference range are {direction}er than the range."
+            return _format_rows(f"These results are {direction}er than their reference range:", rows, with_source)
+    if _ALL_RESULTS.search(text):
+        return _format_rows("These are all the results from your analyzed report:", index.rows, with_source)
+    return None
@@ -0,0 +1,139 @@
+import re
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from src.config import BORDERLINE_MARGIN, CRITICAL_MARGIN
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = r"[-+]?(?:\d{1,3}(?:,\d{3})+|\d+)?(?:\.\d+)?"
+_VALUE_RE = re.compile(rf"^\s*({_NUMBER})\s*(.*?)\s*$")
+_BETWEEN_RE = re.compile(rf"^\s*({_NUMBER})\s*(?:-|–|—|to)\s*({_NUMBER})\s*(.*?)\s*$", re.IGNORECASE)
+_UPPER_RE = re.compile(rf"^\s*(<=|≤|=<|<|up\s+to|less\s+than|below)\s*({_NUMBER})\s*(.*?)\s*$", re.IGNORECASE)
+_LOWER_RE = re.compile(rf"^\s*(>=|≥|=>|>|more\s+than|greater\s+than|above)\s*({_NUMBER})\s*(.*?)\s*$", re.IGNORECASE)
+
+_VALUE_KEYS = {"value", "result", "resultvalue", "observedvalue", "observed"}
+_RANGE_KEYS = {"normalrange", "referencerange", "refrange", "range", "referenceinterval",
+               "biologicalreferenceinterval", "normalvalues", "reference"}
+_UNIT_KEYS = {"unit", "units", "uom"}
+
+
+def _normalize_key(key: str) -> str:
+    return re.sub(r"[^a-z]", "", str(key).lower())
+
+
+def _find_field(row: Dict, candidates: set) -> Optional[str]:
+    for key, value in row.items():
+        if _normalize_key(key) in candidates and value not in (None, ""):
+            return str(value)
+    return None
+
+
+def _to_float(number: str) -> float:
+    if not number or number in ("+", "-", "."):
+        return np.nan
+    return float(number.replace(",", ""))
+
+
+def _normalize_unit(unit: Optional[str]) -> str:
+    if not unit:
+        return ""
+    return unit.lower().replace("µ", "u").replace("μ", "u").replace(" ", "").strip("()[]")
+
+
+def parse_value(raw: Optional[str]) -> Tuple[float, str]:
+    """Parse ``'13.5 g/dL'`` into ``(13.5, 'g/dL')``; non-numeric or qualified values give NaN."""
+    if raw is None:
+        return np.nan, ""
+    match = _VALUE_RE.match(str(raw))
+    if not match:
+        return np.nan, ""
+    return _to_float(match.group(1)), match.group(2)
+
+
+def parse_range(raw: Optional[str]) -> Tuple[float, float, bool, bool, str]:
+    """
+    Parse a reference range into ``(low, high, low_strict, high_strict, unit)``.
+
+    Supports ``70-110``, ``70 to 110 mg/dL``, ``<5.7``, ``<= 200`` and ``>= 40``.
+    Open ends are +/-inf; unparseable ranges give NaN bounds.
+    """
+    if raw is None:
+        return np.nan, np.nan, False, False, ""
+    text = str(raw)
+    match = _BETWEEN_RE.match(text)
+    if match:
+        return _to_float(match.group(1)), _to_float(match.group(2)), False, False, match.group(3)
+    match = _UPPER_RE.match(text)
+    if match:
+        strict = match.group(1).strip().lower() in ("<", "less than", "below")
+        return -np.inf, _to_float(match.group(2)), False, strict, match.group(3)
+    match = _LOWER_RE.match(text)
+    if match:
+        strict = match.group(1).strip().lower() in (">", "more than", "greater than", "above")
+        return _to_float(match.group(2)), np.inf, strict, False, match.group(3)
+    return np.nan, np.nan, False, False, ""
+
+
+def categorize_locally(results: List[Dict], borderline_margin: float = BORDERLINE_MARGIN,
+                       critical_margin: float = CRITICAL_MARGIN) -> Tuple[List[Dict], List[int]]:
+    """
+    Assign 'Normal', 'Borderline' or 'Critical' to rows whose value and reference range parse.
+
+    Deviations are measured relative to the violated limit. A value outside the
+    range by up to ``critical_margin`` is Borderline and beyond it Critical; a
+    value inside the range but within ``borderline_margin`` of a limit is also
+    Borderline. Returns the updated rows and the indices of test rows that
+    could not be decided locally (missing or unrecognized value field, missing
+    range, qualitative value, unit mismatch). Test rows are those with a
+    ``test_name`` or ``Test`` key, as in ``split_results``; other rows (patient
+    metadata) are left untouched.
+    """
+    categorized = [dict(row) for row in results]
+    n = len(results)
+    values = np.full(n, np.nan)
+    lows = np.full(n, np.nan)
+    highs = np.full(n, np.nan)
+    low_strict = np.zeros(n, dtype=bool)
+    high_strict = np.zeros(n, dtype=bool)
+    is_test = np.zeros(n, dtype=bool)
+    units_ok = np.ones(n, dtype=bool)
+
+    for i, row in enumerate(results):
+        if not isinstance(row, dict):
+            continue
+        if "test_name" not in row and "Test" not in row:
+            continue
+        is_test[i] = True
+        values[i], value_unit = parse_value(_find_field(row, _VALUE_KEYS))
+        lows[i], highs[i], low_strict[i], high_strict[i], range_unit = parse_range(_find_field(row, _RANGE_KEYS))
+        units = {_normalize_unit(u) for u in (_find_field(row, _UNIT_KEYS), value_unit, range_unit)} - {""}
+        units_ok[i] = len(units) <= 1
+
+    resolved = is_test & units_ok & ~np.isnan(values) & ~np.isnan(lows) & ~np.isnan(highs)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        below = (values < lows) | (low_strict & (values == lows))
+        above = (values > highs) | (high_strict & (values == highs))
+        width = np.where(np.isfinite(lows) & np.isfinite(highs), highs - lows, np.nan)
+        low_scale = np.where(lows != 0, np.abs(lows), width)
+        high_scale = np.where(highs != 0, np.abs(highs), width)
+        low_scale = np.where(np.isfinite(low_scale) & (low_scale > 0), low_scale, 1.0)
+        high_scale = np.where(np.isfinite(high_scale) & (high_scale > 0), high_scale, 1.0)
+
+        deviation = np.where(below, (lows - values) / low_scale, np.where(above, (values - highs) / high_scale, 0.0))
+        near_limit = ((values - lows) / low_scale <= borderline_margin) | ((highs - values) / high_scale <= borderline_margin)
+
+    outside = below | above
+    statuses = np.where(
+        outside,
+        np.where(deviation > critical_margin, "Critical", "Borderline"),
+        np.where((borderline_margin > 0) & near_limit, "Borderline", "Normal")
+    )
+
+    for i in np.flatnonzero(resolved):
+        categorized[i]["status"] = str(statuses[i])
+
+    unresolved = [int(i) for i in np.flatnonzero(is_test & ~resolved)]
+    logger.info(f"Locally categorized {int(resolved.sum())} rows, {len(unresolved)} unresolved")
+    return categorized, unresolved
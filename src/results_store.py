@@ -0,0 +1,258 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from src.config import RESULTS_DB_PATH
+from src.query_router import canonical_analyte, normalize_name
+from src.reference_ranges import parse_value
+
+logger = logging.getLogger(__name__)
+
+_PATIENT_KEYS = {"patientname", "patient", "name", "patientsname"}
+_PATIENT_ID_KEYS = {"patientid", "mrn", "mrno", "mrnumber", "medicalrecordnumber", "medicalrecordno", "uhid", "uhidno",
+                    "patientno", "patientnumber", "regno", "registrationno", "registrationnumber", "hospitalno",
+                    "hospitalnumber", "crno"}
+_BIRTH_DATE_KEYS = {"dob", "dateofbirth", "birthdate"}
+_DATE_KEYS = {"date", "reportdate", "collectiondate", "collectedon", "sampledate", "sampledon", "reportedon",
+              "testdate", "dateofreport", "dateofcollection", "registeredon"}
+_DATE_FORMATS = ["%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%m/%d/%Y", "%Y/%m/%d", "%d.%m.%Y", "%d %b %Y", "%d %B %Y",
+                 "%b %d %Y", "%B %d %Y", "%d-%b-%Y", "%d-%B-%Y", "%d/%m/%y", "%d-%m-%y"]
+
+# Bumped when the tables change; older stores are rebuilt (reports are re-stored when analyzed again).
+_SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_id TEXT PRIMARY KEY,
+    patient TEXT NOT NULL,
+    patient_name TEXT,
+    source TEXT,
+    report_date TEXT,
+    stored_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    report_id TEXT NOT NULL REFERENCES reports(report_id) ON DELETE CASCADE,
+    patient TEXT NOT NULL,
+    analyte TEXT NOT NULL,
+    test_name TEXT NOT NULL,
+    value REAL,
+    value_text TEXT,
+    unit TEXT,
+    normal_range TEXT,
+    status TEXT,
+    report_date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_patient_analyte_date ON results(patient, analyte, report_date);
+CREATE INDEX IF NOT EXISTS idx_results_report ON results(report_id);
+"""
+
+_RESULT_COLUMNS = "r.report_id, r.test_name, r.analyte, r.value, r.value_text, r.unit, r.normal_range, r.status, " \
+                  "r.report_date, p.source"
+
+
+def _normalize_key(key: str) -> str:
+    return re.sub(r"[^a-z]", "", str(key).lower())
+
+
+def _metadata_field(metadata: List[Dict], keys: set) -> Optional[str]:
+    for item in metadata:
+        for key, value in item.items():
+            if _normalize_key(key) in keys and value not in (None, ""):
+                return str(value).strip()
+    return None
+
+
+def parse_report_date(raw: Optional[str]) -> Optional[str]:
+    """ISO date (YYYY-MM-DD) for a date as printed on a report, or None when it cannot be read."""
+    if not raw:
+        return None
+    text = re.sub(r"\s+", " ", re.sub(r"[,]|(?<=\d)(st|nd|rd|th)\b", "", str(raw))).strip()
+    # Drop a trailing time of day ("12/03/2024 10:45 AM").
+    text = re.sub(r"\s+\d{1,2}:\d{2}(:\d{2})?(\s*[AaPp][Mm])?$", "", text)
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def patient_key(patient_id: Optional[str] = None, name: Optional[str] = None,
+                birth_date: Optional[str] = None) -> Optional[str]:
+    """
+    Identifier used to group reports of the same patient: the patient ID or MRN
+    when the report prints one, else the name together with the date of birth.
+    None when the report does not identify its patient; a name alone is not
+    enough, as different patients share names.
+    """
+    normalized_id = re.sub(r"[^a-z0-9]", "", str(patient_id or "").lower())
+    if normalized_id:
+        return f"id:{normalized_id}"
+    if name and normalize_name(name) and birth_date:
+        return f"name:{normalize_name(name)}|{parse_report_date(birth_date) or normalize_name(birth_date)}"
+    return None
+
+
+def analyte_key(test_name: str) -> str:
+    """Identifier used to match one analyte across reports, e.g. "Hb" and "Haemoglobin" are both "hemoglobin"."""
+    return canonical_analyte(test_name) or normalize_name(test_name)
+
+
+class ResultsStore:
+    """
+    SQLite store of analyzed report rows for longitudinal queries.
+
+    Each report is stored once under its file hash with the patient and report
+    date read from its metadata (see ``patient_key``; a report that does not
+    identify its patient forms a history of its own); its rows carry the analyte, numeric value,
+    unit, reference range and status. Rows are indexed on (patient, analyte,
+    date), so trends and latest values are answered without re-analysis.
+    """
+
+    def __init__(self, path: str = RESULTS_DB_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            if self.path != ":memory:" and os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA foreign_keys = ON")
+            connection.execute("PRAGMA journal_mode = WAL")
+            if connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'reports'").fetchone():
+                    logger.warning(f"Rebuilding results store {self.path} for schema version {_SCHEMA_VERSION}")
+                    connection.executescript("DROP TABLE IF EXISTS results; DROP TABLE IF EXISTS reports;")
+                connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_report(self, report_id: str, categorized: List[Dict], table_rows: Optional[List[Dict]] = None,
+                    source: Optional[str] = None, patient: Optional[str] = None, replace: bool = False) -> int:
+        """
+        Store the rows of one analyzed report and return how many were stored.
+
+        ``categorized`` supplies the metadata (patient ID, name, date of birth,
+        report date) and, when ``table_rows`` is not given, the test rows;
+        ``patient`` overrides the patient ID read from the metadata. A report already stored
+        under ``report_id`` is left as is (0 is returned) unless ``replace``.
+        Reports without a readable date are stored with no date and sort after
+        dated ones; reports that do not identify their patient are stored
+        under ``report:<report_id>`` and never pooled with other reports. A
+        report without test rows is not stored.
+        """
+        metadata = [row for row in categorized if "test_name" not in row]
+        tests = table_rows if table_rows is not None else [row for row in categorized if "test_name" in row]
+        patient_name = _metadata_field(metadata, _PATIENT_KEYS)
+        report_date = parse_report_date(_metadata_field(metadata, _DATE_KEYS))
+        patient_id = patient_key(patient or _metadata_field(metadata, _PATIENT_ID_KEYS), patient_name,
+                                 _metadata_field(metadata, _BIRTH_DATE_KEYS)) or f"report:{report_id}"
+
+        records = []
+        for row in tests:
+            name = str(row.get("test_name") or "").strip()
+            if not name:
+                continue
+            value, value_unit = parse_value(row.get("value"))
+            records.append((
+                report_id, patient_id, analyte_key(name), name, None if np.isnan(value) else value,
+                None if row.get("value") is None else str(row.get("value")), row.get("unit") or value_unit or None,
+                row.get("normal_range"), row.get("status"), report_date,
+            ))
+        if not records:
+            # Nothing to trend; storing the empty report would block a later save of its rows.
+            logger.info(f"No test rows to store for {report_id[:12]}")
+            return 0
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                if connection.execute("SELECT 1 FROM reports WHERE report_id = ?", (report_id,)).fetchone():
+                    if not replace:
+                        logger.info(f"Results for {report_id[:12]} already stored")
+                        return 0
+                    connection.execute("DELETE FROM reports WHERE report_id = ?", (report_id,))
+                connection.execute(
+                    "INSERT INTO reports (report_id, patient, patient_name, source, report_date, stored_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (report_id, patient_id, patient_name, source, report_date, time.time()),
+                )
+                connection.executemany(
+                    "INSERT INTO results (report_id, patient, analyte, test_name, value, value_text, unit, "
+                    "normal_range, status, report_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    records,
+                )
+        logger.info(f"Stored {len(records)} results for {report_id[:12]} ({patient_id[:40]}, {report_date})")
+        return len(records)
+
+    def trend(self, patient: str, analyte: str, start: Optional[str] = None,
+              end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Values of one analyte for one patient in date order, optionally limited
+        to [start, end] (ISO dates). Undated reports follow in the order stored
+        and are left out when a range is given.
+        """
+        sql = (f"SELECT {_RESULT_COLUMNS} FROM results r JOIN reports p ON p.report_id = r.report_id "
+               "WHERE r.patient = ? AND r.analyte = ?")
+        params = [patient, analyte_key(analyte)]
+        if start:
+            sql += " AND r.report_date >= ?"
+            params.append(start)
+        if end:
+            sql += " AND r.report_date <= ?"
+            params.append(end)
+        return self._query(sql + " ORDER BY r.report_date IS NULL, r.report_date, p.stored_at", tuple(params))
+
+    def latest_values(self, patient: str) -> List[Dict[str, Any]]:
+        """The most recent dated result of every analyte stored for ``patient`` (undated only when none is dated), ordered by analyte."""
+        return self._query(
+            f"SELECT {_RESULT_COLUMNS} FROM ("
+            "  SELECT *, ROW_NUMBER() OVER (PARTITION BY analyte ORDER BY report_date DESC, rowid DESC) AS position"
+            "  FROM results WHERE patient = ?"
+            ") r JOIN reports p ON p.report_id = r.report_id WHERE r.position = 1 ORDER BY r.analyte",
+            (patient,),
+        )
+
+    def reports(self, patient: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Stored reports, newest first, optionally for one patient."""
+        sql = "SELECT report_id, patient, patient_name, source, report_date FROM reports"
+        if patient is None:
+            return self._query(sql + " ORDER BY report_date DESC, stored_at DESC")
+        return self._query(sql + " WHERE patient = ? ORDER BY report_date DESC, stored_at DESC", (patient,))
+
+    def patients(self) -> List[Dict[str, Any]]:
+        """Stored patient keys (as taken by ``trend``, ``latest_values`` and ``reports``) with a display name and report count."""
+        return self._query(
+            "SELECT patient, MAX(patient_name) AS patient_name, MAX(source) AS source, COUNT(*) AS reports, "
+            "MAX(report_date) AS last_report FROM reports GROUP BY patient ORDER BY patient"
+        )
+
+    def delete_report(self, report_id: str) -> None:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM reports WHERE report_id = ?", (report_id,))
+
+    def stats(self) -> Dict[str, int]:
+        row = self._query(
+            "SELECT (SELECT COUNT(*) FROM reports) AS reports, (SELECT COUNT(DISTINCT patient) FROM reports) AS patients, "
+            "(SELECT COUNT(*) FROM results) AS results"
+        )[0]
+        return {key: int(value) for key, value in row.items()}
+
+
+results_store = ResultsStore()
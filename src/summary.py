@@ -1,21 +1,39 @@
 import logging
 from langchain_core.messages import SystemMessage, HumanMessage
-from typing import List, Dict
+from typing import AsyncIterator, Iterator, List, Dict
 from src.config import llm, GROQ_API_KEY
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-os.makedirs(os.path.join("logs"), exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join("logs", "app.log")),
-        logging.StreamHandler()
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSION = "1"
+
+SUMMARY_ERROR = "Unable to generate summary due to an error."
+
+def _build_summary_messages(explanations: str) -> list:
+    prompt = f"""
+    You are a compassionate and professional medical assistant.
+
+    You will receive a set of detailed medical explanations (already written in patient-friendly language).
+    Your task is to generate the following — using **bullet points** only:
+
+    - 🔍 **Summary**: 3–5 concise points highlighting what was found in the medical report.
+    - ⚠️ **Risks/Conditions**: List potential health risks or conditions with likelihood (High, Possible, Low), based on the explanations.
+    - ✅ **Actions/Recommendations**: Provide 2–5 very specific next steps, lifestyle tips, or suggestions (e.g., "Consult a cardiologist", "Reduce sugar intake", "Schedule follow-up in 1 month").
+
+    Do NOT repeat the full explanations.
+    Do NOT return any JSON or formatting instructions — just clean, readable bullet points grouped into the 3 sections above.
+
+    Medical Explanations:
+    {explanations}
+    """
+
+    return [
+        SystemMessage(content="You are a compassionate and professional medical assistant."),
+        HumanMessage(content=prompt)
     ]
-)
 
 def generate_summary_bullet_points(explanations: str) -> str:
     """
@@ -26,35 +44,41 @@ def generate_summary_bullet_points(explanations: str) -> str:
 
     All returned in plain text bullet points.
     """
-    logging.info("Generating summary bullet points from explanations")
+    logger.info("Generating summary bullet points from explanations")
 
     try:
-        prompt = f"""
-        You are a compassionate and professional medical assistant.
-
-        You will receive a set of detailed medical explanations (already written in patient-friendly language).
-        Your task is to generate the following — using **bullet points** only:
-
-        - 🔍 **Summary**: 3–5 concise points highlighting what was found in the medical report.
-        - ⚠️ **Risks/Conditions**: List potential health risks or conditions with likelihood (High, Possible, Low), based on the explanations.
-        - ✅ **Actions/Recommendations**: Provide 2–5 very specific next steps, lifestyle tips, or suggestions (e.g., "Consult a cardiologist", "Reduce sugar intake", "Schedule follow-up in 1 month").
-
-        Do NOT repeat the full explanations.
-        Do NOT return any JSON or formatting instructions — just clean, readable bullet points grouped into the 3 sections above.
+        response = llm.invoke(_build_summary_messages(explanations))
+        return response.content.strip()
 
-        Medical Explanations:
-        {explanations}
-        """
+    except Exception as e:
+        logger.error(f"❌ Error generating bullet summary: {str(e)}")
+        return SUMMARY_ERROR
 
-        messages = [
-            SystemMessage(content="You are a compassionate and professional medical assistant."),
-            HumanMessage(content=prompt)
-        ]
+async def agenerate_summary_bullet_points(explanations: str) -> str:
+    """Async variant of generate_summary_bullet_points using llm.ainvoke."""
+    logger.info("Generating summary bullet points from explanations (async)")
 
-        response = llm.invoke(messages)
+    try:
+        response = await llm.ainvoke(_build_summary_messages(explanations))
         return response.content.strip()
 
     except Exception as e:
-        logging.error(f"❌ Error generating bullet summary: {str(e)}")
-        return "Unable to generate summary due to an error."
+        logger.error(f"❌ Error generating bullet summary: {str(e)}")
+        return SUMMARY_ERROR
+
+def stream_summary_bullet_points(explanations: str) -> Iterator[str]:
+    """
+    Streaming variant of generate_summary_bullet_points: yields the bullet
+    points as the model generates them. LLM errors propagate to the caller.
+    """
+    logger.info("Streaming summary bullet points from explanations")
+    for chunk in llm.stream(_build_summary_messages(explanations)):
+        if chunk.content:
+            yield chunk.content
 
+async def astream_summary_bullet_points(explanations: str) -> AsyncIterator[str]:
+    """Async variant of stream_summary_bullet_points using llm.astream."""
+    logger.info("Streaming summary bullet points from explanations (async)")
+    async for chunk in llm.astream(_build_summary_messages(explanations)):
+        if chunk.content:
+            yield chunk.content
@@ -1,22 +1,68 @@
 import logging
-import os
 import json
 from dotenv import load_dotenv
 from langchain_core.messages import SystemMessage, HumanMessage
 from src.config import llm, GROQ_API_KEY
+from src.prompt_format import ROW_ID, encode_rows, decode_rows, index_by_row_id
 from typing import List, Dict
 
 load_dotenv()
 
-os.makedirs(os.path.join("logs"), exist_ok=True) 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(os.path.join("logs", "app.log")),
-        logging.StreamHandler()
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSION = "2"
+
+TABLE_COLUMNS = ["test_name", "value", "unit", "normal_range", "status"]
+
+def _build_table_messages(results: List[Dict]) -> list:
+    input_data = encode_rows(results)
+    prompt = f"""
+        You are a medical data assistant.
+
+        Given the following mixed medical report entries (some may be test results, others may be metadata), extract only **test result entries** and format each one as a row with the following columns, in this order:
+
+        - id (copied from the input entry)
+        - test_name
+        - value
+        - unit
+        - normal_range
+        - status
+
+        **Instructions:**
+        - Ignore non-test metadata (like name, age, date).
+        - Map fields (e.g., 'test' → 'test_name', etc.) as needed.
+        - Use 'Unknown' for missing fields.
+        - Use '' (empty string) for inapplicable fields.
+        - The input is a JSON object: "columns" lists the field names once and each entry of "rows" holds one entry's values in that order (null means the field is absent).
+        - Return **only** a compact JSON array of rows, e.g. [["r1","Glucose","121","mg/dL","70-110","Critical"]]. No text, no markdown, no code formatting.
+
+        Input:
+        {input_data}
+    """
+
+    return [
+        SystemMessage(content="You are a medical data assistant."),
+        HumanMessage(content=prompt)
     ]
-)
+
+def _parse_table(content: str, count: int) -> List[Dict]:
+    try:
+        parsed = decode_rows(json.loads(content.strip()), [ROW_ID] + TABLE_COLUMNS)
+        if parsed is not None:
+            if parsed and all(ROW_ID in row for row in parsed):
+                # Order rows as in the report and drop any with an ID that was never sent.
+                indexed = index_by_row_id(parsed, count)
+                parsed = [indexed[i] for i in sorted(indexed)]
+            else:
+                parsed = [{key: value for key, value in row.items() if key != ROW_ID} for row in parsed]
+            logger.info(f"✅ Successfully formatted {len(parsed)} rows for table.")
+            return parsed
+        else:
+            logger.warning("⚠️ LLM response was not a list of table rows.")
+            return []
+    except json.JSONDecodeError as e:
+        logger.error(f"❌ JSON parsing failed for LLM response: {str(e)}")
+        return []
 
 def format_results_for_table(results: List[Dict]) -> List[Dict]:
     """
@@ -29,52 +75,22 @@ def format_results_for_table(results: List[Dict]) -> List[Dict]:
     - normal_range
     - status
     """
-    logging.info("🔁 Formatting results for table using LLM")
+    logger.info("🔁 Formatting results for table using LLM")
 
     try:
-        input_data = json.dumps(results, indent=2)
-        prompt = f"""
-            You are a medical data assistant.
-
-            Given the following list of mixed medical report entries (some may be test results, others may be metadata), extract only **test result entries** and format them into dictionaries with the following columns:
-
-            - test_name
-            - value
-            - unit
-            - normal_range
-            - status
-
-            **Instructions:**
-            - Ignore non-test metadata (like name, age, date).
-            - Map fields (e.g., 'test' → 'test_name', etc.) as needed.
-            - Use 'Unknown' for missing fields.
-            - Use '' (empty string) for inapplicable fields.
-            - Return **only** a JSON array of test dictionaries. No text, no markdown, no code formatting.
-
-            Input:
-            {input_data}
-        """
-
-        messages = [
-            SystemMessage(content="You are a medical data assistant."),
-            HumanMessage(content=prompt)
-        ]
-
-        response = llm.invoke(messages)
-        raw = response.content.strip()
-
-        try:
-            parsed = json.loads(raw)
-            if isinstance(parsed, list) and all(isinstance(row, dict) for row in parsed):
-                logging.info(f"✅ Successfully formatted {len(parsed)} rows for table.")
-                return parsed
-            else:
-                logging.warning("⚠️ LLM response was not a list of dictionaries.")
-                return []
-        except json.JSONDecodeError as e:
-            logging.error(f"❌ JSON parsing failed for LLM response: {str(e)}")
-            return []
+        response = llm.invoke(_build_table_messages(results))
+        return _parse_table(response.content, len(results))
+    except Exception as e:
+        logger.exception("❌ Unexpected error during table formatting")
+        return []
 
+async def aformat_results_for_table(results: List[Dict]) -> List[Dict]:
+    """Async variant of format_results_for_table using llm.ainvoke."""
+    logger.info("🔁 Formatting results for table using LLM (async)")
+
+    try:
+        response = await llm.ainvoke(_build_table_messages(results))
+        return _parse_table(response.content, len(results))
     except Exception as e:
-        logging.exception("❌ Unexpected error during table formatting")
+        logger.exception("❌ Unexpected error during table formatting")
         return []
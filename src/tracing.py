@@ -0,0 +1,337 @@
+import atexit
+import bisect
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Read directly from the environment: PDF/OCR worker processes import this
+# module through src.preprocess and must not load src.config.
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+NAMESPACE = "medreport"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RESERVOIR_SIZE = 500
+
+HELP = {
+    "span_duration_seconds": "Wall time of traced operations.",
+    "span_errors_total": "Traced operations that raised.",
+    "llm_tokens_total": "LLM tokens by pipeline stage and direction.",
+    "llm_prompt_bytes_total": "UTF-8 bytes of prompts sent to the LLM.",
+    "llm_queue_wait_seconds": "Time LLM calls waited in the scheduler queue.",
+    "cache_requests_total": "Pipeline cache lookups by stage and result.",
+    "retrieval_chunks_total": "Chunks indexed or returned by retrieval operations.",
+    "retrieval_faiss_seconds": "Vector search time excluding query embedding.",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _quote(value: Any) -> str:
+    return '"%s"' % (f"{value:g}" if isinstance(value, float) else value)
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """
+    In-process counters, histograms and callback gauges, rendered in the
+    Prometheus text exposition format. Histograms also keep a bounded sample
+    reservoir so the app can show percentiles without a Prometheus server.
+    """
+
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Dict[str, Any]]] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], List[Tuple[Dict[str, str], float]]]]] = {}
+        self._recent: deque = deque(maxlen=200)
+        self._last_write = 0.0
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+    def inc(self, metric: str, value: float = 1.0, **labels) -> None:
+        with self._lock:
+            series = self._counters.setdefault(metric, {})
+            key = self._labels(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, metric: str, value: float, **labels) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(metric, {})
+            key = self._labels(labels)
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "sum": 0.0,
+                                      "samples": deque(maxlen=RESERVOIR_SIZE)}
+            index = bisect.bisect_left(LATENCY_BUCKETS, value)
+            if index < len(LATENCY_BUCKETS):
+                hist["buckets"][index] += 1
+            hist["count"] += 1
+            hist["sum"] += value
+            hist["samples"].append(value)
+
+    def gauge(self, name: str, help_text: str, collect: Callable[[], List[Tuple[Dict[str, str], float]]]) -> None:
+        """Register a gauge whose ``(labels, value)`` samples are read from ``collect`` at render time."""
+        with self._lock:
+            self._gauges[name] = (help_text, collect)
+
+    def record_span(self, span: "Span") -> None:
+        labels = {"kind": span.kind, "name": span.name}
+        self.observe("span_duration_seconds", span.seconds, **labels)
+        if span.error:
+            self.inc("span_errors_total", **labels)
+        attrs = span.attrs
+        if span.kind == "llm":
+            stage = attrs.get("stage", "unknown")
+            for direction in ("input", "output"):
+                if attrs.get(f"{direction}_tokens") is not None:
+                    self.inc("llm_tokens_total", attrs[f"{direction}_tokens"], stage=stage, direction=direction)
+            if attrs.get("prompt_bytes") is not None:
+                self.inc("llm_prompt_bytes_total", attrs["prompt_bytes"], stage=stage)
+            if attrs.get("queue_wait_seconds") is not None:
+                self.observe("llm_queue_wait_seconds", attrs["queue_wait_seconds"], stage=stage)
+        if span.kind == "retrieval" and attrs.get("chunks") is not None:
+            self.inc("retrieval_chunks_total", attrs["chunks"], operation=span.name)
+        if attrs.get("faiss_seconds") is not None:
+            self.observe("retrieval_faiss_seconds", attrs["faiss_seconds"])
+        with self._lock:
+            self._recent.append(span.as_dict())
+        self._maybe_write()
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: dict(h, buckets=list(h["buckets"])) for key, h in series.items()}
+                          for name, series in self._histograms.items()}
+            gauges = dict(self._gauges)
+
+        for name, series in sorted(counters.items()):
+            full = f"{self.namespace}_{name}"
+            lines += [f"# HELP {full} {HELP.get(name, name)}", f"# TYPE {full} counter"]
+            lines += [f"{full}{_format_labels(key)} {value:g}" for key, value in sorted(series.items())]
+
+        for name, series in sorted(histograms.items()):
+            full = f"{self.namespace}_{name}"
+            lines += [f"# HELP {full} {HELP.get(name, name)}", f"# TYPE {full} histogram"]
+            for key, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, hist["buckets"]):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{_format_labels(key, 'le=%s' % _quote(bound))} {cumulative}")
+                lines.append(f"{full}_bucket{_format_labels(key, 'le=%s' % _quote('+Inf'))} {hist['count']}")
+                lines.append(f"{full}_sum{_format_labels(key)} {hist['sum']:.6f}")
+                lines.append(f"{full}_count{_format_labels(key)} {hist['count']}")
+
+        for name, (help_text, collect) in sorted(gauges.items()):
+            full = f"{self.namespace}_{name}"
+            try:
+                samples = collect()
+            except Exception as e:
+                logger.error(f"Metrics gauge {name} failed: {str(e)}")
+                continue
+            lines += [f"# HELP {full} {help_text}", f"# TYPE {full} gauge"]
+            lines += [f"{full}{_format_labels(self._labels(labels))} {value:g}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Atomically write the Prometheus text to ``path`` (textfile-collector style)."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+    def _maybe_write(self) -> None:
+        if not METRICS_FILE:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not self._last_write:
+                # Registered on first use so worker processes that import this module never write.
+                atexit.register(self.write_prometheus, METRICS_FILE)
+            if now - self._last_write < 1.0:
+                return
+            self._last_write = now
+        try:
+            self.write_prometheus(METRICS_FILE)
+        except OSError as e:
+            logger.error(f"Failed to write metrics file {METRICS_FILE}: {str(e)}")
+
+    def latency_summary(self) -> List[Dict[str, Any]]:
+        """Per traced operation: count, mean/p50/p95/max seconds and error count."""
+        with self._lock:
+            series = dict(self._histograms.get("span_duration_seconds", {}))
+            errors = dict(self._counters.get("span_errors_total", {}))
+            rows = []
+            for key, hist in series.items():
+                samples = sorted(hist["samples"])
+                labels = dict(key)
+                rows.append({
+                    "kind": labels.get("kind"),
+                    "name": labels.get("name"),
+                    "count": hist["count"],
+                    "mean_s": hist["sum"] / hist["count"],
+                    "p50_s": samples[len(samples) // 2],
+                    "p95_s": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+                    "max_s": samples[-1],
+                    "errors": int(errors.get(key, 0)),
+                })
+        return sorted(rows, key=lambda row: (row["kind"], -row["mean_s"]))
+
+    def recent_spans(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._recent.clear()
+
+
+registry = MetricsRegistry()
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """
+    Timed operation recorded into ``registry`` when it ends. Nested spans link to
+    their parent through a context variable, so the relationship survives
+    ``asyncio`` tasks and threads started with a copied context.
+    """
+
+    def __init__(self, name: str, kind: str = "internal", registry: MetricsRegistry = registry, **attrs):
+        self.name = name
+        self.kind = kind
+        self.registry = registry
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.span_id = next(_span_ids)
+        self.parent: Optional["Span"] = None
+        self.trace_id = self.span_id
+        self.started = 0.0
+        self.seconds = 0.0
+        self.error: Optional[str] = None
+        self.child_seconds: Dict[str, float] = {}
+        self._token = None
+
+    def set(self, **attrs) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        if self.parent is not None:
+            self.trace_id = self.parent.trace_id
+        self._token = _current_span.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.seconds = time.perf_counter() - self.started
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.error = exc_type.__name__
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            _current_span.set(self.parent)  # exited from a different context (generator finalized elsewhere)
+        if self.parent is not None:
+            self.parent.child_seconds[self.name] = self.parent.child_seconds.get(self.name, 0.0) + self.seconds
+        try:
+            self.registry.record_span(self)
+        except Exception as e:
+            logger.error(f"Failed to record span {self.name}: {str(e)}")
+        return False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "kind": self.kind,
+            "seconds": round(self.seconds, 6),
+            "error": self.error,
+            "attrs": dict(self.attrs),
+        }
+
+
+def span(name: str, kind: str = "internal", **attrs) -> Span:
+    """Start a span: ``with span("structured", kind="stage") as s: s.set(rows=10)``."""
+    return Span(name, kind, **attrs)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_stage() -> Optional[str]:
+    """Name of the nearest enclosing pipeline-stage span, used to attribute LLM calls."""
+    active = _current_span.get()
+    while active is not None:
+        if active.kind == "stage":
+            return active.name
+        active = active.parent
+    return None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serve ``/metrics`` on ``port`` from a daemon thread; a no-op when the port is 0 or already serving."""
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        except OSError as e:
+            logger.error(f"Could not start metrics server on port {port}: {str(e)}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on :{port}/metrics")
+        return _server
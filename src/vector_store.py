@@ -0,0 +1,127 @@
+import os
+import logging
+import shutil
+import threading
+from typing import Callable, Dict, List, Optional
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from src.config import INDEX_DIR
+from src.tracing import span
+from src.hybrid_retrieval import BM25Index
+from src.answer_cache import answer_cache
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentIndexStore:
+    """
+    Per-document FAISS indexes persisted on disk under ``<index_dir>/<doc_hash>``.
+
+    A document is split and embedded only the first time its hash is seen;
+    afterwards its index is loaded from memory or disk. Indexes for several
+    documents are combined with ``merge_from`` so no chunk is re-embedded.
+    A BM25 index over the same chunks is built and persisted alongside.
+    """
+
+    def __init__(self, embedding, index_dir: str = INDEX_DIR, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.embedding = embedding
+        self.index_dir = index_dir
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self._indexes: Dict[str, FAISS] = {}
+        self._lexical: Dict[str, BM25Index] = {}
+        self._lock = threading.Lock()
+        self._building: Dict[str, threading.Lock] = {}
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _path(self, doc_hash: str) -> str:
+        return os.path.join(self.index_dir, doc_hash)
+
+    def _load_local(self, doc_hash: str) -> FAISS:
+        # Indexes are only ever written by this class, so the pickled docstore is trusted.
+        return FAISS.load_local(self._path(doc_hash), self.embedding, allow_dangerous_deserialization=True)
+
+    def get_index(self, doc_hash: str, load_text: Callable[[], str], source: str = "") -> Optional[FAISS]:
+        """Return the index for ``doc_hash``, building and persisting it on first use."""
+        with self._lock:
+            if doc_hash in self._indexes:
+                return self._indexes[doc_hash]
+            build_lock = self._building.setdefault(doc_hash, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                if doc_hash in self._indexes:
+                    return self._indexes[doc_hash]
+
+            with span("index_document", kind="retrieval") as index_span:
+                if os.path.exists(os.path.join(self._path(doc_hash), "index.faiss")):
+                    logger.info(f"Loading persisted vector index for {doc_hash[:12]}")
+                    index = self._load_local(doc_hash)
+                    lexical = BM25Index.load(self._path(doc_hash))
+                    if lexical is None:
+                        # Indexes persisted before BM25 existed: rebuild it from the stored chunks.
+                        lexical = BM25Index([index.docstore.search(doc_id) for doc_id in index.index_to_docstore_id.values()])
+                        lexical.save(self._path(doc_hash))
+                    index_span.set(source="disk", chunks=index.index.ntotal)
+                else:
+                    text = load_text()
+                    if not text:
+                        logger.warning(f"No text to index for {source or doc_hash[:12]}")
+                        return None
+                    document = Document(page_content=text, metadata={"source": source, "doc_hash": doc_hash})
+                    splits = self.text_splitter.split_documents([document])
+                    logger.info(f"Embedding {len(splits)} chunks for {source or doc_hash[:12]}")
+                    index = FAISS.from_documents(documents=splits, embedding=self.embedding)
+                    index.save_local(self._path(doc_hash))
+                    lexical = BM25Index(splits)
+                    lexical.save(self._path(doc_hash))
+                    index_span.set(source="built", chunks=len(splits))
+
+            with self._lock:
+                self._indexes[doc_hash] = index
+                self._lexical[doc_hash] = lexical
+            return index
+
+    def combine(self, doc_hashes: List[str]) -> Optional[FAISS]:
+        """
+        Build a fresh index spanning ``doc_hashes`` from already-built per-document indexes.
+
+        The base is reloaded from disk so merging never mutates a cached index.
+        """
+        available = [h for h in doc_hashes if h in self._indexes]
+        if not available:
+            return None
+        combined = self._load_local(available[0])
+        for doc_hash in available[1:]:
+            combined.merge_from(self._indexes[doc_hash])
+        return combined
+
+    def combine_lexical(self, doc_hashes: List[str]) -> Optional[BM25Index]:
+        """BM25 index spanning the already-built documents among ``doc_hashes``."""
+        available = [self._lexical[h] for h in doc_hashes if h in self._lexical]
+        return BM25Index.merge(available) if available else None
+
+    def extend(self, combined: FAISS, doc_hash: str) -> None:
+        """Add one more already-built document index to ``combined`` in place."""
+        combined.merge_from(self._indexes[doc_hash])
+
+    def invalidate(self, doc_hash: str) -> None:
+        """Forget the in-memory and persisted index for ``doc_hash`` and the chat answers drawn from it."""
+        with self._lock:
+            self._indexes.pop(doc_hash, None)
+            self._lexical.pop(doc_hash, None)
+        shutil.rmtree(self._path(doc_hash), ignore_errors=True)
+        answer_cache.invalidate(doc_hash)
+
+
+_store: Optional[DocumentIndexStore] = None
+_store_lock = threading.Lock()
+
+
+def get_index_store(embedding_factory: Callable[[], object]) -> DocumentIndexStore:
+    """Return the process-wide index store, creating it with ``embedding_factory`` once."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentIndexStore(embedding_factory())
+        return _store
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The modules read their settings at import time; keep tests offline and out of the working tree.
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("CACHE_DIR", os.path.join(tempfile.mkdtemp(prefix="medical-cache-"), "pipeline"))
+os.environ.setdefault("INDEX_DIR", os.path.join(tempfile.mkdtemp(prefix="medical-index-"), "indexes"))
+os.environ.setdefault("RESULTS_DB_PATH", ":memory:")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from src.answer_cache import SemanticAnswerCache, question_terms
+
+DOCS = ["doc-hash"]
+VECTOR = [1.0, 0.0, 0.0]
+# Cosine ~0.995 to VECTOR: what an embedding model gives for near-identical wording.
+CLOSE = list(np.array(VECTOR) + np.array([0.0, 0.1, 0.0]))
+
+
+@pytest.fixture
+def cache():
+    cache = SemanticAnswerCache(threshold=0.95, max_entries=16, ttl_seconds=3600)
+    cache.store(DOCS, "Is my cholesterol high?", VECTOR, "Your cholesterol of 260 mg/dL is high.")
+    cache.store(DOCS, "What is my HDL?", [0.0, 1.0, 0.0], "Your HDL is 45 mg/dL.")
+    return cache
+
+
+def test_rephrased_question_is_a_hit(cache):
+    assert cache.lookup(DOCS, "is my cholesterol level high", CLOSE) == "Your cholesterol of 260 mg/dL is high."
+
+
+@pytest.mark.parametrize("question", [
+    "Is my cholesterol low?",
+    "Is my cholesterol not high?",
+    "Isn't my cholesterol high?",
+    "Is my LDL cholesterol high?",
+    "Is my cholesterol above 200?",
+])
+def test_near_miss_questions_are_not_served_the_cached_answer(cache, question):
+    assert cache.lookup(DOCS, question, CLOSE) is None
+
+
+def test_hdl_and_ldl_do_not_share_answers(cache):
+    assert cache.lookup(DOCS, "What is my LDL?", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup(DOCS, "what's my HDL", [0.0, 1.0, 0.0]) == "Your HDL is 45 mg/dL."
+
+
+def test_dissimilar_vectors_and_other_documents_miss(cache):
+    assert cache.lookup(DOCS, "Is my cholesterol high?", [0.0, 0.0, 1.0]) is None
+    assert cache.lookup(["other-doc"], "Is my cholesterol high?", VECTOR) is None
+
+
+def test_question_terms_keep_numbers_and_negations():
+    assert question_terms("Is my glucose 5.4 not high?") == {"glucose", "5.4", "not", "high"}
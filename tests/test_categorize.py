@@ -0,0 +1,22 @@
+import json
+
+from src.categorize import _parse_categorization
+from src.table_formatter import _parse_table
+
+ROWS = [{"test_name": "Glucose", "value": "121"}, {"test_name": "Hemoglobin", "value": "13.5"}]
+
+
+def test_id_pairs_are_merged_by_row_id():
+    parsed = _parse_categorization(json.dumps([["r1", "Normal"], ["r0", "Critical"]]), ROWS)
+    assert [row.get("status") for row in parsed] == ["Critical", "Normal"]
+
+
+def test_legacy_list_of_dicts_is_merged_by_position():
+    legacy = [dict(ROWS[0], status="Critical"), dict(ROWS[1], status="Normal")]
+    parsed = _parse_categorization(json.dumps(legacy), ROWS)
+    assert [row.get("status") for row in parsed] == ["Critical", "Normal"]
+
+
+def test_table_rows_never_keep_the_row_id():
+    mixed = [{"id": "r0", "test_name": "Glucose"}, {"test_name": "Hemoglobin"}]
+    assert all("id" not in row for row in _parse_table(json.dumps(mixed), 2))
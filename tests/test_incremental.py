@@ -0,0 +1,63 @@
+import asyncio
+
+import src.incremental as incremental
+from src.incremental import IncrementalPlan, ReportDiff
+from src.reference_ranges import categorize_locally
+
+OLD_TEXT = "Patient: Jane Doe\nMRN: 12345\nGlucose 121 mg/dL 70-110\nHemoglobin 13.5 g/dL 12-16"
+NEW_TEXT = "Patient: Jane Doe\nMRN: 12345\nGlucose 121 mg/dL 70-130\nHemoglobin 13.5 g/dL 12-16"
+
+
+def _rows(glucose_range):
+    return [
+        {"patient_name": "Jane Doe"},
+        {"MRN": "12345"},
+        {"test_name": "Glucose", "value": "121", "unit": "mg/dL", "normal_range": glucose_range},
+        {"test_name": "Hemoglobin", "value": "13.5", "unit": "g/dL", "normal_range": "12-16"},
+    ]
+
+
+def _previous():
+    structured = _rows("70-110")
+    categorized = structured[:2] + [dict(structured[2], status="Critical"), dict(structured[3], status="Normal")]
+    table = [{k: row.get(k, "") for k in ("test_name", "value", "unit", "normal_range", "status")}
+             for row in categorized if "test_name" in row]
+    return {"text": OLD_TEXT, "structured": structured, "categorized": categorized, "table": table,
+            "explanation": None, "summary": None}
+
+
+def test_range_correction_is_recategorized_and_reformatted(monkeypatch):
+    previous = _previous()
+    formatted = []
+
+    async def fake_format(rows):
+        formatted.extend(rows)
+        return [{k: row.get(k, "") for k in ("test_name", "value", "unit", "normal_range", "status")} for row in rows]
+
+    monkeypatch.setattr(incremental, "aformat_results_for_table", fake_format)
+    plan = IncrementalPlan(previous, ReportDiff(OLD_TEXT, NEW_TEXT))
+
+    categorized = asyncio.run(plan.acategorize(_rows("70-130")))
+    glucose = categorized[2]
+    assert glucose["normal_range"] == "70-130"
+    assert glucose["status"] == categorize_locally([_rows("70-130")[2]])[0][0]["status"] != "Critical"
+    # The unchanged row is reused as is.
+    assert categorized[3] is previous["categorized"][3]
+
+    tests = [row for row in categorized if "test_name" in row]
+    table = asyncio.run(plan.aformat_table(tests))
+    assert [row["test_name"] for row in formatted] == ["Glucose"]
+    assert table[0]["normal_range"] == "70-130"
+    assert table[0]["status"] == glucose["status"]
+    assert table[1] == previous["table"][1]
+
+
+def test_unit_correction_is_not_reused():
+    previous = _previous()
+    plan = IncrementalPlan(previous, ReportDiff(OLD_TEXT, OLD_TEXT.replace("13.5 g/dL", "13.5 g/L")))
+    revised = _rows("70-110")
+    revised[3] = dict(revised[3], unit="g/L")
+    categorized = asyncio.run(plan.acategorize(revised))
+    assert categorized[2] is previous["categorized"][2]
+    assert categorized[3] is not previous["categorized"][3]
+    assert categorized[3]["unit"] == "g/L"
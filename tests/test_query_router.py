@@ -0,0 +1,35 @@
+import pytest
+
+from src.query_router import ResultIndex, route_question
+
+ROWS = [
+    {"test_name": "Glucose", "value": "180", "unit": "mg/dL", "normal_range": "70-110", "status": "Critical"},
+    {"test_name": "Hemoglobin", "value": "13.5", "unit": "g/dL", "normal_range": "12-16", "status": "Normal"},
+    {"test_name": "Vitamin D", "value": "25", "unit": "ng/mL", "normal_range": "30-100", "status": "Borderline"},
+]
+
+
+@pytest.fixture
+def index():
+    return ResultIndex(ROWS)
+
+
+def test_status_filter(index):
+    answer = route_question("Which results are critical?", index)
+    assert "Glucose" in answer and "Hemoglobin" not in answer
+
+
+@pytest.mark.parametrize("question", ["Which results are not normal?", "Which results aren't normal?"])
+def test_not_normal_lists_abnormal_results(index, question):
+    answer = route_question(question, index)
+    assert "Glucose" in answer and "Vitamin D" in answer and "Hemoglobin" not in answer
+
+
+@pytest.mark.parametrize("question", [
+    "Which results are not critical?",
+    "Which results aren't high?",
+    "Are there any results that are not borderline?",
+    "Show results with no critical values",
+])
+def test_negated_filters_go_to_the_llm(index, question):
+    assert route_question(question, index) is None